@@ -1,12 +1,51 @@
-import requests
-from bs4 import BeautifulSoup
-import time
 import random
 import logging
+import math
+import contextvars
+import functools
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 from requests.exceptions import RequestException, HTTPError
+import coalesce
+import extraction
+import http_session
+import identifiers
+import logs
+import metrics
+import parse_pool
+import parsers
+import records
 
 logger = logging.getLogger(__name__)
 
+PAGE_SIZE = 16  # Typical number of results on a search page
+PAGE_FETCH_WORKERS = 4  # Pages fetched at once in plan_pages mode
+SEARCH_RESULT_ATTRS = {"data-component-type": "s-search-result"}
+# The only parts of a search page we read: result cards and the next link
+SEARCH_TARGETS = [
+    ("div", None, SEARCH_RESULT_ATTRS),
+    ("a", "s-pagination-next", None),
+]
+
+def price_digits(backend, node):
+    price = backend.text(node).strip()
+    return price if price.replace(',', '').replace('.', '').isdigit() else None
+
+def bought_count(backend, node):
+    bought_text = backend.text(node).strip()
+    return bought_text.split()[0] if "bought in past month" in bought_text.lower() else None
+
+SEARCH_SCHEMA = extraction.Schema("amazon_search", {
+    "title": extraction.Field([("h2", "a-size-mini")], default=None),
+    # a-color-base is only a fallback: cards with a whole price carry it too
+    "price": extraction.Field([("span", "a-price-whole"), ("span", "a-color-base")], price_digits),
+    "rating": extraction.Field([("span", "a-icon-alt")], lambda backend, node: backend.text(node).split(" ")[0]),
+    "reviews": extraction.Field([("span", "a-size-base s-underline-text")],
+                                lambda backend, node: backend.text(node).strip("() ")),
+    "bought_last_month": extraction.Field([("span", "a-size-small.social-proofing-faceout-title-text"),
+                                           ("span", "a-size-base a-color-secondary")], bought_count, adaptive=True),
+})
+
 # List of user agents to rotate
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
@@ -27,23 +66,45 @@ def get_random_headers():
         "Cache-Control": "max-age=0",
     }
 
-def search(keywords, num_products=30):
+def search(keywords, num_products=30, plan_pages=False):
+    return [product for products in search_pages(keywords, num_products, plan_pages) for product in products]
+
+def search_pages(keywords, num_products=30, plan_pages=False, start=None, on_page=None):
+    """Yield the products of each search page as soon as that page is parsed.
+
+    The next page is only fetched while fewer than num_products valid
+    products have been extracted, so fetching stops exactly when enough
+    products exist whatever the real page sizes are.
+
+    start=(url, page, found) continues an earlier run that already has
+    `found` products, fetching from `url` as page number `page`.
+    on_page(page, next_url, products) is called for every page before its
+    products are yielded; the checkpoint journal uses both.
+    """
     try:
         num_products = int(num_products)
+        found = start[2] if start is not None else 0
 
-        # Fetch data
-        all_data = fetch_amazon_data(keywords, num_products)
-        
-        # Process data
-        products = process_amazon_data(all_data, num_products)
+        if found < num_products:
+            with closing(iter_search_pages(keywords, num_products, plan_pages, start)) as pages:
+                for page, products, next_url in pages:
+                    products = products[:num_products - found]
+                    for rank, product in enumerate(products, found + 1):
+                        product.rank = rank
+                    if on_page is not None:
+                        on_page(page, next_url, products)
+                    if products:
+                        found += len(products)
+                        yield products
+                    if found >= num_products:
+                        break
 
-        if not products:
+        logger.info("Processed %s products in total", found)
+        if not found:
             error_msg = f"No products found for '{keywords}'"
             logger.error(error_msg)
             raise Exception(error_msg)
 
-        return products
-
     except ValueError as ve:
         error_msg = f"ValueError during Amazon search: {str(ve)}"
         logger.error(error_msg)
@@ -54,129 +115,217 @@ def search(keywords, num_products=30):
         logger.error(error_msg)
         raise Exception(error_msg)
 
-def fetch_amazon_data(keyword, num_products):
-    all_data = []
+def search_url(keyword, page=1):
+    keyword = identifiers.canonical_keyword(keyword)
     url = f"https://www.amazon.in/s?k={keyword.replace(' ', '+')}"
+    if page > 1:
+        url += f"&page={page}"
+    return url
+
+def iter_search_pages(keyword, num_products, plan_pages=False, start=None):
+    """Yield (page number, products, next page URL) for each search page in order.
+
+    Each page is fetched only when asked for. start=(url, page, ...) begins
+    at that page instead of the first one.
+    """
+    if start is not None:
+        url, page = start[0], start[1]
+    elif plan_pages:
+        url, page = yield from iter_planned_pages(keyword, num_products)
+    else:
+        url, page = search_url(keyword), 1
 
-    page = 1
+    while url:
+        products, url, _ = page_results(url, functools.partial(fetch_page_once, url, keyword, page))
+        yield page, products, url
+        if not url:
+            logger.info("No more pages found for '%s'", keyword)
+            break
+        logger.debug("Fetched page %s, moving to next page...", page)
+        page += 1
+
+def fetch_page_once(url, keyword, page):
+    """fetch_amazon_page, sharing the download with anyone fetching the same URL at the same time"""
+    return coalesce.do(("amazon_page", url), functools.partial(fetch_amazon_page, url, keyword, page), remember=False)
+
+def page_results(url, fetch):
+    """(products, next page URL, result ids) for a search page, fetched with fetch() and parsed once per run.
+
+    Keywords that lead to the same page URL, at the same time or later in
+    the run, share one request. Each caller gets its own copies of the
+    products, since search_pages re-ranks them in place.
+    """
+    def load():
+        return parse_pool.run(parse_results, fetch())
+
+    products, next_url, asins = coalesce.do(("amazon_search", url), load)
+    return [product.copy() for product in products], next_url, asins
+
+def parse_page(content):
+    return parsers.parse_search_page(content, SEARCH_TARGETS)
+
+def parse_results(content):
+    """Parse a raw search page into (products, next page URL, result ids).
+
+    This is the parse_pool stage: it may run in a worker process, so only
+    plain data goes in and comes out, and the tree is freed before returning.
+    Products are ranked from 1 within the page.
+    """
+    metrics.count("pages")
+    with metrics.timer("parse"):
+        soup = parse_page(content)
+    try:
+        with metrics.timer("extract"):
+            return extract_products(soup), next_page_url(soup), page_asins(soup)
+    finally:
+        parsers.get_backend().release(soup)
+
+def fetch_amazon_page(url, keyword, page):
+    """Fetch one search page and return its raw bytes.
+
+    Raises http_session.BlockedError when every attempt was denied, so a
+    search is never taken to have ended at a page the site refused.
+    """
+    # Pacing and backoff between attempts come from the per-host rate limiter
     max_retries = 3
-    retry_delay = 5
 
-    while len(all_data) * 16 < num_products:  # Assuming 16 products per page
-        for attempt in range(max_retries):
-            try:
-                headers = get_random_headers()  # Get new headers for each request
-                logger.info(f"Fetching page {page} for '{keyword}' (Attempt {attempt + 1})")
-                response = requests.get(url, headers=headers, timeout=10)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.content, 'html.parser')
-                all_data.append(soup)
-
-                next_page = soup.find("a", class_="s-pagination-next")
-                if next_page and "href" in next_page.attrs:
-                    url = "https://www.amazon.in" + next_page["href"]
-                    logger.info(f"Fetched page {page}, moving to next page...")
-                    page += 1
-                    time.sleep(random.uniform(2, 5))
-                else:
-                    logger.info(f"No more pages found for '{keyword}'")
-                    return all_data
-
-                break  # If successful, break the retry loop
-
-            except HTTPError as http_err:
-                if response.status_code == 503:
-                    logger.warning(f"503 error encountered. Attempt {attempt + 1} of {max_retries}")
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                        retry_delay *= 2  # Exponential backoff
-                    else:
-                        logger.error(f"Max retries reached for 503 error on page {page}")
-                        raise
-                else:
-                    logger.error(f"HTTP error occurred: {http_err}")
+    for attempt in range(max_retries):
+        if attempt:
+            metrics.count("retries")
+        try:
+            headers = get_random_headers()  # Get new headers for each request
+            logger.debug("Fetching page %s for '%s' (Attempt %s)", page, keyword, attempt + 1)
+            response = http_session.get(url, headers=headers, timeout=10)
+            response.raise_for_status()
+
+            if http_session.is_blocked(response):
+                logger.warning("Access denied on page %s. Attempt %s of %s", page, attempt + 1, max_retries)
+                continue
+
+            return response.content
+
+        except HTTPError as http_err:
+            if response.status_code == 503:
+                logger.warning("503 error encountered. Attempt %s of %s", attempt + 1, max_retries)
+                if attempt == max_retries - 1:
+                    logger.error("Max retries reached for 503 error on page %s", page)
                     raise
-            except RequestException as e:
-                logger.error(f"An error occurred while fetching results for '{keyword}' on page {page}: {e}")
+            else:
+                logger.error("HTTP error occurred: %s", http_err)
                 raise
+        except RequestException as e:
+            logger.error("An error occurred while fetching results for '%s' on page %s: %s", keyword, page, e)
+            raise
+
+    logger.error("Max retries reached for Access Denied on page %s", page)
+    raise http_session.BlockedError(f"Access denied for page {page} of '{keyword}'")
+
+def next_page_url(soup):
+    backend = parsers.get_backend()
+    next_page = backend.find(soup, "a", "s-pagination-next")
+    if next_page is not None and backend.get(next_page, "href") is not None:
+        return "https://www.amazon.in" + backend.get(next_page, "href")
+    return None
 
-    return all_data
+def page_asins(soup):
+    backend = parsers.get_backend()
+    return [backend.get(result, "data-asin") for result in backend.find_all(soup, "div", attrs=SEARCH_RESULT_ATTRS)]
+
+def iter_planned_pages(keyword, num_products):
+    """Yield the pages expected to hold num_products, fetched in parallel using page=N URLs.
+
+    Returns the URL and number of the page to continue from by following
+    next-page links: the one after the planned pages if more products are
+    still wanted, or the first planned page that failed or shows the site
+    ignoring the page parameter. Pages are downloaded ahead as raw bytes but
+    parsed one at a time, in order, as the caller asks for them.
+    """
+    num_pages = max(1, math.ceil(num_products / PAGE_SIZE))
+    executor = ThreadPoolExecutor(max_workers=min(num_pages, PAGE_FETCH_WORKERS))
+    try:
+        def prefetch(page):
+            page_url = search_url(keyword, page)
+            if coalesce.known(("amazon_search", page_url)):
+                return None  # the run already has this page
+            # Each fetch runs in a copy of this context so its timings count for this keyword
+            return executor.submit(contextvars.copy_context().run, fetch_page_once, page_url, keyword, page)
+
+        futures = [prefetch(page) for page in range(1, num_pages + 1)]
+        url = search_url(keyword)
+        seen = None
+        for page, future in enumerate(futures, 1):
+            page_url = search_url(keyword, page)
+            fetch = future.result if future is not None else functools.partial(fetch_page_once, page_url, keyword, page)
+            try:
+                products, next_url, asins = page_results(page_url, fetch)
+            except RequestException as e:
+                logger.warning("Planned page %s for '%s' could not be fetched (%s), "
+                               "following next-page links instead", page, keyword, e)
+                return url, page
+            if page > 1 and (not asins or asins == seen):
+                logger.warning("Planned page %s for '%s' returned no new results, "
+                               "following next-page links instead", page, keyword)
+                return url, page
+            seen = asins
+            url = next_url
+            yield page, products, url
+            if not url:
+                logger.info("No more pages found for '%s' after page %s", keyword, page)
+                return None, page + 1
+        return url, num_pages + 1
+    finally:
+        # Pages still queued when the caller stops early are never fetched
+        executor.shutdown(wait=False, cancel_futures=True)
 
 def process_amazon_data(all_data, num_products=30):
     products = []
     for soup in all_data:
-        search_results = soup.find_all("div", {"data-component-type": "s-search-result"})
-        
-        logger.info(f"Found {len(search_results)} search results on this page")
+        products += extract_products(soup, len(products) + 1, num_products - len(products))
+    logger.info("Processed %s products in total", len(products))
+    return products
+
+def extract_products(soup, first_rank=1, limit=None):
+    """Extract up to limit valid products from one search page, ranked from first_rank"""
+    backend = parsers.get_backend()
+    products = []
+    search_results = backend.find_all(soup, "div", attrs=SEARCH_RESULT_ATTRS)
 
+    logger.debug("Found %s search results on this page", len(search_results))
+
+    with SEARCH_SCHEMA.page() as page:
         for result in search_results:
-            if len(products) >= num_products:
+            if limit is not None and len(products) >= limit:
                 break
 
             try:
-                asin = result.get("data-asin")
-                logger.debug(f"Processing product with ASIN: {asin}")
-
-                title_element = result.find("h2", class_="a-size-mini")
-                title = title_element.text.strip() if title_element else "Title not found"
-                
-                price_element = result.find("span", class_="a-price-whole")
-                if not price_element:
-                    price_element = result.find("span", class_="a-color-base")
-                price = price_element.text.strip() if price_element else "N/A"
-                if not price.replace(',', '').replace('.', '').isdigit():
-                    price = "N/A"
-                
-                # Construct link using ASIN
-                link = f"https://www.amazon.in/dp/{asin}" if asin else "N/A"
-                
-                rating_element = result.find("span", class_="a-icon-alt")
-                rating = rating_element.text.split(" ")[0] if rating_element else "N/A"
-                
-                reviews_element = result.find("span", class_="a-size-base s-underline-text")
-                reviews = reviews_element.text.strip("() ") if reviews_element else "N/A"
-
-                # Get bought in past month count - check both possible classes
-                bought_count = "N/A"
-                
-                # Try the first class
-                bought_element = result.find("span", class_="a-size-small.social-proofing-faceout-title-text")
-                if not bought_element:
-                    # Try the second class if first one not found
-                    bought_element = result.find("span", class_="a-size-base a-color-secondary")
-                
-                if bought_element:
-                    bought_text = bought_element.text.strip()
-                    if "bought in past month" in bought_text.lower():
-                        bought_count = bought_text.split()[0]
+                asin = backend.get(result, "data-asin")
+                logger.debug("Processing product with ASIN: %s", asin)
+
+                fields = page.extract(result)
 
                 # Determine if the product is sponsored based on data-asin class
-                sponsored_class = result.get("class", [])
-                product_type = "Sponsored" if "AdHolder" in sponsored_class else "Organic"
-                
-                logger.debug(f"Product type determined: {product_type}")
-
-                products.append({
-                    "rank": len(products) + 1,
-                    "asin": asin,
-                    "title": title,
-                    "price": price,
-                    "link": link,
-                    "rating": rating,
-                    "reviews": reviews,
-                    "bought_last_month": bought_count,
-                    "type": product_type
-                })
-
-                logger.debug(f"Successfully processed product: {title}")
-
-            except AttributeError as ae:
-                logger.error(f"AttributeError processing product: {str(ae)}")
-            except Exception as e:
-                logger.error(f"Error processing product: {str(e)}")
+                sponsored = "AdHolder" in backend.classes(result)
+
+                logger.debug("Product sponsored: %s", sponsored)
+
+                products.append(records.Product(
+                    "amazon",
+                    product_id=asin,
+                    rank=first_rank + len(products),
+                    title=fields["title"],
+                    price=fields["price"],
+                    # Construct link using ASIN
+                    link=f"https://www.amazon.in/dp/{asin}" if asin else None,
+                    rating=fields["rating"],
+                    reviews=fields["reviews"],
+                    bought_last_month=fields["bought_last_month"],
+                    sponsored=sponsored,
+                ))
 
-    logger.info(f"Processed {len(products)} products in total")
-    return products[:num_products]
+                logger.debug("Successfully processed product: %s", fields['title'])
+
+            except Exception as e:
+                logger.error("Error processing product: %r", e)
+                logs.dump_html("amazon_search_result", backend.html, result)
 
-# Set up more detailed logging
-logging.basicConfig(level=logging.DEBUG)
\ No newline at end of file
+    return products
@@ -0,0 +1,101 @@
+"""Per-page cost of logging in the search result extract loops.
+
+    python benchmarks/bench_logging.py [--pages 200] [--modes off,debug-sync,default] [--parser lxml]
+
+Search fixture pages are parsed once, then extract_products runs over them
+with each logging setup, in a fresh process per setup (logging is
+process-wide). stderr goes to a file, standing in for the pipe main.js
+reads. Reported per page: CPU time of the extraction (all threads, so
+the queue listener's formatting counts too), its overhead over "off",
+and bytes of log written.
+
+    off          logging.disable: the floor
+    debug-sync   root logger at DEBUG, writing to stderr from the scraping
+                 thread (what every run did while two modules called
+                 basicConfig(level=DEBUG) at import)
+    info-sync    the same at INFO
+    default      logs.configure() as scraper_wrapper does it by default
+    debug-queue  logs.configure(level=DEBUG): every record, formatted and
+                 written on the listener thread
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parsers
+import amazon_scraper1
+import flipkart_scraper
+from page_fixtures import load_fixtures
+
+EXTRACTORS = {
+    "amazon_search": amazon_scraper1.extract_products,
+    "flipkart_search": flipkart_scraper.extract_products,
+}
+
+def setup(mode):
+    if mode == "off":
+        logging.disable(logging.CRITICAL)
+    elif mode in ("debug-sync", "info-sync"):
+        logging.basicConfig(level=logging.DEBUG if mode == "debug-sync" else logging.INFO)
+    else:
+        import logs
+        logs.configure(level="DEBUG" if mode == "debug-queue" else None)
+
+def run_child(mode, pages, parser):
+    parsers.set_backend(parser)
+    trees = [(kind, parsers.get_backend().parse(content))
+             for kind in EXTRACTORS for name, content in load_fixtures(kind)]
+    setup(mode)
+    count = 0
+    start = time.process_time()
+    while count < pages:
+        for kind, tree in trees:
+            EXTRACTORS[kind](tree)
+            count += 1
+    elapsed = time.process_time() - start
+    if mode not in ("off", "debug-sync", "info-sync"):
+        import logs
+        logs.shutdown()  # wait for the listener, so its writes are part of the cost
+        elapsed = time.process_time() - start
+    print(json.dumps({"pages": count, "seconds": elapsed}))
+
+def run_mode(mode, args):
+    with tempfile.TemporaryFile() as stderr:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode,
+                                 "--pages", str(args.pages), "--parser", args.parser],
+                                stdout=subprocess.PIPE, stderr=stderr, check=True).stdout
+        stderr.seek(0, os.SEEK_END)
+        logged = stderr.tell()
+    result = json.loads(output)
+    return result["seconds"] / result["pages"] * 1000, logged / result["pages"]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--modes", default="off,debug-sync,info-sync,default,debug-queue")
+    parser.add_argument("--parser", choices=sorted(parsers.BACKENDS), default=parsers.DEFAULT_BACKEND)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.pages, args.parser)
+        return
+
+    print(f"{'mode':<12} {'ms/page':>9} {'overhead':>9} {'log B/page':>11}")
+    floor = None
+    for mode in args.modes.split(","):
+        ms, logged = min(run_mode(mode, args) for _ in range(args.repeat))
+        floor = ms if mode == "off" else floor
+        overhead = f"{ms - floor:+9.3f}" if floor is not None else f"{'':>9}"
+        print(f"{mode:<12} {ms:>9.3f} {overhead} {logged:>11.0f}")
+
+if __name__ == "__main__":
+    main()
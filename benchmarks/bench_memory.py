@@ -0,0 +1,113 @@
+"""Peak RSS of a deep search, holding every page's tree versus streaming.
+
+    python benchmarks/bench_memory.py [--pages 20] [--platforms amazon,flipkart] [--parser lxml] [--full_parse]
+
+Each run happens in a fresh process so peak RSS is not shared between them.
+Pages come from page_fixtures instead of the network. "hold" is the old
+search path, which parsed every page and kept all the trees until the
+products were extracted; "stream" is search(), which keeps one tree at a time.
+"""
+import os
+import sys
+import json
+import argparse
+import logging
+import resource
+import subprocess
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_session
+import parsers
+import amazon_scraper1
+import flipkart_scraper
+from page_fixtures import amazon_search_page, flipkart_search_page
+
+PLATFORMS = {
+    "amazon": (amazon_scraper1, amazon_scraper1.fetch_amazon_page, amazon_scraper1.process_amazon_data,
+               amazon_search_page, amazon_scraper1.PAGE_SIZE),
+    "flipkart": (flipkart_scraper, flipkart_scraper.fetch_flipkart_page, flipkart_scraper.process_flipkart_data,
+                 flipkart_search_page, flipkart_scraper.PAGE_SIZE),
+}
+MODES = ["hold", "stream"]
+
+class FixtureResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+def serve_fixtures(page_builder, last_page):
+    """Answer search URLs with generated pages instead of going to the network"""
+    def get(url, **kwargs):
+        query = parse_qs(urlparse(url).query)
+        page = int(query.get("page", ["1"])[0])
+        return FixtureResponse(page_builder("phone", page, last_page=last_page).encode("utf-8"))
+    http_session.get = get
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def search_holding_trees(platform, keyword, num_pages):
+    module, fetch_page, process, _, page_size = PLATFORMS[platform]
+    trees = []
+    url, page = module.search_url(keyword), 1
+    while url and len(trees) < num_pages:
+        tree = module.parse_page(fetch_page(url, keyword, page))
+        trees.append(tree)
+        url = module.next_page_url(tree)
+        page += 1
+    return process(trees, num_pages * page_size)
+
+def run_child(platform, mode, num_pages):
+    module, _, _, page_builder, page_size = PLATFORMS[platform]
+    serve_fixtures(page_builder, num_pages)
+    # Warm up imports, parser caches and the fixture generator before the baseline
+    module.search("phone", 1)
+    baseline = peak_rss_mb()
+    if mode == "hold":
+        products = search_holding_trees(platform, "phone", num_pages)
+    else:
+        products = module.search("phone", num_pages * page_size)
+    peak = peak_rss_mb()
+    print(json.dumps({"products": len(products), "baseline_mb": baseline, "peak_mb": peak}))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--platforms", default=",".join(PLATFORMS))
+    parser.add_argument("--parser", choices=sorted(parsers.BACKENDS), default=parsers.DEFAULT_BACKEND)
+    parser.add_argument("--full_parse", action="store_true", help="Build the whole DOM of every page")
+    parser.add_argument("--child", nargs=2, metavar=("PLATFORM", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    parsers.set_backend(args.parser)
+    parsers.set_targeted(not args.full_parse)
+    if args.child:
+        run_child(args.child[0], args.child[1], args.pages)
+        return
+
+    print(f"{args.pages}-page search, {args.parser} parser" + (", full parse" if args.full_parse else ""))
+    print(f"{'platform':<10} {'mode':<7} {'products':>8} {'baseline MB':>12} {'peak MB':>9} {'growth MB':>10}")
+    for platform in args.platforms.split(","):
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--pages", str(args.pages),
+                 "--parser", args.parser, "--child", platform, mode]
+                + (["--full_parse"] if args.full_parse else []),
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{platform:<10} {mode:<7} {result['products']:>8} {result['baseline_mb']:>12.1f} "
+                  f"{result['peak_mb']:>9.1f} {result['peak_mb'] - result['baseline_mb']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
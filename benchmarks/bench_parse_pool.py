@@ -0,0 +1,61 @@
+"""Parse throughput with the parse process pool at different sizes.
+
+    python benchmarks/bench_parse_pool.py [--workers 0,1,2,4,8,16] [--pages 64] [--parser lxml]
+
+Pages are handed to parse_pool.run from as many threads as there are
+workers (one thread for 0 workers), the way concurrent keywords do it.
+"""
+import os
+import sys
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parsers
+import parse_pool
+import amazon_scraper1
+import product_info_fetcher1
+from page_fixtures import load_fixtures
+
+def parse_all(jobs, threads):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lambda job: parse_pool.run(*job), jobs))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default=f"0,1,2,4,{os.cpu_count()}")
+    parser.add_argument("--pages", type=int, default=64)
+    parser.add_argument("--parser", choices=sorted(parsers.BACKENDS), default=parsers.DEFAULT_BACKEND)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    parsers.set_backend(args.parser)
+    search_pages = [content for _, content in load_fixtures("amazon_search")]
+    product_pages = [content for _, content in load_fixtures("amazon_product")]
+    jobs = []
+    for i in range(args.pages):
+        if i % 2:
+            jobs.append((product_info_fetcher1.parse_amazon_product, product_pages[i % len(product_pages)], "B000000000"))
+        else:
+            jobs.append((amazon_scraper1.parse_results, search_pages[i % len(search_pages)]))
+
+    print(f"{args.pages} pages, {args.parser} parser, {os.cpu_count()} cores")
+    print(f"{'workers':>7} {'seconds':>8} {'pages/s':>8} {'speedup':>8}")
+    baseline = None
+    for workers in sorted({int(w) for w in args.workers.split(",")}):
+        parse_pool.configure(workers)
+        # Start the processes and import the scrapers in them before timing
+        parse_all(jobs[:max(workers, 1) * 2], max(workers, 1))
+        start = time.perf_counter()
+        parse_all(jobs, max(workers, 1))
+        elapsed = time.perf_counter() - start
+        rate = args.pages / elapsed
+        baseline = baseline or rate
+        print(f"{workers:>7} {elapsed:>8.2f} {rate:>8.1f} {rate / baseline:>7.1f}x")
+    parse_pool.shutdown()
+
+if __name__ == "__main__":
+    main()
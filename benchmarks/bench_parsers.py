@@ -0,0 +1,78 @@
+"""Parse + extract time per page for each parser backend.
+
+    python benchmarks/bench_parsers.py [--repeat 5] [--backends lxml,bs4] [--targeted]
+
+Also checks that every backend extracts exactly the same records.
+"""
+import os
+import sys
+import time
+import argparse
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parsers
+import amazon_scraper1
+import flipkart_scraper
+import product_info_fetcher1
+from page_fixtures import KINDS, load_fixtures
+
+def extract(kind, doc):
+    if kind == "amazon_search":
+        return amazon_scraper1.process_amazon_data([doc], 10 ** 6)
+    if kind == "flipkart_search":
+        return flipkart_scraper.process_flipkart_data([doc], 10 ** 6)
+    if kind == "amazon_product":
+        return product_info_fetcher1.process_amazon_data(doc, "B000000000")
+    return product_info_fetcher1.process_flipkart_data(doc, "https://www.flipkart.com/p/itm")
+
+SEARCH_TARGETS = {
+    "amazon_search": amazon_scraper1.SEARCH_TARGETS,
+    "flipkart_search": flipkart_scraper.SEARCH_TARGETS,
+}
+
+def time_page(backend, kind, content, repeat, targeted):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if targeted and kind in SEARCH_TARGETS:
+            doc = backend.parse_targets(content, SEARCH_TARGETS[kind])
+        else:
+            doc = backend.parse(content)
+        records = extract(kind, doc)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, records
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--backends", default=",".join(parsers.BACKENDS))
+    parser.add_argument("--targeted", action="store_true", help="Parse only result nodes of search pages")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    backends = [name for name in args.backends.split(",") if name in parsers.BACKENDS]
+
+    print(f"{'fixture':<32} {'KB':>7} " + " ".join(f"{name + ' ms':>10}" for name in backends))
+    mismatches = 0
+    for kind in KINDS:
+        for name, content in load_fixtures(kind):
+            timings = []
+            outputs = []
+            for backend_name in backends:
+                parsers.set_backend(backend_name)
+                elapsed, records = time_page(parsers.get_backend(backend_name), kind, content, args.repeat, args.targeted)
+                timings.append(elapsed * 1000)
+                outputs.append(records)
+            if any(output != outputs[0] for output in outputs[1:]):
+                mismatches += 1
+                print(f"  ! backends disagree on {name}")
+            print(f"{name:<32} {len(content) / 1024:>7.0f} " + " ".join(f"{t:>10.2f}" for t in timings))
+
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
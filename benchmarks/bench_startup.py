@@ -0,0 +1,92 @@
+"""Cold-start import time of the Python entry points, against a budget.
+
+    python benchmarks/bench_startup.py [--repeat 5] [--entries scraper_wrapper,worker] [--top 10] [--scale 1.0]
+
+main.js starts a fresh interpreter for every action, so whatever the entry
+points import at module level is paid on every click. Each entry point is
+imported in a fresh `python -X importtime` process; the best of --repeat
+runs is compared with its budget, and the heaviest imports of that run are
+listed so a regression points at the module that caused it. An entry point
+that loads a module it should only load on demand (requests, bs4, lxml,
+asyncio, a platform's scraper...) fails as well, whatever its time.
+
+Exits 1 when any entry point is over budget (times --scale, for slower
+machines) or loads a deferred module.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRAPER_MODULES = ["amazon_scraper1", "flipkart_scraper", "product_info_fetcher1", "http_session", "http_cache",
+                   "parsers", "parse_pool"]
+HEAVY_MODULES = ["requests", "bs4", "lxml", "asyncio", "multiprocessing", "pandas"]
+
+# entry point: (budget in ms, modules it must not import at startup)
+ENTRIES = {
+    "scraper_wrapper": (120, SCRAPER_MODULES + HEAVY_MODULES),
+    "worker": (120, SCRAPER_MODULES + HEAVY_MODULES + ["export_utils"]),
+    "history": (60, SCRAPER_MODULES + HEAVY_MODULES),
+    # openpyxl (which loads lxml and numpy when they are installed) is most
+    # of this, and is needed for anything export_utils does
+    "export_utils": (450, SCRAPER_MODULES + [name for name in HEAVY_MODULES if name != "lxml"]),
+}
+
+def import_once(entry, deferred):
+    """(total ms, [(cumulative ms, module)] it imports directly, deferred modules that were loaded) for one fresh import"""
+    code = (f"import sys; import {entry}; "
+            f"print(','.join(m for m in {deferred!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            modules.append((int(cumulative) / 1000, name.rstrip()))
+        except ValueError:
+            continue  # the header line
+    # A module is reported after everything it imported, so the entry point's
+    # imports are the indented lines between the previous top-level one and it
+    end = max(index for index, (ms, name) in enumerate(modules) if name.strip() == entry)
+    start = end
+    while start > 0 and modules[start - 1][1].startswith("  "):
+        start -= 1
+    depth = len(modules[end][1]) - len(modules[end][1].lstrip()) + 2
+    direct = [(ms, name.strip()) for ms, name in modules[start:end] if len(name) - len(name.lstrip()) == depth]
+    loaded = [name for name in result.stdout.strip().split(",") if name]
+    return modules[end][0], direct, loaded
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--entries", default=",".join(ENTRIES))
+    parser.add_argument("--top", type=int, default=8, help="Heaviest direct imports to list per entry point")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget by this")
+    args = parser.parse_args()
+
+    failures = 0
+    print(f"{'entry point':<18} {'best ms':>9} {'budget ms':>10}")
+    for entry in args.entries.split(","):
+        budget, deferred = ENTRIES[entry]
+        budget *= args.scale
+        runs = [import_once(entry, deferred) for _ in range(args.repeat)]
+        total, modules, loaded = min(runs)
+        verdict = "ok" if total <= budget else "OVER BUDGET"
+        print(f"{entry:<18} {total:>9.1f} {budget:>10.0f}  {verdict}")
+        if loaded:
+            verdict = "loads deferred modules"
+            print(f"  ! imports {', '.join(loaded)} at startup")
+        if verdict != "ok":
+            failures += 1
+        for ms, name in sorted(modules, reverse=True)[:args.top]:
+            print(f"  {ms:>9.1f}  {name}")
+
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
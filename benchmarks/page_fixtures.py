@@ -0,0 +1,134 @@
+"""Page fixtures for the offline benchmarks.
+
+Recorded pages can be dropped into benchmarks/fixtures/ as
+<kind>_<anything>.html, where kind is one of amazon_search, flipkart_search,
+amazon_product or flipkart_product. When no recording exists for a kind,
+a synthetic page with the same markup the scrapers look for (and a
+realistic amount of navigation, script and ad noise) is generated instead.
+"""
+import os
+import glob
+import random
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+KINDS = ["amazon_search", "flipkart_search", "amazon_product", "flipkart_product"]
+
+def _noise(rng, size):
+    """Navigation links, inline scripts and ad slots, roughly `size` bytes of it"""
+    parts = []
+    total = 0
+    while total < size:
+        choice = rng.random()
+        if choice < 0.4:
+            chunk = "<li class=\"nav-item\"><a href=\"/b?node=%d\">Category %d</a></li>" % (rng.randint(1, 10 ** 6), rng.randint(1, 999))
+        elif choice < 0.7:
+            chunk = "<script>window.ue_t0=%d;var cfg={\"k\":\"%s\"};</script>" % (rng.randint(1, 10 ** 9), "x" * rng.randint(50, 400))
+        else:
+            chunk = "<div class=\"ad-slot\" data-slot=\"%d\"><img src=\"/img/%d.jpg\" alt=\"ad\"></div>" % (rng.randint(1, 999), rng.randint(1, 10 ** 6))
+        parts.append(chunk)
+        total += len(chunk)
+    return "<ul class=\"nav\">" + "".join(parts) + "</ul>"
+
+def amazon_search_page(keyword="phone", page=1, last_page=20, per_page=16, noise=300000):
+    rng = random.Random(f"amazon:{keyword}:{page}")
+    results = []
+    for i in range(per_page):
+        asin = "B0%08d" % (page * 100 + i)
+        classes = "s-result-item s-asin AdHolder" if i % 7 == 3 else "s-result-item s-asin"
+        bought = f"<span class=\"a-size-base a-color-secondary\">{rng.choice(['1K+', '500+', '50+'])} bought in past month</span>" if i % 3 == 0 else ""
+        results.append(
+            f"<div data-component-type=\"s-search-result\" data-asin=\"{asin}\" class=\"{classes}\">"
+            f"<div class=\"s-card\"><img src=\"/img/{asin}.jpg\">"
+            f"<h2 class=\"a-size-mini a-spacing-none\"><a href=\"/dp/{asin}\"><span>{keyword.title()} model {page}-{i} with extra long title text</span></a></h2>"
+            f"<span class=\"a-price\"><span class=\"a-price-whole\">{rng.randint(199, 99999):,}</span></span>"
+            f"<span class=\"a-icon-alt\">{rng.randint(30, 50) / 10} out of 5 stars</span>"
+            f"<span class=\"a-size-base s-underline-text\">({rng.randint(1, 99999):,})</span>"
+            f"{bought}</div></div>"
+        )
+    pagination = ""
+    if page < last_page:
+        pagination = f"<a class=\"s-pagination-item s-pagination-next\" href=\"/s?k={keyword}&page={page + 1}\">Next</a>"
+    return (
+        f"<!DOCTYPE html><html><head><title>Amazon.in : {keyword}</title></head><body>"
+        f"<header>{_noise(rng, noise // 2)}</header><div class=\"s-main-slot\">{''.join(results)}</div>"
+        f"<div class=\"s-pagination\">{pagination}</div><footer>{_noise(rng, noise // 2)}</footer></body></html>"
+    )
+
+def flipkart_search_page(keyword="phone", page=1, last_page=20, per_page=24, noise=200000):
+    rng = random.Random(f"flipkart:{keyword}:{page}")
+    results = []
+    for i in range(per_page):
+        pid = "MOB%09d" % (page * 100 + i)
+        sponsored = "<div class=\"s1AVV4\" data-tkid=\"ADVIEW.abc\">Ad</div>" if i % 8 == 1 else ""
+        results.append(
+            f"<div data-id=\"{pid}\"><div class=\"tUxRFH\">"
+            f"<a class=\"CGtC98\" href=\"/{keyword}-{page}-{i}/p/itm{pid}\"><div class=\"KzDlHZ\">{keyword.title()} {page}-{i} (Blue, 128 GB)</div></a>"
+            f"<div class=\"Nx9bqj _4b5DiR\">&#8377;{rng.randint(999, 99999):,}</div>"
+            f"<div class=\"XQDdHH\">{rng.randint(30, 50) / 10}<img src=\"/star.svg\"></div>"
+            f"<span class=\"Wphh3N\"><span>{rng.randint(1, 99999):,} Ratings&nbsp;&amp;&nbsp;{rng.randint(1, 9999):,} Reviews</span></span>"
+            f"{sponsored}</div></div>"
+        )
+    pagination = ""
+    if page < last_page:
+        pagination = f"<a class=\"_9QVEpD\" href=\"/search?q={keyword}&page={page + 1}\"><span>Next</span></a>"
+    return (
+        f"<!DOCTYPE html><html><head><title>{keyword} - Buy Products Online at Best Price in India</title></head><body>"
+        f"{_noise(rng, noise // 2)}<div id=\"container\">{''.join(results)}</div>"
+        f"<nav class=\"WSL9JP\">{pagination}</nav>{_noise(rng, noise // 2)}</body></html>"
+    )
+
+def amazon_product_page(asin="B000000101", noise=1200000):
+    rng = random.Random(f"amazon-product:{asin}")
+    # Only some products show how many were bought last month
+    bought = (
+        f"<div id=\"social-proofing-faceout-title-tk_bought\"><span class=\"a-text-bold social-proofing-faceout-title-text\">{rng.choice(['1K+', '200+'])} bought in past month</span></div>"
+        if asin[-1] in "13579" else ""
+    )
+    return (
+        f"<!DOCTYPE html><html><head><title>Amazon.in: {asin}</title></head><body>"
+        f"{_noise(rng, noise // 4)}"
+        f"<div id=\"centerCol\"><h1><span id=\"productTitle\">  Product {asin} with a descriptive title  </span></h1>"
+        f"<span class=\"a-icon-alt\">{rng.randint(30, 50) / 10} out of 5 stars</span>"
+        f"<span id=\"acrCustomerReviewText\">{rng.randint(1, 99999):,} ratings</span>"
+        f"{bought}"
+        f"<span class=\"a-price\"><span class=\"a-price-whole\">{rng.randint(199, 99999):,}</span></span>"
+        f"<span class=\"a-size-medium a-color-success\">In stock</span></div>"
+        f"{_noise(rng, noise // 4)}"
+        f"<div id=\"detailBulletsWrapper_feature_div\"><ul>"
+        f"<li><span class=\"a-list-item\"><span class=\"a-text-bold\">ASIN</span> {asin}</span></li>"
+        f"<li><span class=\"a-list-item\"><span class=\"a-text-bold\">Best Sellers Rank:</span> "
+        f"#{rng.randint(1, 99999):,} in Electronics (See Top 100 in Electronics) #{rng.randint(1, 999)} in Smartphones</span></li>"
+        f"</ul></div>"
+        f"<div id=\"customer-reviews_feature_div\"><h2>Customer reviews</h2>"
+        f"{_noise(rng, noise // 2)}</div></body></html>"
+    )
+
+def flipkart_product_page(pid="MOB000000101", noise=800000):
+    rng = random.Random(f"flipkart-product:{pid}")
+    return (
+        f"<!DOCTYPE html><html><head><title>{pid} - Flipkart.com</title></head><body>"
+        f"{_noise(rng, noise // 2)}"
+        f"<h1><span class=\"VU-ZEz\">Phone {pid} (Blue, 128 GB)</span></h1>"
+        f"<div class=\"Nx9bqj CxhGGd\">&#8377;{rng.randint(999, 99999):,}</div>"
+        f"<div class=\"XQDdHH\">{rng.randint(30, 50) / 10}</div>"
+        f"<span class=\"Wphh3N\">{rng.randint(1, 99999):,} Ratings &amp; {rng.randint(1, 9999):,} Reviews</span>"
+        f"{_noise(rng, noise // 2)}</body></html>"
+    )
+
+GENERATORS = {
+    "amazon_search": lambda: [amazon_search_page(page=p).encode() for p in (1, 2, 3)],
+    "flipkart_search": lambda: [flipkart_search_page(page=p).encode() for p in (1, 2, 3)],
+    "amazon_product": lambda: [amazon_product_page(a).encode() for a in ("B000000101", "B000000102")],
+    "flipkart_product": lambda: [flipkart_product_page(p).encode() for p in ("MOB000000101", "MOB000000102")],
+}
+
+def load_fixtures(kind):
+    """Return [(name, bytes)] for a fixture kind, preferring recorded pages"""
+    recorded = sorted(glob.glob(os.path.join(FIXTURE_DIR, f"{kind}_*.html")))
+    if recorded:
+        fixtures = []
+        for path in recorded:
+            with open(path, "rb") as f:
+                fixtures.append((os.path.basename(path), f.read()))
+        return fixtures
+    return [(f"synthetic {kind} #{i}", page) for i, page in enumerate(GENERATORS[kind](), 1)]
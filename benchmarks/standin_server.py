@@ -0,0 +1,198 @@
+"""Local stand-in for the Amazon and Flipkart pages the scrapers fetch.
+
+    python benchmarks/standin_server.py [--port 8765] [--latency 0.2] [--error_rate 0.05] [--denied_rate 0.02]
+                                       [--bandwidth 2000000]
+
+then point the scrapers at it with
+SCRAPER_HOST_OVERRIDES=www.amazon.in=http://127.0.0.1:8765,www.flipkart.com=http://127.0.0.1:8765
+
+Requests are routed by their Host header and path to search or product
+pages from page_fixtures (recorded pages when there are any). Latency,
+503 responses and "Access Denied" pages can be injected to exercise the
+retry and rate limiting paths, and bodies can be sent at a limited
+bandwidth to show what reading less of a page saves. Nothing here touches the network.
+"""
+import re
+import time
+import zlib
+import random
+import argparse
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from page_fixtures import (amazon_search_page, flipkart_search_page, amazon_product_page,
+                           flipkart_product_page, load_fixtures, FIXTURE_DIR)
+
+ACCESS_DENIED_PAGE = (
+    b"<html><head><title>Access Denied</title></head><body>"
+    b"<h1>Access Denied</h1><p>You don't have permission to access this page.</p></body></html>"
+)
+
+SEND_CHUNK = 64 * 1024  # bytes written at a time when bandwidth is limited
+
+def _recorded(kind):
+    fixtures = load_fixtures(kind)
+    return [content for name, content in fixtures if not name.startswith("synthetic")]
+
+class PageSource:
+    """Builds (and memoizes) the page for each request, preferring recordings"""
+
+    def __init__(self, last_page=20):
+        self.last_page = last_page
+        self.recorded = {kind: _recorded(kind) for kind in
+                         ("amazon_search", "flipkart_search", "amazon_product", "flipkart_product")}
+
+    def pick(self, kind, index):
+        pages = self.recorded[kind]
+        return pages[index % len(pages)] if pages else None
+
+    @lru_cache(maxsize=256)
+    def page(self, kind, key, page=1):
+        recorded = self.pick(kind, (page - 1) if kind.endswith("search") else zlib.crc32(key.encode()))
+        if recorded is not None:
+            return recorded
+        if kind == "amazon_search":
+            return amazon_search_page(key, page, last_page=self.last_page).encode("utf-8")
+        if kind == "flipkart_search":
+            return flipkart_search_page(key, page, last_page=self.last_page).encode("utf-8")
+        if kind == "amazon_product":
+            return amazon_product_page(key).encode("utf-8")
+        return flipkart_product_page(key).encode("utf-8")
+
+    def route(self, host, path):
+        """Return (kind, bytes) for a request, or (None, None) for an unknown URL"""
+        parts = urlparse(path)
+        query = parse_qs(parts.query)
+        page = int(query.get("page", ["1"])[0])
+        if "amazon" in host:
+            if parts.path == "/s":
+                return "amazon_search", self.page("amazon_search", query.get("k", ["phone"])[0], page)
+            match = re.search(r"/dp/([A-Z0-9]{10})", parts.path)
+            if match:
+                return "amazon_product", self.page("amazon_product", match.group(1))
+        elif "flipkart" in host:
+            if parts.path == "/search":
+                return "flipkart_search", self.page("flipkart_search", query.get("q", ["phone"])[0], page)
+            match = re.search(r"/p/(\w+)", parts.path)
+            if match:
+                return "flipkart_product", self.page("flipkart_product", match.group(1).upper())
+        return None, None
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, jitter=0.0, error_rate=0.0,
+                 denied_rate=0.0, retry_after=None, last_page=20, seed=0, bandwidth=None):
+        super().__init__(address, StandinHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.denied_rate = denied_rate
+        self.retry_after = retry_after
+        self.bandwidth = bandwidth
+        self.source = PageSource(last_page)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "pages": 0, "errors_503": 0, "denied": 0, "not_found": 0}
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def roll(self):
+        with self.lock:
+            return self.rng.random(), self.rng.uniform(0, self.jitter)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="standin-server", daemon=True)
+        thread.start()
+        return self
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real sites
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass  # a client that stopped reading a body part way closes the connection
+
+    def do_GET(self):
+        server = self.server
+        server.count("requests")
+        chance, jitter = server.roll()
+        if server.latency or jitter:
+            time.sleep(server.latency + jitter)
+
+        if chance < server.error_rate:
+            server.count("errors_503")
+            headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else {}
+            self.send(503, b"<html><head><title>Service Unavailable</title></head></html>", headers)
+            return
+        if chance < server.error_rate + server.denied_rate:
+            server.count("denied")
+            self.send(200, ACCESS_DENIED_PAGE)
+            return
+
+        kind, content = server.source.route(self.headers.get("Host", ""), self.path)
+        if content is None:
+            server.count("not_found")
+            self.send(404, b"<html><head><title>Not Found</title></head></html>")
+            return
+        server.count("pages")
+        self.send(200, content)
+
+    def send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        bandwidth = self.server.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        try:
+            for start in range(0, len(body), SEND_CHUNK):
+                chunk = body[start:start + SEND_CHUNK]
+                self.wfile.write(chunk)
+                self.wfile.flush()
+                time.sleep(len(chunk) / bandwidth)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading part way through
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fixture pages in place of Amazon and Flipkart")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds at random")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--denied_rate", type=float, default=0.0, help="Fraction answered with an Access Denied page")
+    parser.add_argument("--retry_after", type=int, help="Retry-After seconds sent with 503s")
+    parser.add_argument("--last_page", type=int, default=20, help="Search pages per keyword")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--bandwidth", type=float, help="Bytes per second each response body is sent at")
+    args = parser.parse_args()
+
+    server = StandinServer(("127.0.0.1", args.port), args.latency, args.jitter, args.error_rate,
+                           args.denied_rate, args.retry_after, args.last_page, args.seed,
+                           args.bandwidth)
+    print(f"Serving fixture pages on {server.base_url} (recorded fixtures from {FIXTURE_DIR} if present)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
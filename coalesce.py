@@ -0,0 +1,108 @@
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+import metrics
+
+# Fetches that are identical within one run are made only once.
+#
+# A call is identified by a key (e.g. ("amazon_product", asin)). While it
+# is running, every other caller with the same key waits for it and gets
+# the same result; once it has returned, its result is remembered so later
+# callers get it without fetching at all. A call that raises or returns
+# None (a blocked page, say) is not remembered, so the next caller tries
+# again. Callers share the returned object: copy it before changing it.
+#
+# Calls go to the Group of the current context: a job runs inside scope(),
+# so jobs running side by side in one worker process neither share nor
+# clear each other's results. Threads started for a job must be given a
+# copy of the context (contextvars.copy_context().run), as for metrics.
+# Outside any scope a process-wide Group is used.
+#
+# At most MAX_REMEMBERED results are kept, the least recently used going
+# first, so a run over a very long input does not keep every product.
+
+MAX_REMEMBERED = 1024
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class Group:
+    def __init__(self, max_remembered=MAX_REMEMBERED):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.results = OrderedDict()
+        self.max_remembered = max_remembered
+
+    def do(self, key, func, remember=True):
+        """Return func()'s result, running it once for all concurrent (and, with remember, later) callers"""
+        with self.lock:
+            if key in self.results:
+                metrics.count("coalesced")
+                self.results.move_to_end(key)
+                return self.results[key]
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            metrics.count("coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                if remember and call.error is None and call.result is not None:
+                    self.results[key] = call.result
+                    if len(self.results) > self.max_remembered:
+                        self.results.popitem(last=False)
+                self.calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def known(self, key):
+        """True if key's result is already remembered"""
+        with self.lock:
+            return key in self.results
+
+    def reset(self):
+        """Forget remembered results (calls still running are unaffected)"""
+        with self.lock:
+            self.results.clear()
+
+_default = Group()
+_current = contextvars.ContextVar("coalesce", default=None)
+
+@contextmanager
+def scope(group=None):
+    """Coalesce the calls made in this context in `group` (a new one by default)"""
+    group = group if group is not None else Group()
+    token = _current.set(group)
+    try:
+        yield group
+    finally:
+        _current.reset(token)
+
+def current():
+    group = _current.get()
+    return group if group is not None else _default
+
+def do(key, func, remember=True):
+    return current().do(key, func, remember)
+
+def known(key):
+    return current().known(key)
+
+def reset():
+    current().reset()
@@ -1,105 +1,268 @@
-import pandas as pd
 from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, NamedStyle
+import argparse
+import json
 import logging
+import sys
 from datetime import datetime
+import history
+import identifiers
+import metrics
+import records
 
 logger = logging.getLogger(__name__)
 
+PRODUCT_HEADERS = {
+    "Amazon": ["S.No", "ASIN", "Link", "Title", "Price", "Rating", "Reviews", "BestSeller", "In Stock", "Sponsored", "Bought Last Month", "Timestamp"],
+    "Flipkart": ["S.No", "Product ID", "Link", "Title", "Price", "Rating", "Reviews", "Sponsored", "Timestamp"],
+}
+RANK_HEADERS = {
+    "Amazon": ["Rank", "ASIN", "Link", "Title", "Price", "Rating", "Reviews", "Type", "Sponsored", "Bought Last Month", "Timestamp"],
+    "Flipkart": ["Rank", "Product ID", "Link", "Title", "Price", "Rating", "Reviews", "Sponsored", "Timestamp"],
+}
+
+def header_style():
+    return NamedStyle(
+        name="header",
+        font=Font(bold=True),
+        fill=PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid"),
+        alignment=Alignment(horizontal="center", vertical="center"),
+    )
+
+class ExcelStreamWriter:
+    """Writes rows into a write-only workbook, one sheet per keyword.
+
+    Rows are streamed straight to disk as they are added, so memory stays
+    flat however many rows or sheets an export has. The header style is
+    registered once as a named style and shared by every header cell.
+
+    Rows may be records.Product or row dicts; either way prices, ratings
+    and counts are written as numbers and missing values as empty cells.
+    """
+
+    def __init__(self, file_path, platform):
+        self.file_path = file_path
+        self.platform = platform if platform in PRODUCT_HEADERS else "Flipkart"
+        self.timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.workbook = Workbook(write_only=True)
+        self.workbook.add_named_style(header_style())
+        self.sheets = {}
+        self.row_counts = {}
+
+    def sheet(self, key, title, headers):
+        sheet = self.sheets.get(key)
+        if sheet is None:
+            sheet = self.workbook.create_sheet(title=title[:31])  # Excel sheet names limited to 31 characters
+            if headers:
+                cells = []
+                for header in headers:
+                    cell = WriteOnlyCell(sheet, value=header)
+                    cell.style = "header"
+                    cells.append(cell)
+                sheet.append(cells)
+            self.sheets[key] = sheet
+            self.row_counts[key] = 0
+        return sheet
+
+    def add_product(self, product):
+        key = ("product",)
+        sheet = self.sheet(key, f"{self.platform} Product Info", PRODUCT_HEADERS[self.platform])
+        self.row_counts[key] += 1
+        sheet.append(product_info_row(self.row_counts[key], records.from_json(product), self.platform,
+                                      self.timestamp))
+
+    def add_rank(self, keyword, product):
+        key = ("rank", keyword)
+        sheet = self.sheet(key, keyword, RANK_HEADERS[self.platform])
+        self.row_counts[key] += 1
+        sheet.append(rank_row(records.from_json(product), self.platform, self.timestamp))
+
+    def add_message(self, title, message):
+        sheet = self.sheet(("message", title), title, None)
+        sheet.append([message])
+
+    def add_row(self, row):
+        """Route a scraped row: rank rows by their keyword, others as product info"""
+        product = records.from_json(row)
+        if product.rank is not None:
+            self.add_rank(product.keyword or "Results", product)
+        else:
+            self.add_product(product)
+
+    def save(self):
+        if not self.sheets:
+            self.add_message("Results", "No results to export")
+        logger.info("Saving workbook to: %s", self.file_path)
+        self.workbook.save(self.file_path)
+        logger.info("Results exported successfully to %s", self.file_path)
+
+def product_info_row(index, product, platform, timestamp):
+    if platform == "Amazon":
+        return [
+            index,  # S.No
+            product.product_id,
+            product.link,
+            product.title,
+            product.price,
+            product.rating,
+            product.reviews,
+            product.bestseller,
+            records.yes_no(product.in_stock),
+            records.yes_no(product.sponsored),
+            product.bought_last_month,
+            timestamp,
+        ]
+    # Flipkart
+    return [
+        index,  # S.No
+        product.product_id,
+        product.link,
+        product.title,
+        product.price,
+        product.rating,
+        product.reviews,
+        records.yes_no(product.sponsored),
+        timestamp,
+    ]
+
+def rank_row(product, platform, timestamp):
+    row = [
+        product.rank,
+        product.product_id,
+        product.link,
+        product.title,
+        product.price,
+        product.rating,
+        product.reviews,
+    ]
+    if platform == "Amazon":
+        row += [
+            records.ad_type(product.sponsored),
+            records.yes_no(product.sponsored),
+            product.bought_last_month,
+        ]
+    row.append(timestamp)
+    return row
+
 def export_to_excel(results, file_path, platform):
     try:
-        logger.info(f"Starting export to Excel: {file_path}")
-        workbook = Workbook()
-        workbook.remove(workbook.active)  # Remove default sheet
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        logger.info("Starting export to Excel: %s", file_path)
+        writer = ExcelStreamWriter(file_path, platform)
 
         if isinstance(results, dict) and 'product' in results:
             # Product Info Fetcher results
-            sheet = workbook.create_sheet(title=f"{platform} Product Info")
             products = [p for p in results['product'] if p is not None]
             if products:
-                export_product_info(sheet, products, platform, timestamp)
+                for product in products:
+                    writer.add_product(product)
             else:
-                sheet.cell(row=1, column=1, value="No valid product information found")
+                writer.add_message(f"{platform} Product Info", "No valid product information found")
         else:
             # Rank Fetcher results
             for keyword, products in results.items():
-                sheet = workbook.create_sheet(title=keyword[:31])  # Excel sheet names limited to 31 characters
                 if products:
-                    export_rank_fetcher_results(sheet, products, platform, timestamp)
+                    for product in products:
+                        writer.add_rank(keyword, product)
                 else:
-                    sheet.cell(row=1, column=1, value=f"No products found for '{keyword}'")
+                    writer.add_message(keyword, f"No products found for '{keyword}'")
 
-        logger.info(f"Saving workbook to: {file_path}")
-        workbook.save(file_path)
-        logger.info(f"Results exported successfully to {file_path}")
+        writer.save()
     except Exception as e:
-        logger.error(f"Error exporting results to Excel: {str(e)}")
+        logger.error("Error exporting results to Excel: %s", e)
         raise
     finally:
         logger.info("Excel export operation completed")
 
-def export_product_info(sheet, products, platform, timestamp):
-    if platform == "Amazon":
-        headers = ["S.No", "ASIN", "Link", "Title", "Price", "Rating", "Reviews", "BestSeller", "In Stock", "Sponsored", "Bought Last Month", "Timestamp"]
-    else:  # Flipkart
-        headers = ["S.No", "Product ID", "Link", "Title", "Price", "Rating", "Reviews", "Sponsored", "Timestamp"]
-
-    for col, header in enumerate(headers, start=1):
-        cell = sheet.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    for row, product in enumerate(products, start=2):
-        sheet.cell(row=row, column=1, value=row-1)  # S.No
-        if platform == "Amazon":
-            sheet.cell(row=row, column=2, value=product.get("ASIN", "N/A"))
-            sheet.cell(row=row, column=3, value=product.get("link", "N/A"))
-            sheet.cell(row=row, column=4, value=product.get("title", "N/A"))
-            sheet.cell(row=row, column=5, value=product.get("price", "N/A"))
-            sheet.cell(row=row, column=6, value=product.get("rating", "N/A"))
-            sheet.cell(row=row, column=7, value=product.get("reviews", "N/A"))
-            sheet.cell(row=row, column=8, value=product.get("BestSeller", "N/A"))
-            sheet.cell(row=row, column=9, value=product.get("In Stock", "N/A"))
-            sheet.cell(row=row, column=10, value=product.get("sponsored", "N/A"))
-            sheet.cell(row=row, column=11, value=product.get("bought_last_month", "N/A"))
-            sheet.cell(row=row, column=12, value=timestamp)
-        else:  # Flipkart
-            sheet.cell(row=row, column=2, value=product.get("product_id", "N/A"))
-            sheet.cell(row=row, column=3, value=product.get("link", "N/A"))
-            sheet.cell(row=row, column=4, value=product.get("title", "N/A"))
-            sheet.cell(row=row, column=5, value=product.get("price", "N/A"))
-            sheet.cell(row=row, column=6, value=product.get("rating", "N/A"))
-            sheet.cell(row=row, column=7, value=product.get("reviews", "N/A"))
-            sheet.cell(row=row, column=8, value=product.get("sponsored", "N/A"))
-            sheet.cell(row=row, column=9, value=timestamp)
-
-def export_rank_fetcher_results(sheet, products, platform, timestamp):
-    if platform == "Amazon":
-        headers = ["Rank", "ASIN", "Link", "Title", "Price", "Rating", "Reviews", "Type", "Sponsored", "Bought Last Month", "Timestamp"]
-    else:  # Flipkart
-        headers = ["Rank", "Product ID", "Link", "Title", "Price", "Rating", "Reviews", "Sponsored", "Timestamp"]
-
-    for col, header in enumerate(headers, start=1):
-        cell = sheet.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    for row, product in enumerate(products, start=2):
-        col = 1
-        sheet.cell(row=row, column=col, value=product.get("rank", "N/A")); col += 1
-        sheet.cell(row=row, column=col, value=product.get("asin") or product.get("product_id", "N/A")); col += 1
-        sheet.cell(row=row, column=col, value=product.get("link", "N/A")); col += 1
-        sheet.cell(row=row, column=col, value=product.get("title", "N/A")); col += 1
-        sheet.cell(row=row, column=col, value=product.get("price", "N/A")); col += 1
-        sheet.cell(row=row, column=col, value=product.get("rating", "N/A")); col += 1
-        sheet.cell(row=row, column=col, value=product.get("reviews", "N/A")); col += 1
-        
-        if platform == "Amazon":
-            sheet.cell(row=row, column=col, value=product.get("type", "N/A")); col += 1
-            sheet.cell(row=row, column=col, value=product.get("sponsored", "N/A")); col += 1
-            sheet.cell(row=row, column=col, value=product.get("bought_last_month", "N/A")); col += 1
-            
-        sheet.cell(row=row, column=col, value=timestamp)
\ No newline at end of file
+def export_results(results, file_path, platform):
+    """Export a flat list of scraped rows (records JSON view), as collected by the UI.
+
+    Rank rows are grouped into one sheet per keyword; rows without a rank
+    are product info results.
+    """
+    export_rows((row for row in results if row), file_path, platform)
+
+def export_rows(rows, file_path, platform):
+    """Stream an iterable of rows (dicts or records.Product) into a workbook without holding them"""
+    try:
+        logger.info("Starting export to Excel: %s", file_path)
+        with metrics.timer("export"):
+            writer = ExcelStreamWriter(file_path, platform)
+            exported = 0
+            for row in rows:
+                writer.add_row(row)
+                exported += 1
+            writer.save()
+        metrics.count("rows_exported", exported)
+    except Exception as e:
+        logger.error("Error exporting results to Excel: %s", e)
+        raise
+    finally:
+        logger.info("Excel export operation completed")
+
+def read_ndjson_rows(stream):
+    """Yield row dicts from NDJSON: either bare rows or scraper_wrapper 'result' events"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            message = json.loads(line)
+        except ValueError as e:
+            logger.warning("Skipping invalid JSON on line %s: %s", line_number, e)
+            continue
+        if not isinstance(message, dict):
+            continue
+        if "type" in message and "data" in message:
+            if message["type"] != "result" or not message["data"]:
+                continue
+            data = message["data"]
+            for row in data if isinstance(data, list) else [data]:
+                if row:
+                    yield row
+        elif "type" in message and message["type"] in ("progress", "error", "complete", "stats", "metrics", "job"):
+            continue
+        else:
+            yield message
+
+def export_ndjson(input_path, file_path, platform):
+    """Export NDJSON rows from a file, or from stdin when input_path is '-'"""
+    if input_path == '-':
+        export_rows(read_ndjson_rows(sys.stdin), file_path, platform)
+        return
+    with open(input_path, encoding='utf-8') as stream:
+        export_rows(read_ndjson_rows(stream), file_path, platform)
+
+def export_history(keywords, file_path, platform, at=None, path=None):
+    """Export each keyword's rows from the history store, as of its last scrape at or before `at`"""
+    store = history.HistoryStore(path)
+    try:
+        site = platform.lower()
+        export_rows((product for keyword in keywords
+                     for product in store.snapshot(identifiers.canonical_keyword(keyword), at, site)),
+                    file_path, platform)
+    finally:
+        store.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Export scraped rows (NDJSON) to an Excel workbook')
+    parser.add_argument('--input', default='-', help="NDJSON file of rows or scraper events, '-' for stdin")
+    parser.add_argument('--history', action='append', metavar='KEYWORD',
+                        help='Export this keyword from the history store instead of --input (repeatable)')
+    parser.add_argument('--at', help='With --history: the last scrape at or before this date (YYYY-MM-DD)')
+    parser.add_argument('--history_db', help='History store file (default ~/.cache/ecommerce-scraper/history.sqlite3)')
+    parser.add_argument('--output', required=True, help='Path of the .xlsx file to write')
+    parser.add_argument('--platform', choices=['Amazon', 'Flipkart'], required=True)
+    args = parser.parse_args()
+
+    try:
+        if args.history:
+            export_history(args.history, args.output, args.platform, history.parse_time(args.at, end=True), args.history_db)
+        else:
+            export_ndjson(args.input, args.output, args.platform)
+    except Exception as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import threading
+import metrics
+import parsers
+
+# Declarative field extraction. A Schema maps each output field to the
+# selectors that may hold it, in order, plus a post-processor that turns the
+# matched element into the value:
+#
+#   SCHEMA = extraction.Schema("amazon_search", {
+#       "price": extraction.Field([("span", "a-price-whole"), ("span", "a-color-base")], price_text),
+#       ...
+#   })
+#
+#   with SCHEMA.page() as page:
+#       for card in cards:
+#           values = page.extract(card)   # {field: value}
+#
+# The first selector that matches wins; post(backend, node) returning None
+# means the match holds no usable value and the field gets its default.
+#
+# Fields marked adaptive list alternative markups of the same element (only
+# one of them is ever on a page), so trying them in any order gives the
+# same value. Their selectors are re-ordered every ADAPT_EVERY extractions
+# by how often each matched recently, so the one the site currently uses
+# is tried first and the others cost nothing. Fields that are not adaptive
+# keep their order: a later selector is a fallback that may also match
+# when an earlier one does.
+#
+# Every page's selector hits and misses are counted in the metrics as
+# "<schema>.<field>:<selector>" and "<schema>.<field>:miss", so a drop in
+# hits shows straight away when a site changes its markup.
+
+ADAPT_EVERY = 200  # extractions of a field between re-orderings of its selectors
+
+def text(backend, node):
+    return backend.text(node).strip()
+
+def stripped_text(backend, node):
+    return backend.stripped_text(node)
+
+def first_word(backend, node):
+    words = backend.text(node).split()
+    return words[0] if words else None
+
+class Selector:
+    __slots__ = ("tag", "cls", "attrs", "label")
+
+    def __init__(self, tag, cls=None, attrs=None):
+        self.tag = tag
+        self.cls = cls
+        self.attrs = attrs
+        self.label = tag + "".join(f".{c}" for c in (cls or "").split()) + \
+            "".join(f"[{attr}]" if value is True else f"[{attr}={value}]" for attr, value in sorted((attrs or {}).items()))
+
+class Field:
+    def __init__(self, selectors, post=text, default="N/A", adaptive=False):
+        self.selectors = [Selector(*selector) for selector in selectors]
+        self.post = post
+        self.default = default
+        self.adaptive = adaptive and len(self.selectors) > 1
+        self.order = list(range(len(self.selectors)))
+        self.hits = [0] * len(self.selectors)
+        self.misses = 0
+        self.recent = [0] * len(self.selectors)
+        self.since_adapt = 0
+
+class Schema:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.lock = threading.Lock()
+        self._finders = {}
+        self._counter_names = {
+            name: ([f"{self.name}.{name}:{selector.label}" for selector in field.selectors],
+                   f"{self.name}.{name}:miss")
+            for name, field in fields.items()
+        }
+
+    def finders(self, backend):
+        """Per field, a prepared find function per selector for this backend"""
+        finders = self._finders.get(backend.name)
+        if finders is None:
+            finders = self._finders[backend.name] = {
+                name: [backend.finder(s.tag, s.cls, s.attrs) for s in field.selectors]
+                for name, field in self.fields.items()
+            }
+        return finders
+
+    def page(self):
+        return PageExtraction(self, parsers.get_backend())
+
+    def record(self, hits):
+        """Add one page's selector hits (per field: a count per selector, then misses),
+        count them in the metrics and re-order adaptive fields"""
+        for name, counts in hits.items():
+            labels, miss_label = self._counter_names[name]
+            for index, count in enumerate(counts[:-1]):
+                if count:
+                    metrics.count(labels[index], count)
+            if counts[-1]:
+                metrics.count(miss_label, counts[-1])
+
+        with self.lock:
+            for name, counts in hits.items():
+                field = self.fields[name]
+                for index, count in enumerate(counts[:-1]):
+                    field.hits[index] += count
+                    field.recent[index] += count
+                field.misses += counts[-1]
+                field.since_adapt += sum(counts)
+                if field.adaptive and field.since_adapt >= ADAPT_EVERY:
+                    # Stable sort: selectors with equal recent hits keep their current order
+                    field.order = sorted(field.order, key=lambda index: -field.recent[index])
+                    field.recent = [0] * len(field.selectors)
+                    field.since_adapt = 0
+
+    def stats(self):
+        """Per field: hits per selector (in current trial order) and misses"""
+        with self.lock:
+            return {
+                name: {
+                    "selectors": {field.selectors[index].label: field.hits[index] for index in field.order},
+                    "misses": field.misses,
+                }
+                for name, field in self.fields.items()
+            }
+
+class PageExtraction:
+    """Extracts fields from the nodes of one page; reports its selector hits when closed"""
+
+    def __init__(self, schema, backend):
+        self.schema = schema
+        self.backend = backend
+        finders = schema.finders(backend)
+        # (name, field, finders, hit counts with a trailing miss count), looked up once per page
+        self.plan = [(name, field, finders[name], [0] * (len(field.selectors) + 1))
+                     for name, field in schema.fields.items()]
+
+    def extract(self, node):
+        backend = self.backend
+        values = {}
+        for name, field, finders, counts in self.plan:
+            for index in field.order:
+                match = finders[index](node)
+                if match is not None:
+                    counts[index] += 1
+                    value = field.post(backend, match)
+                    values[name] = field.default if value is None else value
+                    break
+            else:
+                counts[-1] += 1
+                values[name] = field.default
+        return values
+
+    def close(self):
+        hits = {name: counts for name, field, finders, counts in self.plan if any(counts)}
+        self.schema.record(hits)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
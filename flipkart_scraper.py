@@ -1,137 +1,287 @@
-import requests
-from bs4 import BeautifulSoup
-import time
-import random
 import logging
+import math
+import contextvars
+import functools
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
 from requests.exceptions import RequestException
+import coalesce
+import extraction
+import http_session
+import identifiers
+import logs
+import metrics
+import parse_pool
+import parsers
+import records
 
 logger = logging.getLogger(__name__)
 
-def search(keywords, num_products=30):
+PAGE_SIZE = 24  # Typical number of results on a search page
+PAGE_FETCH_WORKERS = 4  # Pages fetched at once in plan_pages mode
+# The only parts of a search page we read: product cards and the next link
+SEARCH_TARGETS = [
+    ("div", None, {"data-id": True}),
+    ("a", "_9QVEpD", None),
+]
+
+def search(keywords, num_products=30, plan_pages=False):
+    return [product for products in search_pages(keywords, num_products, plan_pages) for product in products]
+
+def search_pages(keywords, num_products=30, plan_pages=False, start=None, on_page=None):
+    """Yield the products of each search page as soon as that page is parsed.
+
+    The next page is only fetched while fewer than num_products valid
+    products have been extracted.
+
+    start=(url, page, found) continues an earlier run that already has
+    `found` products, fetching from `url` as page number `page`.
+    on_page(page, next_url, products) is called for every page before its
+    products are yielded; the checkpoint journal uses both.
+    """
     try:
-        all_data = fetch_flipkart_data(keywords, num_products)
-        products = process_flipkart_data(all_data, num_products)
-        if not products:
+        found = start[2] if start is not None else 0
+        if found < num_products:
+            with closing(iter_search_pages(keywords, num_products, plan_pages, start)) as pages:
+                for page, products, next_url in pages:
+                    products = products[:num_products - found]
+                    for rank, product in enumerate(products, found + 1):
+                        product.rank = rank
+                    if on_page is not None:
+                        on_page(page, next_url, products)
+                    if products:
+                        found += len(products)
+                        yield products
+                    if found >= num_products:
+                        break
+
+        logger.info("Processed %s products", found)
+        if not found:
             error_msg = f"No products found for '{keywords}'"
             logger.error(error_msg)
             raise Exception(error_msg)
-        return products
     except Exception as e:
         error_msg = f"Error during Flipkart search: {str(e)}"
         logger.error(error_msg)
         raise Exception(error_msg)
 
-def fetch_flipkart_data(keyword, num_products):
-    all_data = []
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+    "Cache-Control": "max-age=0",
+    "TE": "Trailers",
+}
+
+def product_link(backend, node):
+    href = backend.get(node, "href")
+    return f"https://www.flipkart.com{href}" if href is not None else None
+
+def rating_count(backend, node):
+    # Only the number of ratings, not "& N Reviews"
+    words = backend.stripped_text(node).strip("()").split()
+    return words[0] if words else None
+
+# Grid results name and link products with wjcEIp, list results with KzDlHZ
+# and CGtC98; a page uses one layout, so those selectors adapt their order
+SEARCH_SCHEMA = extraction.Schema("flipkart_search", {
+    "title": extraction.Field([("a", "wjcEIp"), ("div", "KzDlHZ")],
+                              lambda backend, node: backend.get(node, "title", backend.text(node).strip()),
+                              adaptive=True),
+    "price": extraction.Field([("div", "Nx9bqj")], extraction.stripped_text),
+    "link": extraction.Field([("a", "wjcEIp"), ("a", "CGtC98")], product_link, adaptive=True),
+    "rating": extraction.Field([("div", "XQDdHH")], extraction.stripped_text),
+    "reviews": extraction.Field([("span", "Wphh3N")], rating_count),
+    "sponsored": extraction.Field([("div", "s1AVV4")],
+                                  lambda backend, node: "ADVIEW" in backend.get(node, 'data-tkid', ''),
+                                  default=False),
+})
+
+def search_url(keyword, page=1):
+    keyword = identifiers.canonical_keyword(keyword)
     url = f"https://www.flipkart.com/search?q={keyword.replace(' ', '+')}&otracker=search&otracker1=search&marketplace=FLIPKART&as-show=off&as=off"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-        "Cache-Control": "max-age=0",
-        "TE": "Trailers",
-    }
-
-    session = requests.Session()
-    session.headers.update(headers)
-
-    page = 1
-    max_retries = 3
-    retry_delay = 10
+    if page > 1:
+        url += f"&page={page}"
+    return url
 
-    while len(all_data) * 24 < num_products:  # Assuming 24 products per page
-        for attempt in range(max_retries):
-            try:
-                logger.info(f"Fetching page {page} for '{keyword}' (Attempt {attempt + 1})")
-                response = session.get(url, timeout=15)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.content, "lxml")
-
-                if "Access Denied" in soup.title.string:
-                    logger.warning(f"Access denied on attempt {attempt + 1}. Retrying...")
-                    time.sleep(retry_delay * (attempt + 1))
-                    continue
-
-                all_data.append(soup)
-                
-                next_page = soup.find("a", class_="_9QVEpD")
-                if next_page and "href" in next_page.attrs:
-                    url = urljoin("https://www.flipkart.com", next_page["href"])
-                    page += 1
-                    time.sleep(random.uniform(5, 8))
-                else:
-                    logger.info(f"No more pages found for '{keyword}'")
-                    break
-
-                break  # If we reach here, the request was successful
-            except RequestException as e:
-                logger.error(f"An error occurred while fetching results for '{keyword}' on page {page}: {e}")
-                if attempt == max_retries - 1:
-                    logger.error("Max retries reached. Moving on...")
-                    break
-                time.sleep(retry_delay * (attempt + 1))
+def iter_search_pages(keyword, num_products, plan_pages=False, start=None):
+    """Yield (page number, products, next page URL) for each search page in order.
+
+    Each page is fetched only when asked for. start=(url, page, ...) begins
+    at that page instead of the first one.
+    """
+    if start is not None:
+        url, page = start[0], start[1]
+    elif plan_pages:
+        url, page = yield from iter_planned_pages(keyword, num_products)
+    else:
+        url, page = search_url(keyword), 1
 
-        if len(all_data) * 24 >= num_products:
+    while url:
+        products, url, _ = page_results(url, functools.partial(fetch_page_once, url, keyword, page))
+        yield page, products, url
+        if not url:
+            logger.info("No more pages found for '%s'", keyword)
             break
+        page += 1
+
+def fetch_page_once(url, keyword, page):
+    """fetch_flipkart_page, sharing the download with anyone fetching the same URL at the same time"""
+    return coalesce.do(("flipkart_page", url), functools.partial(fetch_flipkart_page, url, keyword, page), remember=False)
+
+def page_results(url, fetch):
+    """(products, next page URL, result ids) for a search page, fetched with fetch() and parsed once per run.
 
-    return all_data
+    Keywords that lead to the same page URL, at the same time or later in
+    the run, share one request. Each caller gets its own copies of the
+    products, since search_pages re-ranks them in place.
+    """
+    def load():
+        return parse_pool.run(parse_results, fetch())
+
+    products, next_url, product_ids = coalesce.do(("flipkart_search", url), load)
+    return [product.copy() for product in products], next_url, product_ids
+
+def parse_page(content):
+    return parsers.parse_search_page(content, SEARCH_TARGETS)
+
+def parse_results(content):
+    """Parse a raw search page into (products, next page URL, result ids).
+
+    This is the parse_pool stage: it may run in a worker process, so only
+    plain data goes in and comes out, and the tree is freed before returning.
+    Products are ranked from 1 within the page.
+    """
+    metrics.count("pages")
+    with metrics.timer("parse"):
+        soup = parse_page(content)
+    try:
+        with metrics.timer("extract"):
+            return extract_products(soup), next_page_url(soup), page_product_ids(soup)
+    finally:
+        parsers.get_backend().release(soup)
+
+def fetch_flipkart_page(url, keyword, page):
+    """Fetch one search page's raw bytes.
+
+    Raises http_session.BlockedError when the last attempt was denied, and
+    the last error when every attempt failed otherwise, so a search is never
+    taken to have ended at a page that could not be fetched.
+    """
+    # Pacing and backoff between attempts come from the per-host rate limiter
+    max_retries = 3
+    blocked = False
+
+    for attempt in range(max_retries):
+        if attempt:
+            metrics.count("retries")
+        try:
+            logger.debug("Fetching page %s for '%s' (Attempt %s)", page, keyword, attempt + 1)
+            response = http_session.get(url, headers=HEADERS, timeout=15)
+            response.raise_for_status()
+
+            blocked = http_session.is_blocked(response)
+            if blocked:
+                logger.warning("Access denied on attempt %s. Retrying...", attempt + 1)
+                continue
+
+            return response.content
+        except RequestException as e:
+            blocked = getattr(e.response, "status_code", None) == 503
+            logger.error("An error occurred while fetching results for '%s' on page %s: %s", keyword, page, e)
+            if attempt == max_retries - 1 and not blocked:
+                logger.error("Max retries reached for page %s", page)
+                raise
+
+    raise http_session.BlockedError(f"Access denied for page {page} of '{keyword}'")
+
+def next_page_url(soup):
+    backend = parsers.get_backend()
+    next_page = backend.find(soup, "a", "_9QVEpD")
+    if next_page is not None and backend.get(next_page, "href") is not None:
+        return urljoin("https://www.flipkart.com", backend.get(next_page, "href"))
+    return None
+
+def page_product_ids(soup):
+    backend = parsers.get_backend()
+    return [backend.get(container, "data-id") for container in backend.find_all(soup, "div", attrs={"data-id": True})]
+
+def iter_planned_pages(keyword, num_products):
+    """Yield the pages expected to hold num_products, fetched in parallel using page=N URLs.
+
+    Returns the URL and number of the page to continue from by following
+    next-page links: the one after the planned pages if more products are
+    still wanted, or the first planned page that failed or shows the site
+    ignoring the page parameter. Pages are downloaded ahead as raw bytes but
+    parsed one at a time, in order, as the caller asks for them.
+    """
+    num_pages = max(1, math.ceil(num_products / PAGE_SIZE))
+    executor = ThreadPoolExecutor(max_workers=min(num_pages, PAGE_FETCH_WORKERS))
+    try:
+        def prefetch(page):
+            page_url = search_url(keyword, page)
+            if coalesce.known(("flipkart_search", page_url)):
+                return None  # the run already has this page
+            # Each fetch runs in a copy of this context so its timings count for this keyword
+            return executor.submit(contextvars.copy_context().run, fetch_page_once, page_url, keyword, page)
+
+        futures = [prefetch(page) for page in range(1, num_pages + 1)]
+        url = search_url(keyword)
+        seen = None
+        for page, future in enumerate(futures, 1):
+            page_url = search_url(keyword, page)
+            fetch = future.result if future is not None else functools.partial(fetch_page_once, page_url, keyword, page)
+            try:
+                products, next_url, product_ids = page_results(page_url, fetch)
+            except RequestException as e:
+                logger.warning("Planned page %s for '%s' could not be fetched (%s), "
+                               "following next-page links instead", page, keyword, e)
+                return url, page
+            if page > 1 and (not product_ids or product_ids == seen):
+                logger.warning("Planned page %s for '%s' returned no new results, "
+                               "following next-page links instead", page, keyword)
+                return url, page
+            seen = product_ids
+            url = next_url
+            yield page, products, url
+            if not url:
+                logger.info("No more pages found for '%s' after page %s", keyword, page)
+                return None, page + 1
+        return url, num_pages + 1
+    finally:
+        # Pages still queued when the caller stops early are never fetched
+        executor.shutdown(wait=False, cancel_futures=True)
 
 def process_flipkart_data(all_data, num_products=30):
     products = []
     for soup in all_data:
-        product_containers = soup.find_all("div", attrs={"data-id": True})
-        
+        products += extract_products(soup, len(products) + 1, num_products - len(products))
+    logger.info("Processed %s products", len(products))
+    return products
+
+def extract_products(soup, first_rank=1, limit=None):
+    """Extract up to limit valid products from one search page, ranked from first_rank"""
+    backend = parsers.get_backend()
+    products = []
+    product_containers = backend.find_all(soup, "div", attrs={"data-id": True})
+
+    with SEARCH_SCHEMA.page() as page:
         for container in product_containers:
-            if len(products) >= num_products:
+            if limit is not None and len(products) >= limit:
                 break
 
             try:
-                product_id = container['data-id']
-                
-                # Check for name in multiple possible elements
-                name_elem = container.find("a", class_="wjcEIp") or container.find("div", class_="KzDlHZ")
-                name = name_elem.get("title", name_elem.text.strip()) if name_elem else "N/A"
-                
-                price_elem = container.find("div", class_="Nx9bqj")
-                
-                # Check for link in multiple possible elements
-                link_elem = container.find("a", class_="wjcEIp") or container.find("a", class_="CGtC98")
-                rating_elem = container.find("div", class_="XQDdHH")
-                reviews_elem = container.find("span", class_="Wphh3N")
-                
-                price = price_elem.get_text(strip=True) if price_elem else "N/A"
-                link = f"https://www.flipkart.com{link_elem['href']}" if link_elem and 'href' in link_elem.attrs else "N/A"
-                rating = rating_elem.get_text(strip=True) if rating_elem else "N/A"
-                
-                # Extract only the number of ratings
-                reviews = reviews_elem.get_text(strip=True).strip("()") if reviews_elem else "N/A"
-                if reviews != "N/A":
-                    reviews = reviews.split()[0]  # Take only the first part (number of ratings)
-                
-                # Corrected sponsored detection logic
-                sponsored_elem = container.find("div", class_="s1AVV4")
-                sponsored = "Yes" if sponsored_elem and "ADVIEW" in sponsored_elem.get('data-tkid', '') else "No"
-                
-                product = {
-                    "rank": len(products) + 1,
-                    "product_id": product_id,
-                    "title": name,
-                    "price": price,
-                    "link": link,
-                    "rating": rating,
-                    "reviews": reviews,
-                    "sponsored": sponsored
-                }
-                
-                logger.info(f"Processed product: {product}")
+                product = records.Product("flipkart", product_id=backend.get(container, 'data-id'),
+                                          rank=first_rank + len(products), **page.extract(container))
+
+                logger.debug("Processed product: %r", product)
                 products.append(product)
             except Exception as e:
-                logger.error(f"Error processing product: {str(e)}")
-                logger.error(f"Product HTML: {container}")
+                logger.error("Error processing product: %r", e)
+                logs.dump_html("flipkart_search_result", backend.html, container)
 
-    logger.info(f"Processed {len(products)} products")
-    return products[:num_products]
\ No newline at end of file
+    return products
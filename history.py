@@ -0,0 +1,325 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime
+import identifiers
+import metrics
+import records
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ecommerce-scraper", "history.sqlite3")
+
+# What an observation records; title and link live in the products table
+VALUE_FIELDS = ("rank", "price", "rating", "reviews", "bought_last_month", "sponsored", "bestseller", "in_stock")
+
+def history_path(path=None):
+    return path or os.environ.get("SCRAPER_HISTORY", DEFAULT_HISTORY_PATH)
+
+def observation_values(product):
+    return tuple(getattr(product, field) for field in VALUE_FIELDS)
+
+class HistoryStore:
+    """Every scrape's rows over time, delta-encoded in one SQLite file.
+
+    An observation row is a run: the values a product had for a keyword
+    from first_seen to last_seen, across `seen` consecutive scrapes of that
+    keyword. A scrape that finds the product unchanged only moves the run's
+    last_seen on; a change, or a scrape the product was missing from, starts
+    a new run. Product info (keyword NULL) works the same per product.
+
+    The scrapes table lists when each keyword was scraped, so a run never
+    spans a scrape it was not part of. Observations are indexed on
+    (keyword, last_seen) and (product_id, last_seen), product_id being the
+    ASIN for Amazon, so time series for a keyword or a product only read
+    their own runs.
+    """
+
+    def __init__(self, path=None):
+        self.path = path = history_path(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS scrapes ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, site TEXT, keyword TEXT, scraped_at REAL, rows INTEGER)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS scrapes_keyword ON scrapes (site, keyword, scraped_at)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            "site TEXT, product_id TEXT, title TEXT, link TEXT, updated_at REAL, PRIMARY KEY (site, product_id))"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS observations ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, site TEXT, keyword TEXT, product_id TEXT, "
+            "first_seen REAL, last_seen REAL, seen INTEGER, "
+            "rank INTEGER, price REAL, rating REAL, reviews INTEGER, bought_last_month INTEGER, "
+            "sponsored INTEGER, bestseller TEXT, in_stock INTEGER)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS observations_keyword ON observations (keyword, last_seen)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS observations_product ON observations (product_id, last_seen)")
+
+    def _transaction(self, work):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work()
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+            return result
+
+    def _open_runs(self, site, keyword, products):
+        """Per product key, the (id, values) of runs the next scrape may continue"""
+        columns = ", ".join(VALUE_FIELDS)
+        if keyword is None:
+            # Product info: each product's latest run, since it is only ever fetched on its own
+            rows = []
+            for key in {product_key(product) for product in products}:
+                row = self.db.execute(
+                    f"SELECT id, product_id, {columns} FROM observations "
+                    "WHERE product_id = ? AND keyword IS NULL AND site = ? ORDER BY last_seen DESC LIMIT 1",
+                    (key, site),
+                ).fetchone()
+                if row is not None:
+                    rows.append(row)
+        else:
+            previous = self.db.execute(
+                "SELECT MAX(scraped_at) FROM scrapes WHERE site = ? AND keyword = ?", (site, keyword)
+            ).fetchone()[0]
+            if previous is None:
+                return {}
+            rows = self.db.execute(
+                f"SELECT id, product_id, {columns} FROM observations "
+                "WHERE keyword = ? AND last_seen = ? AND site = ?",
+                (keyword, previous, site),
+            ).fetchall()
+        runs = {}
+        for row in rows:
+            runs.setdefault(row[1], []).append((row[0], decode_values(row[2:])))
+        return runs
+
+    def record(self, site, keyword, products, at=None):
+        """Add one scrape of a keyword's rank rows (keyword None: product info) observed at `at`.
+
+        Returns (runs continued, runs started).
+        """
+        at = time.time() if at is None else at
+        keyword = identifiers.canonical_keyword(keyword) if keyword is not None else None
+        products = [product for product in products if product_key(product) is not None]
+
+        def work():
+            runs = self._open_runs(site, keyword, products)
+            if keyword is not None:
+                self.db.execute("INSERT INTO scrapes (site, keyword, scraped_at, rows) VALUES (?, ?, ?, ?)",
+                                (site, keyword, at, len(products)))
+            continued, started = [], []
+            for product in products:
+                key = product_key(product)
+                values = observation_values(product)
+                candidates = runs.get(key, [])
+                for index, (run_id, run_values) in enumerate(candidates):
+                    if run_values == values:
+                        # Products listed twice (sponsored and organic) each continue their own run
+                        continued.append((at, run_id))
+                        del candidates[index]
+                        break
+                else:
+                    started.append((site, keyword, key, at, at, 1) + encode_values(values))
+            self.db.executemany("UPDATE observations SET last_seen = ?, seen = seen + 1 WHERE id = ?", continued)
+            self.db.executemany(
+                "INSERT INTO observations (site, keyword, product_id, first_seen, last_seen, seen, "
+                f"{', '.join(VALUE_FIELDS)}) VALUES ({', '.join('?' * (6 + len(VALUE_FIELDS)))})",
+                started,
+            )
+            self.db.executemany(
+                "INSERT INTO products (site, product_id, title, link, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (site, product_id) DO UPDATE SET "
+                "title = COALESCE(excluded.title, title), link = COALESCE(excluded.link, link), "
+                "updated_at = excluded.updated_at",
+                [(site, product_key(product), product.title, product.link, at) for product in products],
+            )
+            return len(continued), len(started)
+
+        with metrics.timer("history"):
+            continued, started = self._transaction(work)
+        metrics.count("history_runs_continued", continued)
+        metrics.count("history_runs_started", started)
+        return continued, started
+
+    def series(self, product_id, keyword=None, since=None, until=None):
+        """A product's runs, oldest first: its rank rows for a keyword, or with keyword None its product info.
+
+        Each run is a dict of first_seen, last_seen (epoch seconds), seen
+        (scrapes) and the observed values.
+        """
+        keyword = identifiers.canonical_keyword(keyword) if keyword is not None else None
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT first_seen, last_seen, seen, {', '.join(VALUE_FIELDS)} FROM observations "
+                "WHERE product_id = ? AND last_seen >= ? AND first_seen <= ? AND keyword IS ? ORDER BY first_seen",
+                (product_id, since or 0, until or float("inf"), keyword),
+            ).fetchall()
+        return [run_dict(row) for row in rows]
+
+    def keyword_series(self, keyword, since=None, until=None):
+        """Every product's runs for a keyword, as series() dicts with the product_id added"""
+        keyword = identifiers.canonical_keyword(keyword)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT first_seen, last_seen, seen, {', '.join(VALUE_FIELDS)}, product_id FROM observations "
+                "WHERE keyword = ? AND last_seen >= ? AND first_seen <= ? ORDER BY first_seen, rank",
+                (keyword, since or 0, until or float("inf")),
+            ).fetchall()
+        return [dict(run_dict(row[:-1]), product_id=row[-1]) for row in rows]
+
+    def snapshot(self, keyword, at=None, site=None):
+        """A keyword's rows from its last scrape at or before `at` (default: the latest), as a records.ProductBatch"""
+        batch = records.ProductBatch()
+        keyword = identifiers.canonical_keyword(keyword)
+        with self.lock:
+            scrape = self.db.execute(
+                "SELECT site, scraped_at FROM scrapes WHERE keyword = ? AND scraped_at <= ? "
+                + ("AND site = ? " if site else "") + "ORDER BY scraped_at DESC LIMIT 1",
+                (keyword, at or float("inf")) + ((site,) if site else ()),
+            ).fetchone()
+            if scrape is None:
+                return batch
+            site, scraped_at = scrape
+            rows = self.db.execute(
+                f"SELECT o.product_id, p.title, p.link, {', '.join('o.' + field for field in VALUE_FIELDS)} "
+                "FROM observations o LEFT JOIN products p ON p.site = o.site AND p.product_id = o.product_id "
+                "WHERE o.keyword = ? AND o.last_seen >= ? AND o.first_seen <= ? AND o.site = ? ORDER BY o.rank",
+                (keyword, scraped_at, scraped_at, site),
+            ).fetchall()
+        for product_id, title, link, *values in rows:
+            product = records.Product(site, product_id=product_id, keyword=keyword, title=title, link=link)
+            for field, value in zip(VALUE_FIELDS, decode_values(values)):
+                setattr(product, field, value)
+            batch.append(product)
+        return batch
+
+    def keywords(self):
+        """(site, keyword, scrapes, first scraped, last scraped) for every keyword in the store"""
+        with self.lock:
+            return self.db.execute(
+                "SELECT site, keyword, COUNT(*), MIN(scraped_at), MAX(scraped_at) FROM scrapes "
+                "GROUP BY site, keyword ORDER BY site, keyword"
+            ).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def product_key(product):
+    # Flipkart product info has no data-id; its canonical URL identifies it
+    return product.product_id or product.link
+
+def encode_values(values):
+    return tuple(int(value) if isinstance(value, bool) else value for value in values)
+
+def decode_values(values):
+    return tuple(bool(value) if field in ("sponsored", "in_stock") and value is not None else value
+                 for field, value in zip(VALUE_FIELDS, values))
+
+def run_dict(row):
+    run = {"first_seen": row[0], "last_seen": row[1], "seen": row[2]}
+    run.update(zip(VALUE_FIELDS, decode_values(row[3:])))
+    return run
+
+_store = None
+_store_lock = threading.Lock()
+_enabled = os.environ.get("SCRAPER_NO_HISTORY") is None
+
+def configure(path=None, enabled=True):
+    global _store, _enabled
+    with _store_lock:
+        _enabled = enabled
+        _store = HistoryStore(path) if enabled else None
+
+def get_store():
+    global _store, _enabled
+    if not _enabled:
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = HistoryStore()
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("History store disabled: %s", e)
+                _enabled = False
+                return None
+        return _store
+
+def record(site, keyword, products):
+    """Add a scrape to the shared store; a failure is logged, never raised"""
+    store = get_store()
+    if store is None:
+        return
+    try:
+        store.record(site, keyword, products)
+    except sqlite3.Error as e:
+        logger.warning("Could not record history for '%s': %s", keyword, e)
+
+def parse_time(value, end=False):
+    """Epoch seconds from YYYY-MM-DD[THH:MM[:SS]] (local time); with end, a bare date means the end of that day"""
+    if not value:
+        return None
+    timestamp = datetime.fromisoformat(value).timestamp()
+    if end and len(value) == 10:
+        timestamp += 86400
+    return timestamp
+
+def iso(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds")
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the rank and price history of scraped products")
+    parser.add_argument("--db", help="History file (default ~/.cache/ecommerce-scraper/history.sqlite3)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    series = commands.add_parser("series", help="Runs of one product's values, for a keyword or its product info")
+    series.add_argument("--product", required=True, help="ASIN or Flipkart product id")
+    series.add_argument("--keyword", help="Keyword the product ranked for (omit for product info)")
+    keyword = commands.add_parser("keyword", help="Runs of every product for a keyword")
+    keyword.add_argument("--keyword", required=True)
+    snapshot = commands.add_parser("snapshot", help="A keyword's rows as of one scrape")
+    snapshot.add_argument("--keyword", required=True)
+    snapshot.add_argument("--at", help="Latest scrape at or before this time (default: the latest)")
+    commands.add_parser("keywords", help="Keywords in the store with their scrape counts")
+    for command in (series, keyword):
+        command.add_argument("--since", help="Start date, YYYY-MM-DD")
+        command.add_argument("--until", help="End date, YYYY-MM-DD")
+        command.add_argument("--days", type=float, help="Only the last N days")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.db)
+    since = until = None
+    if args.command in ("series", "keyword"):
+        since = time.time() - args.days * 86400 if args.days else parse_time(args.since)
+        until = parse_time(args.until, end=True)
+
+    if args.command == "series":
+        rows = store.series(args.product, args.keyword, since, until)
+    elif args.command == "keyword":
+        rows = store.keyword_series(args.keyword, since, until)
+    elif args.command == "snapshot":
+        rows = store.snapshot(args.keyword, parse_time(args.at, end=True)).to_json()
+    else:
+        rows = [{"site": site, "keyword": keyword, "scrapes": count, "first": first, "last": last}
+                for site, keyword, count, first, last in store.keywords()]
+
+    for row in rows:
+        for field in ("first_seen", "last_seen", "first", "last"):
+            if field in row:
+                row[field] = iso(row[field])
+        sys.stdout.write(json.dumps(row) + "\n")
+
+if __name__ == "__main__":
+    main()
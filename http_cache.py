@@ -0,0 +1,200 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ecommerce-scraper", "http")
+DEFAULT_TTL = 3600  # seconds a cached page stays fresh
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # compressed bytes kept on disk before LRU eviction
+
+class CachedResponse:
+    """The parts of requests.Response the scrapers use, rebuilt from the cache"""
+
+    from_cache = True
+
+    def __init__(self, url, status_code, content, encoding=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding or "utf-8"
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+    def raise_for_status(self):
+        pass
+
+class DiskCache:
+    """Response bodies stored zlib-compressed under their content hash.
+
+    An SQLite index maps each URL to the body it last returned, with the time
+    it was fetched (for the TTL) and last read (for LRU eviction).
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.join(path, "bodies"), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "url_key TEXT PRIMARY KEY, url TEXT, content_hash TEXT, status INTEGER, "
+            "encoding TEXT, size INTEGER, fetched_at REAL, accessed_at REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self.db.commit()
+
+    def _url_key(self, url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _body_path(self, content_hash):
+        return os.path.join(self.path, "bodies", content_hash[:2], content_hash + ".z")
+
+    def get(self, url, max_age=None):
+        max_age = self.ttl if max_age is None else max_age
+        key = self._url_key(url)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT content_hash, status, encoding, fetched_at FROM entries WHERE url_key = ?", (key,)
+            ).fetchone()
+            if row is None or time.time() - row[3] > max_age:
+                self.misses += 1
+                return None
+            content_hash, status, encoding, _ = row
+            try:
+                with open(self._body_path(content_hash), "rb") as f:
+                    content = zlib.decompress(f.read())
+            except (OSError, zlib.error) as e:
+                logger.warning("Dropping unreadable cache entry for %s: %s", url, e)
+                self.db.execute("DELETE FROM entries WHERE url_key = ?", (key,))
+                self.db.commit()
+                self.misses += 1
+                return None
+            self.db.execute("UPDATE entries SET accessed_at = ? WHERE url_key = ?", (time.time(), key))
+            self.db.commit()
+            self.hits += 1
+        logger.debug("Cache hit for %s", url)
+        return CachedResponse(url, status, content, encoding)
+
+    def put(self, url, response):
+        content = response.content
+        content_hash = hashlib.sha256(content).hexdigest()
+        body_path = self._body_path(content_hash)
+        compressed = None
+        if not os.path.exists(body_path):
+            compressed = zlib.compress(content, 6)
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            tmp_path = f"{body_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(compressed)
+            os.replace(tmp_path, body_path)
+        size = len(compressed) if compressed is not None else os.path.getsize(body_path)
+
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._url_key(url), url, content_hash, response.status_code,
+                 response.encoding, size, now, now),
+            )
+            self.db.commit()
+            self.stores += 1
+            self._evict()
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.db.execute("SELECT url_key, content_hash, size FROM entries ORDER BY accessed_at").fetchall()
+        for url_key, content_hash, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM entries WHERE url_key = ?", (url_key,))
+            still_used = self.db.execute(
+                "SELECT 1 FROM entries WHERE content_hash = ? LIMIT 1", (content_hash,)
+            ).fetchone()
+            if not still_used:
+                try:
+                    os.remove(self._body_path(content_hash))
+                except OSError:
+                    pass
+            total -= size
+        self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "entries": entries,
+                "bytes": size,
+            }
+
+_cache = None
+_cache_lock = threading.Lock()
+_enabled = os.environ.get("SCRAPER_NO_CACHE") is None
+_max_age = None
+
+def configure(path=None, ttl=None, max_bytes=None, max_age=None, enabled=True):
+    """Set up the shared cache; max_age overrides the TTL for this run only"""
+    global _cache, _enabled, _max_age
+    with _cache_lock:
+        _enabled = enabled
+        _max_age = max_age
+        _cache = None
+        if enabled:
+            _cache = DiskCache(
+                path or os.environ.get("SCRAPER_CACHE_DIR", DEFAULT_CACHE_DIR),
+                DEFAULT_TTL if ttl is None else ttl,
+                DEFAULT_MAX_BYTES if max_bytes is None else max_bytes,
+            )
+
+def get_cache():
+    global _cache, _enabled
+    if not _enabled:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = DiskCache(os.environ.get("SCRAPER_CACHE_DIR", DEFAULT_CACHE_DIR))
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("HTTP cache disabled: %s", e)
+                _enabled = False
+                return None
+        return _cache
+
+def get(url):
+    cache = get_cache()
+    if cache is None:
+        return None
+    response = cache.get(url, _max_age)
+    metrics.count("cache_hits" if response is not None else "cache_misses")
+    return response
+
+def put(url, response):
+    cache = get_cache()
+    if cache is None:
+        return
+    try:
+        cache.put(url, response)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning("Could not cache %s: %s", url, e)
+
+def stats():
+    cache = _cache
+    return cache.stats() if cache is not None else {"hits": 0, "misses": 0, "stores": 0, "entries": 0, "bytes": 0}
@@ -0,0 +1,310 @@
+import os
+import re
+import random
+import threading
+import time
+import logging
+from http.cookiejar import LWPCookieJar
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+import metrics
+import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Connection pool size per host; hosts not listed use DEFAULT_POOL_SIZE
+POOL_SIZES = {
+    "www.amazon.in": 16,
+    "www.flipkart.com": 8,
+}
+DEFAULT_POOL_SIZE = 4
+
+# Proxy health scores are kept in [0, 1]; below MIN_PROXY_SCORE a proxy is
+# rotated out for PROXY_COOLDOWN seconds before it gets another chance.
+MIN_PROXY_SCORE = 0.2
+PROXY_COOLDOWN = 300
+
+ACCESS_DENIED_RE = re.compile(rb"<title>\s*Access Denied", re.IGNORECASE)
+STREAM_CHUNK = 16 * 1024  # bytes read at a time by get_until
+
+
+def is_blocked(response):
+    """True for responses that mean the site is refusing us (503 / Access Denied)"""
+    if response.status_code == 503:
+        return True
+    return bool(ACCESS_DENIED_RE.search(response.content[:4096]))
+
+
+class BlockedError(RequestException):
+    """The site kept refusing a request (503 / Access Denied) through every retry"""
+
+
+class PartialResponse:
+    """A streamed response whose body was only read until done(chunk) said
+    the caller had what it needed.
+
+    content is what was read so far and complete tells whether that is the
+    whole body. read_rest() downloads the remainder of the same response;
+    close() gives up on it instead (an unfinished connection cannot go back
+    to the pool, so the next request to the host opens a new one).
+    """
+
+    from_cache = False
+
+    def __init__(self, response, done, chunk_size=STREAM_CHUNK):
+        self.response = response
+        self.url = response.url
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.encoding = response.encoding
+        self.chunks = []
+        self.complete = False
+        self._content = None
+        self._rest = response.iter_content(chunk_size)
+        for chunk in self._rest:
+            self.chunks.append(chunk)
+            if done(chunk):
+                break
+        else:
+            self.complete = True
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = b"".join(self.chunks)
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def raise_for_status(self):
+        self.response.raise_for_status()
+
+    def read_rest(self):
+        """Download the rest of the body and return all of it"""
+        if not self.complete:
+            metrics.count("stream_fallbacks")
+            with metrics.timer("fetch"):
+                self.chunks.extend(self._rest)
+            self.complete = True
+            self._content = None
+        return self.content
+
+    def close(self):
+        if not self.complete:
+            metrics.count("stream_aborts")
+            length = self.headers.get("Content-Length")
+            if length and length.isdigit():
+                metrics.count("stream_bytes_skipped", max(int(length) - self.response.raw.tell(), 0))
+        self.response.close()
+
+
+class ProxyPool:
+    def __init__(self, proxies=None):
+        self.scores = {proxy: 1.0 for proxy in (proxies or [])}
+        self.cooldown_until = {}
+        self.lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.scores)
+
+    def choose(self):
+        """Pick a healthy proxy, weighted by score. None when no proxies are configured."""
+        if not self.scores:
+            return None
+        now = time.monotonic()
+        with self.lock:
+            healthy = [p for p in self.scores if self.cooldown_until.get(p, 0) <= now]
+            if not healthy:
+                # Everything is cooling down; fall back to the least bad proxy
+                return max(self.scores, key=self.scores.get)
+            weights = [max(self.scores[p], MIN_PROXY_SCORE) for p in healthy]
+            return random.choices(healthy, weights=weights)[0]
+
+    def report(self, proxy, ok):
+        if proxy is None:
+            return
+        with self.lock:
+            score = self.scores.get(proxy, 1.0)
+            if ok:
+                self.scores[proxy] = min(1.0, score + 0.1)
+                self.cooldown_until.pop(proxy, None)
+                return
+            score *= 0.5
+            self.scores[proxy] = score
+            if score < MIN_PROXY_SCORE:
+                logger.warning("Rotating out proxy %s (score %.2f)", proxy, score)
+                self.cooldown_until[proxy] = time.monotonic() + PROXY_COOLDOWN
+                # Give it a fresh start once the cooldown has passed
+                self.scores[proxy] = MIN_PROXY_SCORE
+
+    def snapshot(self):
+        with self.lock:
+            return {p: round(s, 2) for p, s in self.scores.items()}
+
+
+class SessionPool:
+    """One keep-alive requests.Session per host, shared by all scraper modules.
+
+    Every request first waits for the host's rate limiter and reports back
+    how the host answered, so throttling adapts in one place.
+
+    host_overrides sends a host's requests to another base URL (e.g. a
+    local stand-in server for the offline benchmarks) while pooling, rate
+    limiting and the Host header still use the original host.
+    """
+
+    def __init__(self, pool_sizes=None, proxies=None, cookie_file=None, host_overrides=None):
+        self.pool_sizes = dict(POOL_SIZES)
+        self.pool_sizes.update(pool_sizes or {})
+        self.proxies = ProxyPool(proxies)
+        self.host_overrides = {host: base.rstrip("/") for host, base in (host_overrides or {}).items()}
+        self.cookie_file = cookie_file
+        self.sessions = {}
+        self.request_counts = {}
+        self.lock = threading.Lock()
+
+        self.cookies = LWPCookieJar(cookie_file) if cookie_file else None
+        if self.cookies is not None and os.path.exists(cookie_file):
+            try:
+                self.cookies.load(ignore_discard=True)
+            except Exception as e:
+                logger.warning("Could not load cookies from %s: %s", cookie_file, e)
+
+    def session_for(self, host):
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                size = self.pool_sizes.get(host, DEFAULT_POOL_SIZE)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                if self.cookies is not None:
+                    session.cookies = self.cookies
+                self.sessions[host] = session
+                self.request_counts[host] = 0
+            return session
+
+    def get(self, url, **kwargs):
+        return self._request(url, kwargs)
+
+    def get_until(self, url, done, chunk_size=STREAM_CHUNK, **kwargs):
+        """GET url, reading the body only until done(chunk) returns True.
+
+        Returns a PartialResponse, which the caller must close().
+        """
+        kwargs["stream"] = True
+        return self._request(url, kwargs, lambda response: PartialResponse(response, done, chunk_size))
+
+    def _request(self, url, kwargs, read=None):
+        parts = urlparse(url)
+        host = parts.netloc
+        session = self.session_for(host)
+        if host in self.host_overrides:
+            url = self.host_overrides[host] + url[len(f"{parts.scheme}://{host}"):]
+            kwargs["headers"] = dict(kwargs.get("headers") or {}, Host=host)
+        proxy = self.proxies.choose()
+        if proxy:
+            kwargs["proxies"] = {"http": proxy, "https": proxy}
+
+        metrics.observe("rate_wait", rate_limiter.acquire(host))
+        with self.lock:
+            self.request_counts[host] += 1
+        metrics.count("requests")
+        try:
+            with metrics.timer("fetch"):
+                response = session.get(url, **kwargs)
+                if read is not None:
+                    response = read(response)
+        except RequestException:
+            metrics.count("request_errors")
+            self.proxies.report(proxy, False)
+            rate_limiter.record_error(host)
+            raise
+
+        blocked = is_blocked(response)
+        if blocked:
+            metrics.count("blocked")
+        self.proxies.report(proxy, not blocked)
+        rate_limiter.record(host, response.status_code, blocked, response.headers.get("Retry-After"))
+        return response
+
+    def save_cookies(self):
+        if self.cookies is None:
+            return
+        try:
+            self.cookies.save(ignore_discard=True)
+        except Exception as e:
+            logger.warning("Could not save cookies to %s: %s", self.cookie_file, e)
+
+    def stats(self):
+        """Per-host request, connection (handshake) and reuse counts"""
+        result = {}
+        with self.lock:
+            items = list(self.sessions.items())
+        for host, session in items:
+            connections = 0
+            for adapter in set(session.adapters.values()):
+                managers = [adapter.poolmanager] + list(adapter.proxy_manager.values())
+                for manager in managers:
+                    for key in manager.pools.keys():
+                        pool = manager.pools.get(key)
+                        if pool is not None:
+                            connections += pool.num_connections
+            requests_made = self.request_counts.get(host, 0)
+            result[host] = {
+                "requests": requests_made,
+                "connections": connections,
+                "reused": max(requests_made - connections, 0),
+            }
+        if self.proxies:
+            result["proxies"] = self.proxies.snapshot()
+        return result
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure(pool_sizes=None, proxies=None, cookie_file=None, host_overrides=None):
+    """Replace the shared pool, e.g. with proxies or a cookie file from the command line"""
+    global _pool
+    with _pool_lock:
+        _pool = SessionPool(pool_sizes, proxies, cookie_file, host_overrides)
+    return _pool
+
+
+def env_host_overrides():
+    """SCRAPER_HOST_OVERRIDES: comma-separated host=base_url pairs"""
+    overrides = {}
+    for item in os.environ.get("SCRAPER_HOST_OVERRIDES", "").split(","):
+        host, _, base = item.partition("=")
+        if host and base:
+            overrides[host.strip()] = base.strip()
+    return overrides
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            proxies = [p for p in os.environ.get("SCRAPER_PROXIES", "").split(",") if p]
+            _pool = SessionPool(proxies=proxies, cookie_file=os.environ.get("SCRAPER_COOKIE_FILE"),
+                                host_overrides=env_host_overrides())
+        return _pool
+
+
+def get(url, **kwargs):
+    return get_pool().get(url, **kwargs)
+
+
+def get_until(url, done, **kwargs):
+    return get_pool().get_until(url, done, **kwargs)
+
+
+def stats():
+    return get_pool().stats()
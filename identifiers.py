@@ -0,0 +1,51 @@
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qs, urlencode
+
+# Canonical forms of the keywords, ASINs and product URLs users pass in, so
+# that the same search or product is recognised however it was written.
+
+ASIN_RE = re.compile(r'^[A-Z0-9]{10}$')
+# /dp/<ASIN>, /gp/product/<ASIN>, /gp/aw/d/<ASIN> and /product/<ASIN> all name the same page
+AMAZON_PATH_ASIN_RE = re.compile(r'/(?:dp|gp/product|gp/aw/d|product)/([A-Za-z0-9]{10})(?:[/?#]|$)')
+FLIPKART_ITEM_RE = re.compile(r'/p/(itm[A-Za-z0-9]+)')
+
+def canonical_keyword(keyword):
+    """Search keyword with case and whitespace normalised (the sites ignore both)"""
+    return " ".join(keyword.lower().split())
+
+def amazon_asin(identifier):
+    """The ASIN a bare ASIN or Amazon product URL refers to, or None"""
+    identifier = identifier.strip()
+    if ASIN_RE.match(identifier):
+        return identifier
+    parts = urlsplit(identifier)
+    if 'amazon' not in parts.netloc and 'amzn' not in parts.netloc:
+        return None
+    match = AMAZON_PATH_ASIN_RE.search(parts.path)
+    return match.group(1).upper() if match else None
+
+def amazon_product_url(asin):
+    return f"https://www.amazon.in/dp/{asin}"
+
+def canonical_flipkart_url(url):
+    """Flipkart product URL without tracking parameters, on www.flipkart.com"""
+    url = url.strip()
+    parts = urlsplit(url)
+    if not parts.netloc.lower().endswith('flipkart.com'):
+        return url
+    path = parts.path
+    if path.startswith('/dl/'):
+        # Share links (dl.flipkart.com/dl/...) use the same path under /dl
+        path = path[3:]
+    pid = parse_qs(parts.query).get('pid')
+    query = urlencode({'pid': pid[0]}) if pid else ''
+    return urlunsplit(('https', 'www.flipkart.com', path.rstrip('/') or '/', query, ''))
+
+def flipkart_product_key(url):
+    """What identifies a Flipkart product page: its item id and pid (the slug before /p/ is free text)"""
+    canonical = canonical_flipkart_url(url)
+    parts = urlsplit(canonical)
+    match = FLIPKART_ITEM_RE.search(parts.path)
+    if match is None:
+        return canonical
+    return f"{match.group(1)}?{parts.query}" if parts.query else match.group(1)
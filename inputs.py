@@ -0,0 +1,65 @@
+import sys
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Keywords, ASINs and product URLs read one at a time from a file or stdin,
+# for jobs too big for a --keywords argument. Each line is either the item
+# itself or an NDJSON object naming it and, optionally, its own options:
+#
+#   wireless earbuds
+#   B0CHX1W1XY
+#   {"keyword": "usb c cable", "num_products": 60}
+#   {"url": "https://www.flipkart.com/x/p/itm123?pid=MOB123", "platform": "flipkart", "type": "product"}
+#
+# Blank lines and lines starting with # are skipped. Items are yielded as
+# they are read, so a job holds only the ones it is working on.
+
+ITEM_FIELDS = ("keyword", "asin", "url")
+ITEM_OPTIONS = ("platform", "type", "num_products", "plan_pages")
+
+class InputItem:
+    """A keyword, ASIN or URL, with the options it overrides (None when it has none)"""
+
+    __slots__ = ("keyword", "options")
+
+    def __init__(self, keyword, options=None):
+        self.keyword = keyword
+        self.options = options
+
+def parse_line(line, line_number=None):
+    """The InputItem on one input line, or None for blank, comment and unusable lines"""
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if not line.startswith("{"):
+        return InputItem(line)
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        logger.warning("Skipping invalid JSON on input line %s: %s", line_number, e)
+        return None
+    keyword = next((record[field] for field in ITEM_FIELDS if record.get(field)), None)
+    if not isinstance(keyword, str):
+        logger.warning("Skipping input line %s: it names no keyword, asin or url", line_number)
+        return None
+    unknown = set(record) - set(ITEM_FIELDS) - set(ITEM_OPTIONS)
+    if unknown:
+        logger.warning("Ignoring unknown options %s on input line %s", ', '.join(sorted(unknown)), line_number)
+    options = {option: record[option] for option in ITEM_OPTIONS if option in record}
+    return InputItem(keyword.strip(), options or None)
+
+def read_items(stream):
+    for line_number, line in enumerate(stream, 1):
+        item = parse_line(line, line_number)
+        if item is not None:
+            yield item
+
+def open_items(path):
+    """Yield the items of a file, or of stdin when path is '-'"""
+    if path == "-":
+        yield from read_items(sys.stdin)
+        return
+    with open(path, encoding="utf-8") as stream:
+        yield from read_items(stream)
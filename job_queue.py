@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ecommerce-scraper", "queue.sqlite3")
+DEFAULT_LEASE_SECONDS = 120  # an item not heartbeated for this long goes back to the queue
+DEFAULT_MAX_ATTEMPTS = 3  # deliveries before an item is given up as failed
+
+def queue_path(path=None):
+    return path or os.environ.get("SCRAPER_QUEUE", DEFAULT_QUEUE_PATH)
+
+def new_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+class JobQueue:
+    """Keywords to scrape, shared by a coordinator and any number of workers.
+
+    Backed by one SQLite file, so it needs nothing but a path every process
+    can open. A worker leases an item, heartbeats while it scrapes it and
+    acks it with the rows. A lease that is not heartbeated expires and the
+    item is delivered to the next worker that asks; only the current lease
+    holder can ack, so an item's rows are stored exactly once.
+
+    Workers on other hosts open the same file over a shared filesystem;
+    it must honour POSIX locks, which rules out most NFS setups.
+    """
+
+    def __init__(self, path=None):
+        self.path = path = queue_path(path)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, options TEXT, created_at REAL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT, keyword TEXT, "
+            "state TEXT DEFAULT 'pending', owner TEXT, lease_expires REAL, attempts INTEGER DEFAULT 0, "
+            "result TEXT, error TEXT, updated_at REAL, UNIQUE (job_id, keyword))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_state ON items (state, lease_expires)")
+
+    def _transaction(self, work):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can
+        # never both see an item as free and lease it
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work()
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+            return result
+
+    def enqueue(self, job_id, keywords, options):
+        """Add a job's keywords (any iterable); keywords already queued for the job are left alone"""
+        now = time.time()
+
+        def work():
+            self.db.execute("INSERT OR IGNORE INTO jobs VALUES (?, ?, ?)", (job_id, json.dumps(options), now))
+            self.db.executemany(
+                "INSERT OR IGNORE INTO items (job_id, keyword, updated_at) VALUES (?, ?, ?)",
+                ((job_id, keyword, now) for keyword in keywords),
+            )
+        self._transaction(work)
+
+    def options(self, job_id):
+        with self.lock:
+            row = self.db.execute("SELECT options FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def lease(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Lease the oldest free item: (item_id, job_id, keyword), or None when there is none.
+
+        Items whose lease expired are free again; one that has already been
+        delivered max_attempts times is marked failed instead.
+        """
+        def work():
+            now = time.time()
+            self.db.execute(
+                "UPDATE items SET state = 'failed', error = COALESCE(error, 'lease expired'), updated_at = ? "
+                "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, max_attempts),
+            )
+            row = self.db.execute(
+                "SELECT id, job_id, keyword, state FROM items "
+                "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            item_id, job_id, keyword, state = row
+            if state == "leased":
+                logger.warning("Redelivering '%s' (job %s): its lease expired", keyword, job_id)
+            self.db.execute(
+                "UPDATE items SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, item_id),
+            )
+            return item_id, job_id, keyword
+        return self._transaction(work)
+
+    def heartbeat(self, item_ids, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extend the leases this worker still holds; returns the ids it no longer owns"""
+        if not item_ids:
+            return []
+
+        def work():
+            now = time.time()
+            lost = []
+            for item_id in item_ids:
+                updated = self.db.execute(
+                    "UPDATE items SET lease_expires = ?, updated_at = ? "
+                    "WHERE id = ? AND owner = ? AND state = 'leased'",
+                    (now + lease_seconds, now, item_id, worker_id),
+                ).rowcount
+                if not updated:
+                    lost.append(item_id)
+            return lost
+        return self._transaction(work)
+
+    def ack(self, item_id, worker_id, result):
+        """Store an item's rows; False if the lease was lost and the rows were discarded"""
+        def work():
+            return self.db.execute(
+                "UPDATE items SET state = 'done', result = ?, error = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (json.dumps(result), time.time(), item_id, worker_id),
+            ).rowcount == 1
+        return self._transaction(work)
+
+    def fail(self, item_id, worker_id, error, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Give an item back after an error; it is retried until max_attempts deliveries"""
+        def work():
+            self.db.execute(
+                "UPDATE items SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "owner = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (max_attempts, str(error), time.time(), item_id, worker_id),
+            )
+        self._transaction(work)
+
+    def release(self, item_id, worker_id):
+        """Hand an unfinished item straight back without counting the attempt (e.g. on shutdown)"""
+        def work():
+            self.db.execute(
+                "UPDATE items SET state = 'pending', owner = NULL, lease_expires = NULL, "
+                "attempts = MAX(attempts - 1, 0), updated_at = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                (time.time(), item_id, worker_id),
+            )
+        self._transaction(work)
+
+    def counts(self, job_id):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT state, COUNT(*) FROM items WHERE job_id = ? GROUP BY state", (job_id,)
+            ).fetchall()
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        counts.update(dict(rows))
+        return counts
+
+    def has_work(self):
+        with self.lock:
+            row = self.db.execute("SELECT 1 FROM items WHERE state IN ('pending', 'leased') LIMIT 1").fetchone()
+        return row is not None
+
+    def items(self, job_id):
+        """(keyword, state, result, error) for every item of a job, in the order it was queued"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT keyword, state, result, error FROM items WHERE job_id = ? ORDER BY id", (job_id,)
+            ).fetchall()
+        return [(keyword, state, json.loads(result) if result else None, error)
+                for keyword, state, result, error in rows]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class LeaseKeeper:
+    """Background thread heartbeating the items a worker is busy with.
+
+    add() returns an Event that is set if the lease on that item is lost
+    (it expired and was redelivered), so the scrape can stop early.
+    """
+
+    def __init__(self, queue, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.queue = queue
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.active = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="lease-keeper", daemon=True)
+        self.thread.start()
+
+    def add(self, item_id):
+        lost = threading.Event()
+        with self.lock:
+            self.active[item_id] = lost
+        return lost
+
+    def remove(self, item_id):
+        with self.lock:
+            self.active.pop(item_id, None)
+
+    def run(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            with self.lock:
+                active = list(self.active)
+            try:
+                lost = self.queue.heartbeat(active, self.worker_id, self.lease_seconds)
+            except sqlite3.Error as e:
+                logger.warning("Heartbeat failed: %s", e)
+                continue
+            for item_id in lost:
+                logger.warning("Lost the lease on queue item %s; its result will be discarded", item_id)
+                with self.lock:
+                    event = self.active.get(item_id)
+                if event is not None:
+                    event.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import inputs
+import records
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ecommerce-scraper", "jobs")
+
+# Options a journaled run was started with; a resumed run reuses them so it
+# continues the same job rather than a slightly different one
+JOB_FIELDS = ["platform", "type", "num_products", "plan_pages"]
+
+def new_job_id():
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+
+def journal_path(job_id, directory=None):
+    directory = directory or os.environ.get("SCRAPER_JOURNAL_DIR", DEFAULT_JOURNAL_DIR)
+    return os.path.join(directory, f"{job_id}.ndjson")
+
+class JobJournal:
+    """Append-only NDJSON checkpoint journal for one scrape job.
+
+    Records, one JSON object per line:
+
+        {"event": "job", "job_id", "options", "keywords" | "input"}
+        {"event": "page", "keyword", "page", "next_url", "products"}
+        {"event": "done", "keyword", "result"?, "error"?}
+
+    Each record is flushed and fsynced before the scrape moves on, so after
+    a crash every page in the journal was fully fetched and extracted. A
+    line cut short by the crash is ignored when the journal is read back.
+
+    Products are stored in their records JSON view and read back as
+    records.Product.
+
+    Only where each keyword's records start in the file is kept in memory
+    (and the resume point of unfinished keywords), not the rows themselves,
+    so a journal of a very long job stays small in memory; rows and results
+    are read back from the file when they are replayed.
+    """
+
+    def __init__(self, job_id, directory=None):
+        self.job_id = job_id
+        self.path = journal_path(job_id, directory)
+        self.header = None
+        self.pages = {}     # keyword -> file offsets of its page records
+        self.progress = {}  # keyword -> (next URL, next page number, products so far)
+        self.done = {}      # keyword -> file offset of its done record
+        self.lock = threading.Lock()
+
+        needs_newline = False
+        if os.path.exists(self.path):
+            needs_newline = self._replay()
+        else:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, "ab")
+        if needs_newline:
+            # Terminate the torn last line so the next record starts clean
+            self.file.write(b"\n")
+        self.reader = open(self.path, "rb")
+
+    def _replay(self):
+        offset = 0
+        last = b""
+        with open(self.path, "rb") as f:
+            for line_number, line in enumerate(f, 1):
+                start, offset, last = offset, offset + len(line), line
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("Ignoring unreadable journal line %s in %s", line_number, self.path)
+                    continue
+                self._index(record, start)
+        return bool(last) and not last.endswith(b"\n")
+
+    def _index(self, record, offset):
+        event = record.get("event")
+        if event == "job":
+            self.header = record
+        elif event == "page":
+            keyword = record["keyword"]
+            self.pages.setdefault(keyword, []).append(offset)
+            found = self.progress.get(keyword, (None, None, 0))[2] + len(record["products"])
+            self.progress[keyword] = (record["next_url"], record["page"] + 1, found)
+        elif event == "done":
+            self.done[record["keyword"]] = offset
+
+    def _write(self, record):
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self.lock:
+            offset = self.file.tell()
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self._index(record, offset)
+
+    def _read(self, offset):
+        # Callers hold the lock
+        self.reader.seek(offset)
+        return json.loads(self.reader.readline())
+
+    def start(self, args, keywords, input_path=None):
+        """Write the job header (only for a new journal).
+
+        A job reading its keywords from an input file records the file's
+        path instead of the keywords, which are never all in memory.
+        """
+        if self.header is not None:
+            return
+        header = {
+            "event": "job",
+            "job_id": self.job_id,
+            "options": {field: getattr(args, field) for field in JOB_FIELDS},
+        }
+        if input_path is not None:
+            header["input"] = input_path
+        else:
+            header["keywords"] = list(keywords)
+        self._write(header)
+
+    def apply(self, args, input_path=None):
+        """Set the options the job was started with on args; returns its keywords.
+
+        A job started from an input file reads it again, from input_path if
+        given (e.g. '-' to have stdin piped in again) or the recorded path.
+        """
+        if self.header is None:
+            raise ValueError(f"Journal {self.path} has no job header")
+        for field, value in self.header["options"].items():
+            setattr(args, field, value)
+        if "input" in self.header:
+            return inputs.open_items(input_path or self.header["input"])
+        return self.header["keywords"]
+
+    def page(self, keyword, page, next_url, products):
+        self._write({"event": "page", "keyword": keyword, "page": page, "next_url": next_url,
+                     "products": records.to_json(products)})
+
+    def finish(self, keyword, result=None, error=None):
+        """Record a keyword as done, with its product info result or the error that makes retrying it pointless"""
+        record = {"event": "done", "keyword": keyword}
+        if result is not None:
+            record["result"] = records.to_json(result)
+        if error is not None:
+            record["error"] = error
+        self._write(record)
+
+    def is_done(self, keyword):
+        with self.lock:
+            return keyword in self.done
+
+    def result(self, keyword):
+        with self.lock:
+            offset = self.done.get(keyword)
+            return records.from_json(self._read(offset).get("result")) if offset is not None else None
+
+    def error(self, keyword):
+        """The error a keyword was finished with, or None"""
+        with self.lock:
+            offset = self.done.get(keyword)
+            return self._read(offset).get("error") if offset is not None else None
+
+    def rows(self, keyword):
+        """Rank rows already extracted for a keyword, in order"""
+        with self.lock:
+            return [records.from_json(product) for offset in self.pages.get(keyword, [])
+                    for product in self._read(offset)["products"]]
+
+    def resume_point(self, keyword):
+        """(next URL, next page number, products so far) after the last journaled page, or None"""
+        with self.lock:
+            return self.progress.get(keyword)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.reader.close()
+
+    def discard(self):
+        """Close the journal and delete it, once its job needs no resuming"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            logger.warning("Could not remove journal %s: %s", self.path, e)
+
+def open_journal(job_id, directory=None, must_exist=False):
+    if must_exist and not os.path.exists(journal_path(job_id, directory)):
+        raise ValueError(f"No journal for job {job_id} in {os.path.dirname(journal_path(job_id, directory))}")
+    return JobJournal(job_id, directory)
@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Logging setup for the scraper processes.
+#
+# The scrapers log with lazy %-formatting (logger.debug("... %s", value)),
+# so a record below the configured level costs one level check. Records
+# that pass go onto a queue unformatted; a listener thread formats them
+# and writes them to stderr, so the scraping threads never wait on the
+# pipe main.js reads. Formats:
+#
+#   text   LEVEL:logger:message, as logging.basicConfig writes it
+#   json   one object per line: {"ts", "level", "logger", "message", ...},
+#          plus any extra= fields and the formatted exception
+#
+# dump_html() saves the HTML of an element or page that could not be
+# extracted to a side directory instead of logging it. Dumps are sampled
+# (DUMP_SAMPLE of failures) and rate-limited (DUMP_PER_MINUTE), and the
+# HTML is only rendered for a failure that is going to be written. With no
+# dump directory configured nothing is dumped.
+
+DEFAULT_LEVEL = "WARNING"
+FORMATS = ["text", "json"]
+TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+DUMP_SAMPLE = 0.2
+DUMP_PER_MINUTE = 10
+
+# Attributes every LogRecord has; anything else on a record came from extra=
+RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock handler formats every record on the calling thread before
+    queueing it. Here only a traceback is rendered up front, so the record
+    does not keep the failed frames alive; message arguments are formatted
+    later and must not be changed after they are logged.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class HtmlDumper:
+    """Writes sampled, rate-limited HTML of failed extractions into a directory"""
+
+    def __init__(self, directory, sample=DUMP_SAMPLE, per_minute=DUMP_PER_MINUTE):
+        self.directory = directory
+        self.sample = sample
+        self.per_minute = per_minute
+        self.allowance = float(per_minute)
+        self.updated = time.monotonic()
+        self.written = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _take(self):
+        # Token bucket refilled at per_minute tokens a minute, holding at most per_minute
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.per_minute, self.allowance + (now - self.updated) * self.per_minute / 60)
+            self.updated = now
+            if self.allowance < 1:
+                return None
+            self.allowance -= 1
+            self.written += 1
+            return self.written
+
+    def dump(self, kind, render, node, **context):
+        if random.random() >= self.sample:
+            metrics.count("html_dumps_sampled_out")
+            return None
+        number = self._take()
+        if number is None:
+            metrics.count("html_dumps_rate_limited")
+            return None
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{number}-{kind}.html")
+        header = json.dumps(dict(context, kind=kind), default=str).replace("--", "- -")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"<!-- {header} -->\n")
+            f.write(render(node))
+        metrics.count("html_dumps")
+        logger.warning("Saved the HTML of a failed %s to %s", kind, path)
+        return path
+
+_listener = None
+_lock = threading.Lock()
+_dumper = None
+_settings = None
+
+def configure(level=None, fmt=None, dump_dir=None, dump_sample=None, dump_per_minute=None, stream=None):
+    """Route the root logger through a queue to a background writer, and set up HTML dumps.
+
+    Unset arguments come from SCRAPER_LOG_LEVEL, SCRAPER_LOG_FORMAT,
+    SCRAPER_DUMP_DIR, SCRAPER_DUMP_SAMPLE and SCRAPER_DUMP_PER_MINUTE.
+    """
+    global _listener, _settings
+    level = (level or os.environ.get("SCRAPER_LOG_LEVEL") or DEFAULT_LEVEL).upper()
+    fmt = fmt or os.environ.get("SCRAPER_LOG_FORMAT") or "text"
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown log format {fmt}; expected one of {', '.join(FORMATS)}")
+
+    shutdown()
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+    with _lock:
+        _listener = QueueListener(records, handler)
+        _listener.start()
+
+    dump_dir = dump_dir or os.environ.get("SCRAPER_DUMP_DIR")
+    if dump_sample is None:
+        dump_sample = float(os.environ.get("SCRAPER_DUMP_SAMPLE", DUMP_SAMPLE))
+    if dump_per_minute is None:
+        dump_per_minute = float(os.environ.get("SCRAPER_DUMP_PER_MINUTE", DUMP_PER_MINUTE))
+    configure_dumps(dump_dir, dump_sample, dump_per_minute)
+    _settings = (level, fmt, dump_dir, dump_sample, dump_per_minute)
+
+def settings():
+    """configure() arguments that reproduce this process's setup (e.g. in a parse worker), or None"""
+    return _settings
+
+def shutdown():
+    """Write out every queued record and stop the writer thread"""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.flush()
+
+atexit.register(shutdown)
+
+def configure_dumps(directory, sample=DUMP_SAMPLE, per_minute=DUMP_PER_MINUTE):
+    global _dumper
+    _dumper = HtmlDumper(directory, sample, per_minute) if directory else None
+
+def dump_html(kind, render, node, **context):
+    """Save render(node) for a failed extraction when sampling and the rate limit allow it.
+
+    Returns the file written, or None. context (e.g. the keyword or URL) is
+    written into the file as a comment.
+    """
+    dumper = _dumper
+    if dumper is None:
+        return None
+    try:
+        return dumper.dump(kind, render, node, **context)
+    except Exception as e:
+        logger.warning("Could not save the HTML of a failed %s: %r", kind, e)
+        return None
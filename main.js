@@ -1,9 +1,23 @@
 const { app, BrowserWindow, ipcMain, dialog } = require('electron');
+const fs = require('fs');
 const path = require('path');
 const { spawn } = require('child_process');
+const { FrameReader } = require('./protocol');
 
 let mainWindow;
 
+// A single long-lived Python worker (scraper_wrapper.py --worker) serves all
+// scrape and export jobs over JSON-RPC, so interpreter startup and imports
+// are paid once per app session instead of once per click.
+let worker = null;
+let nextRequestId = 1;
+let nextJobId = 1;
+const pendingRequests = new Map();  // JSON-RPC id -> { resolve, reject }
+const jobs = new Map();             // job id -> { onEvent, resolve, reject }
+const activeScrapes = new Map();    // tab type -> job id
+// How the worker frames its stdout: 'ndjson' (default) or 'msgpack'
+const protocol = process.env.SCRAPER_PROTOCOL || 'ndjson';
+
 function createWindow() {
     mainWindow = new BrowserWindow({
         width: 1200,
@@ -35,94 +49,193 @@ app.on('activate', () => {
     }
 });
 
-// Handle scraping requests
-ipcMain.handle('start-scraping', async (event, data) => {
-    const { type, keywords, numProducts } = data;
-    const pythonPath = path.join(__dirname, 'python');
-    
-    return new Promise((resolve, reject) => {
-        const scriptPath = path.join(pythonPath, 'scraper_wrapper.py');
-        const args = [
-            scriptPath,
-            '--keywords', keywords.join(','),
-            '--num_products', numProducts?.toString() || '30',
-            '--platform', type.includes('amazon') ? 'amazon' : 'flipkart',
-            '--type', type.includes('product') ? 'product' : 'rank'
-        ];
-
-        console.log('Starting Python process with args:', args);
-
-        const pythonProcess = spawn('python', args);
-        let allResults = [];
-
-        pythonProcess.stdout.on('data', (data) => {
-            try {
-                const lines = data.toString().trim().split('\n');
-                for (const line of lines) {
-                    if (!line.trim()) continue;
-                    
-                    const jsonData = JSON.parse(line);
-                    console.log('Received data from Python:', jsonData.type);
-                    
-                    switch(jsonData.type) {
-                        case 'progress':
-                            mainWindow.webContents.send('scraping-progress', {
-                                current: jsonData.current,
-                                total: jsonData.total,
-                                keyword: jsonData.keyword
-                            });
-                            break;
-                            
-                        case 'result':
-                            if (jsonData.data) {
-                                allResults = allResults.concat(
-                                    Array.isArray(jsonData.data) ? jsonData.data : [jsonData.data]
-                                );
-                                mainWindow.webContents.send('scraping-result', {
-                                    result: jsonData.data
-                                });
-                            }
-                            break;
-                            
-                        case 'complete':
-                            console.log('Scraping complete, total results:', allResults.length);
-                            resolve(allResults);
-                            break;
-                            
-                        case 'error':
-                            console.error('Python error:', jsonData.message);
-                            mainWindow.webContents.send('scraping-error', {
-                                message: jsonData.message,
-                                keyword: jsonData.keyword
-                            });
-                            break;
-                    }
-                }
-            } catch (e) {
-                console.error('Error parsing Python output:', e);
-                console.error('Raw output:', data.toString());
-            }
-        });
+app.on('will-quit', () => {
+    if (worker) {
+        // Closing stdin makes the worker cancel its jobs and exit
+        worker.stdin.end();
+    }
+});
+
+function getWorker() {
+    if (worker) {
+        return worker;
+    }
+
+    const scriptPath = path.join(__dirname, 'python', 'scraper_wrapper.py');
+    console.log('Starting Python worker:', scriptPath);
+    worker = spawn('python', [scriptPath, '--worker', '--protocol', protocol]);
 
-        pythonProcess.stderr.on('data', (data) => {
-            console.error(`Python Error: ${data}`);
+    const reader = new FrameReader(protocol, handleWorkerMessage, (message) => console.error(message));
+    worker.stdout.on('data', (chunk) => reader.push(chunk));
+    worker.stdout.on('end', () => reader.end());
+
+    worker.stderr.on('data', (data) => {
+        console.error(`Python Error: ${data}`);
+        if (mainWindow) {
             mainWindow.webContents.send('scraping-error', {
                 message: data.toString()
             });
+        }
+    });
+
+    worker.on('close', (code) => {
+        console.log(`Python worker exited with code ${code}`);
+        worker = null;
+        failAll(`Python worker exited with code ${code}`);
+    });
+
+    worker.on('error', (error) => {
+        console.error('Failed to start Python worker:', error);
+        worker = null;
+        failAll(error.message);
+    });
+
+    return worker;
+}
+
+function failAll(message) {
+    for (const pending of pendingRequests.values()) {
+        pending.reject(message);
+    }
+    pendingRequests.clear();
+    for (const job of jobs.values()) {
+        job.reject(message);
+    }
+    jobs.clear();
+}
+
+function handleWorkerMessage(message) {
+    if (message.jsonrpc) {
+        const pending = pendingRequests.get(message.id);
+        if (!pending) return;
+        pendingRequests.delete(message.id);
+        if (message.error) {
+            pending.reject(message.error.message);
+        } else {
+            pending.resolve(message.result);
+        }
+        return;
+    }
+
+    const job = jobs.get(message.job_id);
+    if (!job) return;
+
+    if (message.type === 'complete') {
+        // complete only carries counts and refs: the rows came in result events
+        jobs.delete(message.job_id);
+        job.resolve(message);
+    } else if (message.type === 'error' && !message.keyword) {
+        // An error without a keyword means the whole job failed
+        jobs.delete(message.job_id);
+        job.reject(message.message);
+    } else {
+        job.onEvent(message);
+    }
+}
+
+function callWorker(method, params) {
+    return new Promise((resolve, reject) => {
+        const id = nextRequestId++;
+        pendingRequests.set(id, { resolve, reject });
+        getWorker().stdin.write(JSON.stringify({ jsonrpc: '2.0', id, method, params }) + '\n');
+    });
+}
+
+function runJob(jobId, method, params, onEvent) {
+    return new Promise((resolve, reject) => {
+        jobs.set(jobId, { onEvent, resolve, reject });
+        callWorker(method, { ...params, job_id: jobId }).catch((error) => {
+            jobs.delete(jobId);
+            reject(error);
         });
+    });
+}
+
+function writeNdjson(filePath, rows) {
+    return new Promise((resolve, reject) => {
+        const stream = fs.createWriteStream(filePath, { encoding: 'utf8' });
+        stream.on('error', reject);
+        stream.on('finish', resolve);
 
-        pythonProcess.on('close', (code) => {
-            console.log(`Python process exited with code ${code}`);
-            if (code !== 0) {
-                reject(`Process exited with code ${code}`);
+        let index = 0;
+        const writeMore = () => {
+            while (index < rows.length) {
+                const ok = stream.write(JSON.stringify(rows[index++]) + '\n');
+                if (!ok) {
+                    stream.once('drain', writeMore);
+                    return;
+                }
             }
-        });
+            stream.end();
+        };
+        writeMore();
+    });
+}
+
+// Handle scraping requests
+ipcMain.handle('start-scraping', async (event, data) => {
+    const { type, keywords, numProducts } = data;
+    const jobId = `job-${nextJobId++}`;
+    const params = {
+        keywords: keywords,
+        num_products: numProducts || 30,
+        platform: type.includes('amazon') ? 'amazon' : 'flipkart',
+        type: type.includes('product') ? 'product' : 'rank'
+    };
+
+    console.log('Starting scraping job', jobId, 'with params:', params);
+
+    let allResults = [];
+    activeScrapes.set(type, jobId);
+
+    try {
+        await runJob(jobId, 'scrape', params, (jsonData) => {
+            console.log('Received data from Python:', jsonData.type);
 
-        pythonProcess.on('error', (error) => {
-            console.error('Failed to start Python process:', error);
-            reject(error.message);
+            switch(jsonData.type) {
+                case 'progress':
+                    mainWindow.webContents.send('scraping-progress', {
+                        current: jsonData.current,
+                        total: jsonData.total,
+                        keyword: jsonData.keyword
+                    });
+                    break;
+
+                case 'result':
+                    if (jsonData.data) {
+                        allResults = allResults.concat(
+                            Array.isArray(jsonData.data) ? jsonData.data : [jsonData.data]
+                        );
+                        mainWindow.webContents.send('scraping-result', {
+                            result: jsonData.data
+                        });
+                    }
+                    break;
+
+                case 'error':
+                    console.error('Python error:', jsonData.message);
+                    mainWindow.webContents.send('scraping-error', {
+                        message: jsonData.message,
+                        keyword: jsonData.keyword
+                    });
+                    break;
+            }
         });
-    });
+        console.log('Scraping complete, total results:', allResults.length);
+        return allResults;
+    } finally {
+        activeScrapes.delete(type);
+    }
+});
+
+// Cancel the running scrape of a tab; it stops before its next keyword
+ipcMain.handle('cancel-scraping', async (event, type) => {
+    const jobId = activeScrapes.get(type);
+    if (!jobId) {
+        return false;
+    }
+    const result = await callWorker('cancel', { job_id: jobId });
+    return result.cancelled;
 });
 
 // Handle export requests
@@ -141,41 +254,24 @@ ipcMain.handle('export-data', async (event, data) => {
 
         console.log('Exporting to:', filePath);
 
-        const pythonPath = path.join(__dirname, 'python', 'export_utils.py');
-        
-        return new Promise((resolve, reject) => {
-            const pythonProcess = spawn('python', [
-                pythonPath,
-                '--data', JSON.stringify(data.results),
-                '--output', filePath,
-                '--platform', data.platform
-            ]);
-
-            let errorOutput = '';
+        // Hand the rows to Python as an NDJSON file rather than one huge
+        // message, so the export can stream them in constant memory
+        const jobId = `job-${nextJobId++}`;
+        const inputPath = path.join(app.getPath('temp'), `scraper-export-${process.pid}-${jobId}.ndjson`);
+        await writeNdjson(inputPath, data.results);
 
-            pythonProcess.stdout.on('data', (data) => {
-                console.log('Export progress:', data.toString());
+        try {
+            await runJob(jobId, 'export', {
+                input: inputPath,
+                output: filePath,
+                platform: data.platform
+            }, (jsonData) => {
+                console.log('Export progress:', jsonData);
             });
-
-            pythonProcess.stderr.on('data', (data) => {
-                errorOutput += data.toString();
-                console.error('Export error:', data.toString());
-            });
-
-            pythonProcess.on('close', (code) => {
-                console.log(`Export process exited with code ${code}`);
-                if (code === 0) {
-                    resolve(true);
-                } else {
-                    reject(`Export failed: ${errorOutput}`);
-                }
-            });
-
-            pythonProcess.on('error', (error) => {
-                console.error('Failed to start export process:', error);
-                reject(error.message);
-            });
-        });
+        } finally {
+            fs.promises.unlink(inputPath).catch(() => {});
+        }
+        return true;
 
     } catch (error) {
         console.error('Export error:', error);
@@ -0,0 +1,137 @@
+import json
+import math
+import time
+import threading
+import contextvars
+from array import array
+from contextlib import contextmanager
+
+# Timings and counters for one unit of work (a keyword, or a whole run).
+#
+# The scraper modules call timer()/observe()/count() wherever time is spent;
+# the samples go to whichever Metrics the current context is collecting into
+# (see collect()), and are dropped when nothing is collecting. Stages used:
+#
+#   rate_wait   time spent waiting for the per-host rate limiter
+#   fetch       one HTTP request, from sending it to having the body
+#   parse       building a tree from the raw bytes
+#   extract     reading the product fields out of a tree
+#   export      writing rows into a workbook
+#
+# Threads started for a keyword must be given a copy of the context
+# (contextvars.copy_context().run) so their samples land in the same place.
+#
+# Samples are kept as arrays of doubles: a run's Metrics holds several per
+# keyword, which adds up over a job of hundreds of thousands of keywords.
+
+_current = contextvars.ContextVar("metrics", default=None)
+
+QUANTILES = (0.5, 0.95)
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(q * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+class Metrics:
+    def __init__(self):
+        self.samples = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.samples.setdefault(stage, array("d")).append(seconds)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, other):
+        """Add another Metrics (or its to_data() form) into this one"""
+        data = other.to_data() if isinstance(other, Metrics) else other
+        with self.lock:
+            for stage, values in data["samples"].items():
+                self.samples.setdefault(stage, array("d")).extend(values)
+            for name, amount in data["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_data(self):
+        """Raw samples as plain data, e.g. to send back from a parse worker"""
+        with self.lock:
+            return {
+                "samples": {stage: list(values) for stage, values in self.samples.items()},
+                "counters": dict(self.counters),
+            }
+
+    def summary(self):
+        """Per-stage count/total/p50/p95/max in milliseconds, plus counters"""
+        with self.lock:
+            stages = {}
+            for stage, values in self.samples.items():
+                ordered = sorted(values)
+                stages[stage] = {
+                    "count": len(ordered),
+                    "total_ms": round(sum(ordered) * 1000, 2),
+                    "p50_ms": round(percentile(ordered, 0.5) * 1000, 2),
+                    "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+                    "max_ms": round(ordered[-1] * 1000, 2),
+                }
+            return {"stages": stages, "counters": dict(self.counters)}
+
+    def prometheus(self, prefix="scraper"):
+        """Prometheus text exposition: a summary per stage and a counter per event"""
+        with self.lock:
+            lines = [f"# TYPE {prefix}_stage_seconds summary"]
+            for stage, values in sorted(self.samples.items()):
+                ordered = sorted(values)
+                for q in QUANTILES:
+                    lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} {percentile(ordered, q):.6f}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {sum(ordered):.6f}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {len(ordered)}')
+            lines.append(f"# TYPE {prefix}_events_total counter")
+            for name, amount in sorted(self.counters.items()):
+                lines.append(f'{prefix}_events_total{{event="{name}"}} {amount}')
+            return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write the metrics to path: Prometheus text for .prom/.txt, JSON otherwise"""
+        if path.endswith((".prom", ".txt")):
+            content = self.prometheus()
+        else:
+            content = json.dumps(self.summary(), indent=2)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+@contextmanager
+def collect(metrics=None):
+    """Send every sample recorded in this context to `metrics` (a new one by default)"""
+    metrics = metrics if metrics is not None else Metrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+def current():
+    return _current.get()
+
+def observe(stage, seconds):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.observe(stage, seconds)
+
+def count(name, amount=1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.count(name, amount)
+
+@contextmanager
+def timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
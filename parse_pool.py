@@ -0,0 +1,97 @@
+import os
+import logging
+import threading
+import logs
+import metrics
+import parsers
+
+logger = logging.getLogger(__name__)
+
+# Parsing and extracting a page is pure CPU work in BeautifulSoup/lxml and
+# holds the GIL, so threads cannot spread it over cores. With workers > 0
+# pages are parsed in separate processes instead: the raw response bytes go
+# to a worker and only the small product dicts come back. With 0 (the
+# default) pages are parsed in the calling thread, and multiprocessing is
+# never imported.
+
+_executor = None
+_workers = int(os.environ.get("SCRAPER_PARSE_WORKERS", "0"))
+_lock = threading.Lock()
+
+def _init_worker(backend, targeted, log_settings, log_disable):
+    parsers.set_backend(backend)
+    parsers.set_targeted(targeted)
+    if log_settings is not None:
+        logs.configure(*log_settings)
+    logging.disable(log_disable)
+
+def _call_collecting(func, args):
+    # The caller's metrics context does not exist in the worker process, so
+    # collect here and send the samples back with the result
+    with metrics.collect() as recorded:
+        result = func(*args)
+    return result, recorded.to_data()
+
+def configure(workers):
+    """Set the number of parse processes; 0 parses in the calling thread"""
+    global _workers
+    shutdown()
+    with _lock:
+        _workers = max(0, workers)
+
+def get_executor():
+    global _executor
+    if _workers <= 0:
+        return None
+    with _lock:
+        if _executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn rather than fork: the scrapers run on threads, and a
+            # forked child could inherit a lock some other thread was holding
+            _executor = ProcessPoolExecutor(
+                max_workers=_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(parsers.get_backend().name, parsers.is_targeted(), logs.settings(),
+                          logging.root.manager.disable),
+            )
+            logger.info("Started %s parse workers", _workers)
+        return _executor
+
+def run(func, *args):
+    """Call func(*args) in a parse worker, or right here when there is no pool.
+
+    func must be a module-level function, and its arguments and result must
+    be plain picklable data.
+    """
+    executor = get_executor()
+    if executor is None:
+        return func(*args)
+    from concurrent.futures.process import BrokenProcessPool
+    try:
+        result, recorded = executor.submit(_call_collecting, func, args).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool next
+        # time and parse this page here
+        logger.warning("Parse worker pool broke, restarting it")
+        _discard(executor)
+        return func(*args)
+    current = metrics.current()
+    if current is not None:
+        current.merge(recorded)
+    return result
+
+def _discard(executor):
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def shutdown():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
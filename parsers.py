@@ -0,0 +1,377 @@
+import os
+import logging
+import threading
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from lxml import etree
+    import lxml.html
+except ImportError:  # lxml is optional; BeautifulSoup's html.parser is the fallback
+    etree = None
+
+logger = logging.getLogger(__name__)
+
+# Bytes of a page handed to lxml at a time when parsing only targets
+FEED_SIZE = 64 * 1024
+
+# Small node API shared by all backends so the scraper modules can extract
+# fields without caring which HTML library built the tree:
+#
+#   parse(content)                      -> root node
+#   parse_targets(content, targets)     -> root holding only `targets` subtrees
+#   find(node, tag, cls, attrs)         -> first matching descendant or None
+#   find_all(node, tag, cls, attrs)     -> all matching descendants
+#   finder(tag, cls, attrs)             -> node -> first match or None, prepared once
+#   text(node) / stripped_text(node) / get(node, attr) / classes(node)
+#   html(node) / title(root)
+#   release(root)                       -> free a tree once nothing is read from it
+#
+# PageWatcher (lxml only) follows a page while it downloads instead, to
+# tell when the elements a scraper needs have all arrived.
+#
+# `cls` follows BeautifulSoup's class_ rules: a single class name matches any
+# element carrying that class, a space separated string must match the whole
+# class attribute. In `attrs` a value of True only checks the attribute exists.
+# `targets` is a list of (tag, cls, attrs) tuples using the same rules.
+
+def class_matches(value, cls):
+    if isinstance(value, (list, tuple)):
+        value = " ".join(value)
+    value = value or ""
+    if " " in cls.strip():
+        return " ".join(value.split()) == " ".join(cls.split())
+    return cls in value.split()
+
+def target_matcher(targets):
+    """Build a (name, attrs) -> bool predicate for a list of targets"""
+    def matches(name, attrs):
+        for tag, cls, target_attrs in targets:
+            if name != tag:
+                continue
+            if cls is not None and not class_matches(attrs.get("class"), cls):
+                continue
+            if target_attrs and not all(
+                attr in attrs if value is True else attrs.get(attr) == value
+                for attr, value in target_attrs.items()
+            ):
+                continue
+            return True
+        return False
+    return matches
+
+def xpath_conditions(cls, attrs):
+    """XPath predicates for the class and attribute rules of a target"""
+    conditions = []
+    if cls is not None:
+        if " " in cls.strip():
+            conditions.append(f"normalize-space(@class)='{' '.join(cls.split())}'")
+        else:
+            # The plain contains() is cheap and rules out most elements first
+            conditions.append(f"contains(@class, '{cls}')")
+            conditions.append(f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')")
+    for attr, value in sorted((attrs or {}).items()):
+        if value is True:
+            conditions.append(f"@{attr}")
+        else:
+            conditions.append(f"@{attr}='{value}'")
+    return conditions
+
+class TargetStrainer(SoupStrainer):
+    """SoupStrainer that only builds the elements matched by a target predicate"""
+
+    def __init__(self, matches):
+        super().__init__()
+        self.matches = matches
+
+    # bs4 >= 4.13
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return self.matches(name, attrs or {})
+
+    def allow_string_creation(self, string):
+        return False
+
+    # bs4 < 4.13
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        return markup_name if self.matches(markup_name, markup_attrs or {}) else None
+
+class BeautifulSoupBackend:
+    name = "bs4"
+
+    def __init__(self, features="html.parser"):
+        self.features = features
+
+    def parse(self, content):
+        return BeautifulSoup(content, self.features)
+
+    def parse_targets(self, content, targets):
+        return BeautifulSoup(content, self.features, parse_only=TargetStrainer(target_matcher(targets)))
+
+    def _kwargs(self, cls, attrs):
+        kwargs = {"attrs": dict(attrs or {})}
+        if cls is not None:
+            kwargs["class_"] = cls
+        return kwargs
+
+    def find(self, node, tag, cls=None, attrs=None):
+        return node.find(tag, **self._kwargs(cls, attrs))
+
+    def find_all(self, node, tag, cls=None, attrs=None):
+        return node.find_all(tag, **self._kwargs(cls, attrs))
+
+    def finder(self, tag, cls=None, attrs=None):
+        kwargs = self._kwargs(cls, attrs)
+        return lambda node: node.find(tag, **kwargs)
+
+    def text(self, node):
+        return node.text
+
+    def stripped_text(self, node):
+        return node.get_text(strip=True)
+
+    def get(self, node, attr, default=None):
+        return node.get(attr, default)
+
+    def classes(self, node):
+        return node.get("class", [])
+
+    def html(self, node):
+        return str(node)
+
+    def title(self, root):
+        return root.title.get_text() if root.title else None
+
+    def release(self, root):
+        # Tags link to their parents and siblings, so a soup is only freed by
+        # the cycle collector; decompose() breaks the links straight away
+        root.decompose()
+
+class LxmlBackend:
+    """lxml.html trees queried with XPath expressions compiled once and cached"""
+
+    name = "lxml"
+
+    def __init__(self):
+        # Compiled XPath objects and parsers are kept per thread; lxml does
+        # not allow sharing them between threads.
+        self._local = threading.local()
+
+    def parse(self, content):
+        if not content or not content.strip():
+            return lxml.html.fromstring("<html></html>")
+        if isinstance(content, bytes):
+            # Without a charset meta tag libxml2 assumes latin-1; both sites
+            # serve UTF-8, so use it whenever the bytes decode cleanly.
+            try:
+                content.decode("utf-8")
+            except UnicodeDecodeError:
+                return lxml.html.fromstring(content)
+            parser = getattr(self._local, "utf8_parser", None)
+            if parser is None:
+                parser = self._local.utf8_parser = lxml.html.HTMLParser(encoding="utf-8")
+            return lxml.html.fromstring(content, parser=parser)
+        return lxml.html.fromstring(content)
+
+    def parse_targets(self, content, targets):
+        # libxml2 still reads every tag, but the page is fed to it FEED_SIZE
+        # bytes at a time. After each piece the elements that have closed
+        # are searched for targets in C and dropped, so the tree never holds
+        # more than the targets, the elements still open and one piece.
+        if not content or not content.strip():
+            return lxml.html.fromstring("<html></html>")
+        encoding = None
+        if isinstance(content, bytes):
+            try:
+                content.decode("utf-8")
+                encoding = "utf-8"
+            except UnicodeDecodeError:
+                pass
+        key = ("targets", tuple((tag, cls, tuple(sorted((attrs or {}).items()))) for tag, cls, attrs in targets))
+        cache = self._local.__dict__.setdefault("compiled", {})
+        finders = cache.get(key)
+        if finders is None:
+            # Targets in the closed children of an element, and in all of them
+            finders = cache[key] = tuple(etree.XPath(" | ".join(
+                f"{children}/descendant-or-self::{tag}" + "".join(f"[{c}]" for c in xpath_conditions(cls, attrs))
+                for tag, cls, attrs in targets
+            )) for children in ("*[position() < last()]", "*"))
+        matches = target_matcher(targets)
+        result = lxml.html.Element("html")
+        parser = etree.HTMLPullParser(events=("start",), tag="html", encoding=encoding)
+        parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+        root = None
+
+        def prune(final):
+            # Every child but the last of an open element has closed; the
+            # last one is open too, unless the whole page has been fed
+            node = root
+            while node is not None and len(node) and (node is root or not matches(node.tag, node.attrib)):
+                for element in finders[final](node):
+                    # A target inside one already taken came along with it
+                    if element.getroottree().getroot() is not result:
+                        result.append(element)
+                if final:
+                    del node[:]
+                    node = None
+                else:
+                    del node[:-1]
+                    node = node[0] if len(node) else None
+
+        for start in range(0, len(content), FEED_SIZE):
+            parser.feed(content[start:start + FEED_SIZE])
+            if root is None:
+                for _, root in parser.read_events():
+                    break
+            if root is not None:
+                prune(False)
+        parser.close()
+        if root is not None:
+            prune(True)
+        return result
+
+    def _xpath(self, tag, cls, attrs, first, key=None):
+        key = key or (tag, cls, tuple(sorted((attrs or {}).items())), first)
+        cache = self._local.__dict__.setdefault("compiled", {})
+        compiled = cache.get(key)
+        if compiled is None:
+            path = f".//{tag}" + "".join(f"[{c}]" for c in xpath_conditions(cls, attrs))
+            if first:
+                path = f"({path})[1]"
+            compiled = etree.XPath(path)
+            cache[key] = compiled
+        return compiled
+
+    def find(self, node, tag, cls=None, attrs=None):
+        matches = self._xpath(tag, cls, attrs, True)(node)
+        return matches[0] if matches else None
+
+    def find_all(self, node, tag, cls=None, attrs=None):
+        return self._xpath(tag, cls, attrs, False)(node)
+
+    def finder(self, tag, cls=None, attrs=None):
+        # The XPath itself is still compiled per thread, on first use
+        key = (tag, cls, tuple(sorted((attrs or {}).items())), True)
+
+        def find(node):
+            matches = self._xpath(tag, cls, attrs, True, key)(node)
+            return matches[0] if matches else None
+        return find
+
+    def text(self, node):
+        return node.text_content()
+
+    def stripped_text(self, node):
+        return "".join(part.strip() for part in node.itertext())
+
+    def get(self, node, attr, default=None):
+        return node.get(attr, default)
+
+    def classes(self, node):
+        return node.get("class", "").split()
+
+    def html(self, node):
+        return lxml.html.tostring(node, encoding="unicode")
+
+    def title(self, root):
+        title = root.find(".//title")
+        return title.text_content() if title is not None else None
+
+    def release(self, root):
+        root.clear()
+
+class PageWatcher:
+    """Feeds a page to lxml's incremental HTML parser chunk by chunk and tells
+    when every group of targets has been seen.
+
+    `groups` is a list of target lists. A group is seen once an element
+    matching any of its targets has been closed, i.e. its whole content has
+    arrived. No tree is built: the parser only reports tags to the watcher.
+
+    `optional` groups are waited for only until an element matching one of
+    the `landmarks` targets opens: a page that reaches a later section
+    without them is taken not to have them.
+    """
+
+    def __init__(self, groups, optional=(), landmarks=()):
+        groups = list(groups) + list(optional)
+        self.matchers = [target_matcher(targets) for targets in groups]
+        self.landmark = target_matcher(landmarks) if landmarks else None
+        self.tags = {target[0] for targets in groups for target in targets}
+        self.tags.update(target[0] for target in landmarks)
+        self.required = set(range(len(groups) - len(optional)))
+        self.pending = set(range(len(groups)))
+        self.open = []  # per open element, the groups it matches (usually none)
+        self.parser = etree.HTMLParser(target=self)
+
+    def feed(self, chunk):
+        """Parse the next chunk; True once every group waited for has been seen"""
+        if self.pending:
+            self.parser.feed(chunk)
+        return not self.pending
+
+    # lxml parser target interface
+    def start(self, tag, attrib):
+        matched = None
+        if tag in self.tags:
+            if self.landmark is not None and self.landmark(tag, attrib):
+                # Optional groups not seen by now are not on the page
+                self.pending &= self.required
+                self.landmark = None
+            matched = [index for index in self.pending if self.matchers[index](tag, attrib)]
+        self.open.append(matched)
+
+    def end(self, tag):
+        if self.open:
+            matched = self.open.pop()
+            if matched:
+                self.pending.difference_update(matched)
+
+    def data(self, data):
+        pass
+
+    def close(self):
+        return not self.pending
+
+def can_watch():
+    return etree is not None
+
+BACKENDS = {"bs4": BeautifulSoupBackend}
+if etree is not None:
+    BACKENDS["lxml"] = LxmlBackend
+
+DEFAULT_BACKEND = "lxml" if etree is not None else "bs4"
+
+_backends = {}
+_default = os.environ.get("SCRAPER_PARSER", DEFAULT_BACKEND)
+_targeted = True
+
+def set_backend(name):
+    global _default
+    if name not in BACKENDS:
+        logger.warning("Parser backend '%s' is not available, using bs4", name)
+        name = "bs4"
+    _default = name
+
+def set_targeted(enabled):
+    """Turn targeted parsing of search pages on or off (on by default)"""
+    global _targeted
+    _targeted = enabled
+
+def is_targeted():
+    return _targeted
+
+def parse_search_page(content, targets):
+    """Parse a search page, materializing only `targets` when targeted parsing is on"""
+    backend = get_backend()
+    if _targeted:
+        return backend.parse_targets(content, targets)
+    return backend.parse(content)
+
+def get_backend(name=None):
+    name = name or _default
+    if name not in BACKENDS:
+        name = "bs4"
+    backend = _backends.get(name)
+    if backend is None:
+        backend = BACKENDS[name]()
+        _backends[name] = backend
+    return backend
@@ -2,6 +2,7 @@ const { contextBridge, ipcRenderer } = require('electron');
 
 contextBridge.exposeInMainWorld('electronAPI', {
     startScraping: (data) => ipcRenderer.invoke('start-scraping', data),
+    cancelScraping: (type) => ipcRenderer.invoke('cancel-scraping', type),
     exportData: (data) => ipcRenderer.invoke('export-data', data),
     onScrapingProgress: (callback) => {
         // Remove any existing listeners
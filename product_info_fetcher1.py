@@ -1,10 +1,19 @@
-import requests
-from bs4 import BeautifulSoup
+import os
 import logging
 import re
 import random
-import time
+from urllib.parse import urlsplit
 from requests.exceptions import RequestException, HTTPError
+import coalesce
+import extraction
+import http_cache
+import http_session
+import identifiers
+import logs
+import metrics
+import parse_pool
+import parsers
+import records
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +26,71 @@ USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36 Edg/91.0.864.54"
 ]
 
+def bought_last_month(backend, node):
+    bought_text = backend.text(node).strip()
+    if "bought in past month" in bought_text.lower():
+        bought_match = re.search(r'(\d+K?\+?)', bought_text)
+        if bought_match:
+            return bought_match.group(1)
+    return None
+
+AMAZON_PRODUCT_SCHEMA = extraction.Schema("amazon_product", {
+    "title": extraction.Field([("span", None, {"id": "productTitle"})]),
+    "price": extraction.Field([("span", "a-price-whole")]),
+    "rating": extraction.Field([("span", "a-icon-alt")], extraction.first_word),
+    "reviews": extraction.Field([("span", None, {"id": "acrCustomerReviewText"})], extraction.first_word),
+    "bought_last_month": extraction.Field([("span", "social-proofing-faceout-title-text")], bought_last_month),
+})
+
+# Amazon product pages run to megabytes, but everything read from them
+# comes well before the end. With streaming on, a page is followed by an
+# incremental parser while it downloads and the download stops once one
+# element of each required field has arrived whole, along with the optional
+# blocks (bought last month, the stock span, the bestseller ranks) or else
+# the customer reviews section that follows them: many pages have no
+# social proof or ranks and should not be read to the end looking for them.
+# Only a prefix that parses to a missing required field is read in full.
+REQUIRED_FIELDS = ("title", "price", "rating", "reviews")
+
+def _field_targets(name):
+    return [(selector.tag, selector.cls, selector.attrs)
+            for selector in AMAZON_PRODUCT_SCHEMA.fields[name].selectors]
+
+AMAZON_PRODUCT_TARGETS = [_field_targets(name) for name in REQUIRED_FIELDS]
+
+AMAZON_OPTIONAL_TARGETS = [
+    _field_targets("bought_last_month"),
+    [("span", "a-size-medium a-color-success", None)],
+    [("div", None, {"id": "detailBulletsWrapper_feature_div"}),
+     ("table", None, {"id": "productDetails_detailBullets_sections1"})],
+]
+
+AMAZON_LANDMARK_TARGETS = [
+    ("div", None, {"id": "customer-reviews_feature_div"}),
+    ("div", None, {"id": "reviewsMedley"}),
+    ("div", None, {"id": "customerReviews"}),
+]
+
+def amazon_product_watcher():
+    return parsers.PageWatcher(AMAZON_PRODUCT_TARGETS, AMAZON_OPTIONAL_TARGETS, AMAZON_LANDMARK_TARGETS)
+
+_streaming = os.environ.get("SCRAPER_STREAM_PAGES") is not None
+
+def set_streaming(enabled):
+    """Turn early-abort streaming of Amazon product pages on or off (off by default)"""
+    global _streaming
+    if enabled and not parsers.can_watch():
+        logger.warning("Streaming product pages needs lxml; downloading them in full")
+        enabled = False
+    _streaming = enabled
+
+FLIPKART_PRODUCT_SCHEMA = extraction.Schema("flipkart_product", {
+    "title": extraction.Field([("span", "VU-ZEz")]),
+    "price": extraction.Field([("div", "Nx9bqj CxhGGd")]),
+    "rating": extraction.Field([("div", "XQDdHH")]),
+    "reviews": extraction.Field([("span", "Wphh3N")], extraction.first_word),
+})
+
 def get_random_headers():
     return {
         "User-Agent": random.choice(USER_AGENTS),
@@ -28,166 +102,220 @@ def get_random_headers():
         "Cache-Control": "max-age=0",
     }
 
-def fetch_with_retries(url, max_retries=3, initial_delay=5):
+def fetch_with_retries(url, max_retries=3, watch=None):
+    """The response for url, from the cache or the network.
+
+    With watch (a function returning a fresh parsers.PageWatcher per
+    attempt) the body is streamed only until the watcher has seen all its
+    targets, and a http_session.PartialResponse comes back unless the page
+    was cached. Only complete bodies are cached.
+
+    An Access Denied page is retried like a 503; when every attempt is
+    denied http_session.BlockedError is raised, so the product counts as
+    not fetched rather than as a product with no fields.
+    """
+    cached = http_cache.get(url)
+    if cached is not None:
+        logger.info("Using cached response for %s", url)
+        return cached
+
     for attempt in range(max_retries):
+        if attempt:
+            metrics.count("retries")
+        response = None
         try:
+            # Pacing and backoff between attempts come from the per-host rate limiter
             headers = get_random_headers()
-            
-            # Add a random wait time before each request
-            wait_time = random.uniform(1, 1.2)  # Random wait between 1 to 3 seconds
-            logger.info(f"Waiting for {wait_time:.2f} seconds before making a request...")
-            time.sleep(wait_time)
-            
-            response = requests.get(url, headers=headers, timeout=10)
+            if watch is None:
+                response = http_session.get(url, headers=headers, timeout=10)
+            else:
+                response = http_session.get_until(url, watch().feed, headers=headers, timeout=10)
             response.raise_for_status()
-            return response
+            if not http_session.is_blocked(response):
+                if getattr(response, "complete", True):
+                    http_cache.put(url, response)
+                return response
+            response.close()
+            logger.warning("Access denied for %s (attempt %s of %s)", url, attempt + 1, max_retries)
         except HTTPError as http_err:
+            # A streamed response still holds its connection until it is closed
+            response.close()
             if response.status_code == 503 and attempt < max_retries - 1:
-                delay = initial_delay * (2 ** attempt)  # Exponential backoff
-                logger.warning(f"503 error encountered. Retrying in {delay} seconds...")
-                time.sleep(delay)
+                logger.warning("503 error encountered. Retrying (attempt %s of %s)...", attempt + 2, max_retries)
             else:
-                logger.error(f"HTTP error occurred: {http_err}")
+                logger.error("HTTP error occurred: %s", http_err)
                 raise
         except RequestException as e:
-            logger.error(f"An error occurred while fetching data: {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(initial_delay)
-            else:
+            if response is not None:
+                response.close()
+            logger.error("An error occurred while fetching data: %s", e)
+            if attempt == max_retries - 1:
                 raise
 
+    raise http_session.BlockedError(f"Access denied for {url}")
+
 def fetch_amazon_product_info(identifier):
+    """Product info for an ASIN or Amazon product URL, or None if it could not be fetched.
+
+    Every way of writing the same ASIN shares one fetch per run; callers
+    get their own copy of the info, a records.Product.
+    """
     try:
-        soup = fetch_amazon_data(identifier)
-        return process_amazon_data(soup, identifier)
+        asin = identifiers.amazon_asin(identifier) or identifier
+        info = coalesce.do(("amazon_product", asin), lambda: load_amazon_product(identifier, asin))
+        return info.copy() if info is not None else None
     except Exception as e:
-        logger.error(f"Error fetching Amazon product info: {str(e)}")
+        logger.error("Error fetching Amazon product info: %s", e)
         return None
 
+def load_amazon_product(identifier, asin):
+    if not _streaming:
+        return parse_pool.run(parse_amazon_product, fetch_amazon_data(identifier), asin)
+
+    url = amazon_url(identifier)
+    response = fetch_with_retries(url, watch=amazon_product_watcher)
+    if getattr(response, "complete", True):
+        return parse_pool.run(parse_amazon_product, response.content, asin)
+    try:
+        info = parse_pool.run(parse_amazon_product, response.content, asin)
+        if info is None or any(getattr(info, field) is None for field in REQUIRED_FIELDS):
+            # A required field is not in the prefix; read the rest of the page
+            info = parse_pool.run(parse_amazon_product, response.read_rest(), asin)
+            http_cache.put(url, response)
+        return info
+    finally:
+        response.close()
+
+def amazon_url(identifier):
+    asin = identifiers.amazon_asin(identifier)
+    if asin is not None:
+        return identifiers.amazon_product_url(asin)
+    if 'amazon.in' in identifier:
+        return identifier
+    raise ValueError(f"Invalid Amazon URL or ASIN: {identifier}")
+
+def flipkart_url(identifier):
+    url = identifiers.canonical_flipkart_url(identifier)
+    parts = urlsplit(url)
+    if parts.scheme in ('http', 'https') and parts.netloc:
+        return url
+    raise ValueError(f"Invalid Flipkart URL: {identifier}")
+
 def fetch_amazon_data(identifier):
-    if re.match(r'^[A-Z0-9]{10}$', identifier):
-        url = f"https://www.amazon.in/dp/{identifier}"
-    elif 'amazon.in' in identifier:
-        url = identifier
-    else:
-        raise ValueError(f"Invalid Amazon URL or ASIN: {identifier}")
+    return fetch_with_retries(amazon_url(identifier)).content
 
-    response = fetch_with_retries(url)
-    return BeautifulSoup(response.content, 'html.parser')
+def parse_amazon_product(content, identifier):
+    """Parse a raw product page into its info dict (runs in a parse_pool worker when one is set up)"""
+    metrics.count("pages")
+    with metrics.timer("parse"):
+        soup = parsers.get_backend().parse(content)
+    try:
+        with metrics.timer("extract"):
+            return process_amazon_data(soup, identifier)
+    finally:
+        parsers.get_backend().release(soup)
 
 def process_amazon_data(soup, identifier):
+    backend = parsers.get_backend()
     try:
-        title_elem = soup.find("span", {"id": "productTitle"})
-        title = title_elem.text.strip() if title_elem else "N/A"
-        
-        price_elem = soup.find("span", {"class": "a-price-whole"})
-        price = price_elem.text.strip() if price_elem else "N/A"
-        
-        rating_elem = soup.find("span", {"class": "a-icon-alt"})
-        rating = rating_elem.text.split()[0] if rating_elem else "N/A"
-        
-        reviews_elem = soup.find("span", {"id": "acrCustomerReviewText"})
-        reviews = reviews_elem.text.split()[0] if reviews_elem else "N/A"
+        with AMAZON_PRODUCT_SCHEMA.page() as page:
+            fields = page.extract(soup)
 
         stock_status = check_stock_availability(soup)
 
-        # Add bought last month detection
-        bought_last_month = "N/A"
-        bought_elem = soup.find("span", {"class": "social-proofing-faceout-title-text"})
-        if bought_elem:
-            bought_text = bought_elem.text.strip()
-            if "bought in past month" in bought_text.lower():
-                bought_match = re.search(r'(\d+K?\+?)', bought_text)
-                if bought_match:
-                    bought_last_month = bought_match.group(1)
-
         bestseller_ranks = []
-        rank_elem = soup.find("div", {"id": "detailBulletsWrapper_feature_div"})
-        if rank_elem:
-            rank_items = rank_elem.find_all("span", {"class": "a-list-item"})
+        rank_elem = backend.find(soup, "div", attrs={"id": "detailBulletsWrapper_feature_div"})
+        if rank_elem is not None:
+            rank_items = backend.find_all(rank_elem, "span", "a-list-item")
             for item in rank_items:
-                if "Best Sellers Rank" in item.text:
-                    rank_text = item.text.strip()
+                item_text = backend.text(item)
+                if "Best Sellers Rank" in item_text:
+                    rank_text = item_text.strip()
                     ranks = re.findall(r'#([\d,]+) in ([^(#]+)', rank_text)
                     for rank, category in ranks:
                         bestseller_ranks.append(f"#{rank.replace(',', '')} in {category.strip()}")
 
         if not bestseller_ranks:
-            rank_table = soup.find("table", {"id": "productDetails_detailBullets_sections1"})
-            if rank_table:
-                rank_rows = rank_table.find_all("tr")
+            rank_table = backend.find(soup, "table", attrs={"id": "productDetails_detailBullets_sections1"})
+            if rank_table is not None:
+                rank_rows = backend.find_all(rank_table, "tr")
                 for row in rank_rows:
-                    if "Best Sellers Rank" in row.text:
-                        rank_text = row.find("td", {"class": "a-size-base"}).text.strip()
+                    if "Best Sellers Rank" in backend.text(row):
+                        rank_text = backend.text(backend.find(row, "td", "a-size-base")).strip()
                         ranks = re.findall(r'#([\d,]+) in ([^(#]+)', rank_text)
                         for rank, category in ranks:
                             bestseller_ranks.append(f"#{rank.replace(',', '')} in {category.strip()}")
 
         asin = identifier if not identifier.startswith('http') else re.search(r'/dp/([A-Z0-9]{10})', identifier).group(1)
 
-        return {
-            "ASIN": asin,
-            "title": title,
-            "price": price,
-            "rating": rating,
-            "reviews": reviews,
-            "link": f"https://www.amazon.in/dp/{asin}",
-            "BestSeller": " | ".join(bestseller_ranks) if bestseller_ranks else "N/A",
-            "In Stock": stock_status,
-            "bought_last_month": bought_last_month
-        }
+        return records.Product(
+            "amazon",
+            product_id=asin,
+            title=fields["title"],
+            price=fields["price"],
+            rating=fields["rating"],
+            reviews=fields["reviews"],
+            link=f"https://www.amazon.in/dp/{asin}",
+            bestseller=" | ".join(bestseller_ranks) if bestseller_ranks else None,
+            in_stock=stock_status,
+            bought_last_month=fields["bought_last_month"],
+        )
     except Exception as e:
-        logger.error(f"Error processing Amazon product data: {str(e)}")
+        logger.error("Error processing Amazon product data for %s: %r", identifier, e)
+        logs.dump_html("amazon_product", backend.html, soup, identifier=identifier)
         return None
 
 def fetch_flipkart_product_info(url):
+    """Product info for a Flipkart product URL, or None if it could not be fetched.
+
+    URLs of the same product that differ only in slug, host or tracking
+    parameters share one fetch per run. Callers get their own copy of the
+    info, a records.Product.
+    """
     try:
-        soup = fetch_flipkart_data(url)
-        return process_flipkart_data(soup, url)
+        url = flipkart_url(url)
+        info = coalesce.do(("flipkart_product", identifiers.flipkart_product_key(url)),
+                           lambda: parse_pool.run(parse_flipkart_product, fetch_flipkart_data(url), url))
+        return info.copy() if info is not None else None
     except Exception as e:
-        logger.error(f"Error fetching Flipkart product info: {str(e)}")
+        logger.error("Error fetching Flipkart product info: %s", e)
         return None
 
 def fetch_flipkart_data(url):
-    response = fetch_with_retries(url)
-    return BeautifulSoup(response.content, 'lxml')
+    return fetch_with_retries(url).content
+
+def parse_flipkart_product(content, url):
+    """Parse a raw product page into its info dict (runs in a parse_pool worker when one is set up)"""
+    metrics.count("pages")
+    with metrics.timer("parse"):
+        soup = parsers.get_backend().parse(content)
+    try:
+        with metrics.timer("extract"):
+            return process_flipkart_data(soup, url)
+    finally:
+        parsers.get_backend().release(soup)
 
 def process_flipkart_data(soup, url):
+    backend = parsers.get_backend()
     try:
-        title_elem = soup.find('span', class_='VU-ZEz')
-        title = title_elem.text.strip() if title_elem else 'N/A'
-        price_elem = soup.find('div', class_='Nx9bqj CxhGGd')
-        price = price_elem.text.strip() if price_elem else 'N/A'
-        rating_elem = soup.find('div', class_='XQDdHH')
-        rating = rating_elem.text.strip() if rating_elem else 'N/A'
-        reviews_elem = soup.find('span', class_='Wphh3N')
-        reviews = reviews_elem.text.strip() if reviews_elem else 'N/A'
-
-        if reviews != 'N/A':
-            reviews = reviews.split()[0]
-
-        return {
-            "link": url,
-            "title": title,
-            "price": price,
-            "rating": rating,
-            "reviews": reviews,
-        }
+        with FLIPKART_PRODUCT_SCHEMA.page() as page:
+            fields = page.extract(soup)
+        return records.Product("flipkart", link=url, **fields)
     except Exception as e:
-        logger.error(f"Error processing Flipkart product data: {str(e)}")
+        logger.error("Error processing Flipkart product data for %s: %r", url, e)
+        logs.dump_html("flipkart_product", backend.html, soup, url=url)
         return None
 
 def check_stock_availability(soup):
+    backend = parsers.get_backend()
     try:
-        stock_elem = soup.find("span", {"class": "a-size-medium a-color-success"})
-        if stock_elem and "In stock" in stock_elem.text:
+        stock_elem = backend.find(soup, "span", "a-size-medium a-color-success")
+        stock_text = backend.text(stock_elem) if stock_elem is not None else ""
+        if "In stock" in stock_text:
             return "Yes"
-        if stock_elem and "Currently unavailable" in stock_elem.text:
+        if "Currently unavailable" in stock_text:
             return "No"
         return "Unknown"
     except Exception as e:
-        logger.error(f"Error checking stock availability: {str(e)}")
+        logger.error("Error checking stock availability: %s", e)
         return "Unknown"
-
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
\ No newline at end of file
@@ -0,0 +1,126 @@
+// Reassembles the frames scraper_wrapper.py writes on stdout (see protocol.py).
+//
+// stdout arrives in arbitrary chunks: a chunk can hold several frames, end
+// in the middle of one, or split a multi-byte UTF-8 character. FrameReader
+// keeps the unfinished tail of the stream and only decodes complete frames:
+//
+//   ndjson    one JSON object per line
+//   msgpack   4-byte big-endian length, then a msgpack body
+//             (needs the optional @msgpack/msgpack package)
+//
+// Pending chunks are joined once, when their frame is complete, so a
+// multi-megabyte line costs one copy rather than one per chunk.
+
+const FORMATS = ['ndjson', 'msgpack'];
+const LENGTH_BYTES = 4;
+const NEWLINE = 0x0a;
+
+function loadMsgpack() {
+    try {
+        return require('@msgpack/msgpack').decode;
+    } catch (e) {
+        throw new Error('The msgpack protocol needs the @msgpack/msgpack package (npm install @msgpack/msgpack)');
+    }
+}
+
+class FrameReader {
+    constructor(format, onMessage, onError = console.error) {
+        if (!FORMATS.includes(format)) {
+            throw new Error(`Unknown protocol ${format}; expected one of ${FORMATS.join(', ')}`);
+        }
+        this.format = format;
+        this.onMessage = onMessage;
+        this.onError = onError;
+        this.decode = format === 'msgpack' ? loadMsgpack() : null;
+        this.pending = [];      // chunks of the frame being received
+        this.pendingBytes = 0;
+        this.needed = 0;        // bytes the pending msgpack frame needs, once its length is known
+    }
+
+    push(chunk) {
+        if (this.format === 'msgpack') {
+            this.pushFramed(chunk);
+        } else {
+            this.pushLines(chunk);
+        }
+    }
+
+    take(chunk) {
+        // The pending chunks plus `chunk` as one buffer, clearing the pending list
+        const parts = this.pending.length ? [...this.pending, chunk] : null;
+        const whole = parts ? Buffer.concat(parts, this.pendingBytes + chunk.length) : chunk;
+        this.pending = [];
+        this.pendingBytes = 0;
+        return whole;
+    }
+
+    keep(chunk) {
+        if (chunk.length) {
+            this.pending.push(chunk);
+            this.pendingBytes += chunk.length;
+        }
+    }
+
+    pushLines(chunk) {
+        let start = 0;
+        let end;
+        while ((end = chunk.indexOf(NEWLINE, start)) !== -1) {
+            this.emitLine(this.take(chunk.subarray(start, end)));
+            start = end + 1;
+        }
+        this.keep(chunk.subarray(start));
+    }
+
+    pushFramed(chunk) {
+        if (this.pendingBytes + chunk.length < this.needed) {
+            this.keep(chunk);
+            return;
+        }
+        let buffer = this.take(chunk);
+        this.needed = 0;
+        while (buffer.length >= LENGTH_BYTES) {
+            const size = buffer.readUInt32BE(0);
+            if (buffer.length < LENGTH_BYTES + size) {
+                this.needed = LENGTH_BYTES + size;
+                break;
+            }
+            const body = buffer.subarray(LENGTH_BYTES, LENGTH_BYTES + size);
+            buffer = buffer.subarray(LENGTH_BYTES + size);
+            let message;
+            try {
+                message = this.decode(body);
+            } catch (e) {
+                this.onError(`Could not decode a ${size}-byte frame from Python: ${e.message}`);
+                continue;
+            }
+            this.onMessage(message);
+        }
+        this.keep(buffer);
+    }
+
+    emitLine(line) {
+        const text = line.toString('utf8').trim();
+        if (!text) return;
+        let message;
+        try {
+            message = JSON.parse(text);
+        } catch (e) {
+            this.onError(`Error parsing Python output: ${e.message}; raw output: ${text.slice(0, 200)}`);
+            return;
+        }
+        this.onMessage(message);
+    }
+
+    end() {
+        // A last line without a trailing newline is still a whole message
+        if (this.format === 'ndjson' && this.pendingBytes) {
+            this.emitLine(this.take(Buffer.alloc(0)));
+        } else if (this.pendingBytes) {
+            this.onError(`Python output ended inside a frame (${this.pendingBytes} bytes dropped)`);
+            this.pending = [];
+            this.pendingBytes = 0;
+        }
+    }
+}
+
+module.exports = { FrameReader, FORMATS };
@@ -0,0 +1,62 @@
+import sys
+import json
+import struct
+import threading
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; NDJSON needs nothing extra
+    msgpack = None
+
+# How events and replies are framed on stdout for main.js (see protocol.js):
+#
+#   ndjson    one compact JSON object per line. json.dumps escapes control
+#             characters inside strings, so a newline only ever ends a frame.
+#   msgpack   a 4-byte big-endian body length, then the msgpack body. More
+#             compact for big result batches; needs the msgpack package.
+#
+# Every frame goes out in a single write under a lock, so events emitted
+# from several scraping threads never interleave.
+
+FORMATS = ("ndjson", "msgpack")
+LENGTH = struct.Struct(">I")
+
+class FrameWriter:
+    def __init__(self, stream=None, format="ndjson"):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown protocol {format}; expected one of {', '.join(FORMATS)}")
+        if format == "msgpack" and msgpack is None:
+            raise ValueError("The msgpack protocol needs the msgpack package (pip install msgpack)")
+        self.stream = stream if stream is not None else sys.stdout.buffer
+        self.format = format
+        self.lock = threading.Lock()
+
+    def encode(self, message):
+        if self.format == "msgpack":
+            body = msgpack.packb(message, use_bin_type=True)
+            return LENGTH.pack(len(body)) + body
+        return json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n"
+
+    def write(self, message):
+        frame = self.encode(message)
+        with self.lock:
+            self.stream.write(frame)
+            self.stream.flush()
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def configure(format="ndjson", stream=None):
+    global _writer
+    with _writer_lock:
+        _writer = FrameWriter(stream, format)
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = FrameWriter()
+        return _writer
+
+def write(message):
+    get_writer().write(message)
@@ -0,0 +1,139 @@
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+# Starting, lowest and highest request rates (requests per second) per host.
+# Hosts that are not listed use DEFAULT_LIMITS.
+HOST_LIMITS = {
+    "www.amazon.in": {"rate": 0.5, "min_rate": 0.05, "max_rate": 4.0},
+    "www.flipkart.com": {"rate": 0.2, "min_rate": 0.03, "max_rate": 2.0},
+}
+DEFAULT_LIMITS = {"rate": 1.0, "min_rate": 0.05, "max_rate": 10.0}
+
+INCREASE_STEP = 0.05  # requests/second added after each successful response
+DECREASE_FACTOR = 0.5  # rate multiplier after a 503 / Access Denied / connection error
+BURST = 2  # tokens a host can save up while idle
+JITTER = 0.2  # up to this fraction of the request interval is added at random
+
+def retry_after_seconds(value):
+    """Parse a Retry-After header (seconds or an HTTP date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class HostLimiter:
+    """Token bucket for one host with additive-increase/multiplicative-decrease rate"""
+
+    def __init__(self, host, rate, min_rate, max_rate):
+        self.host = host
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.last_backoff = float("-inf")
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(BURST, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until this host may be sent another request; returns seconds waited"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    jitter = random.uniform(0, JITTER / self.rate)
+                    break
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+        time.sleep(jitter)
+        return waited + jitter
+
+    def success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + INCREASE_STEP)
+
+    def backoff(self, retry_after=None):
+        with self.lock:
+            now = time.monotonic()
+            # Requests already in flight when the first block arrives fail
+            # together; count that as one signal, not one per request
+            if now - self.last_backoff >= 1 / self.rate:
+                self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+                self.last_backoff = now
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            rate = self.rate
+        if retry_after:
+            logger.warning("Backing off %s: now %.2f req/s, paused %.0fs (Retry-After)", self.host, rate, retry_after)
+        else:
+            logger.warning("Backing off %s: now %.2f req/s", self.host, rate)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "rate": round(self.rate, 3),
+                "paused_for": round(max(self.blocked_until - time.monotonic(), 0.0), 1),
+            }
+
+_limiters = {}
+_overrides = {}
+_lock = threading.Lock()
+
+def configure(host, **limits):
+    """Override rate/min_rate/max_rate for a host, e.g. from the command line"""
+    with _lock:
+        _overrides.setdefault(host, {}).update(limits)
+        _limiters.pop(host, None)
+
+def limiter_for(host):
+    with _lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limits = dict(HOST_LIMITS.get(host, DEFAULT_LIMITS))
+            limits.update(_overrides.get(host, {}))
+            limits["max_rate"] = max(limits["max_rate"], limits["rate"])
+            limiter = HostLimiter(host, limits["rate"], limits["min_rate"], limits["max_rate"])
+            _limiters[host] = limiter
+        return limiter
+
+def acquire(host):
+    return limiter_for(host).acquire()
+
+def record(host, status_code, blocked=False, retry_after=None):
+    """Adjust a host's rate after a response: speed up on 200, back off when blocked"""
+    limiter = limiter_for(host)
+    if blocked or status_code in (429, 503):
+        limiter.backoff(retry_after_seconds(retry_after))
+    elif status_code == 200:
+        limiter.success()
+
+def record_error(host):
+    limiter_for(host).backoff()
+
+def snapshot():
+    with _lock:
+        limiters = list(_limiters.items())
+    return {host: limiter.snapshot() for host, limiter in limiters}
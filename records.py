@@ -0,0 +1,253 @@
+import math
+from array import array
+
+# Typed product records, shared by the Amazon and Flipkart scrapers.
+#
+# Scrapers extract display strings ("1,299", "4.3 out of 5", "1K+") and
+# turn them into a Product once; from there on prices and ratings are
+# floats, counts are ints and anything the page did not have is None.
+# One schema covers both sites and both search rows and product info:
+#
+#   site               "amazon" or "flipkart"
+#   product_id         ASIN or Flipkart data-id
+#   rank, keyword      search rows only (rank is None for product info)
+#   title, link        str
+#   price, rating      float
+#   reviews            int
+#   bought_last_month  int, the lower bound Amazon shows ("1K+" -> 1000)
+#   sponsored          bool
+#   bestseller         str, "#12 in Electronics | #3 in Smartphones"
+#   in_stock           bool
+#
+# to_json() is the JSON-compatible view sent to main.js and written to
+# journals and the job queue. It keeps the keys each kind of row always
+# had (ASIN, "In Stock", type, ...) so the UI and exports read it as before,
+# with numbers and nulls in place of strings and "N/A". from_json() reads
+# that view back, and also the string rows older journals and NDJSON files
+# hold.
+
+FIELDS = ("site", "product_id", "rank", "keyword", "title", "link", "price", "rating", "reviews",
+          "bought_last_month", "sponsored", "bestseller", "in_stock")
+FLOAT_FIELDS = ("price", "rating")
+INT_FIELDS = ("rank", "reviews", "bought_last_month")
+MISSING = ("", "N/A", "Title not found", "Unknown")
+SUFFIXES = {"K": 1e3, "M": 1e6, "L": 1e5}  # L: lakh
+
+def parse_number(value):
+    """A float from a displayed number ("₹1,299", "4.3", "(12,345)", "1.2K+"), or None"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if isinstance(value, float) and math.isnan(value) else float(value)
+    text = value.strip().lstrip("₹$").strip("()+ ").replace(",", "")
+    scale = 1.0
+    if text[-1:].upper() in SUFFIXES:
+        scale = SUFFIXES[text[-1].upper()]
+        text = text[:-1]
+    try:
+        number = float(text) * scale
+    except ValueError:
+        return None
+    return None if math.isnan(number) or math.isinf(number) else number
+
+def parse_count(value):
+    number = parse_number(value)
+    return int(round(number)) if number is not None else None
+
+def parse_flag(value, yes=("Yes", "Sponsored")):
+    if value is None or isinstance(value, bool):
+        return value
+    if value in MISSING:
+        return None
+    return value in yes
+
+def text_or_none(value):
+    if value is None:
+        return None
+    value = str(value)
+    return None if value in MISSING else value
+
+def yes_no(flag):
+    return None if flag is None else ("Yes" if flag else "No")
+
+def ad_type(sponsored):
+    """Amazon's name for a search result's kind"""
+    return None if sponsored is None else ("Sponsored" if sponsored else "Organic")
+
+class Product:
+    __slots__ = FIELDS
+
+    def __init__(self, site, product_id=None, rank=None, keyword=None, title=None, link=None,
+                 price=None, rating=None, reviews=None, bought_last_month=None, sponsored=None,
+                 bestseller=None, in_stock=None):
+        self.site = site
+        self.product_id = text_or_none(product_id)
+        self.rank = parse_count(rank)
+        self.keyword = keyword
+        self.title = text_or_none(title)
+        self.link = text_or_none(link)
+        self.price = parse_number(price)
+        self.rating = parse_number(rating)
+        self.reviews = parse_count(reviews)
+        self.bought_last_month = parse_count(bought_last_month)
+        self.sponsored = parse_flag(sponsored)
+        self.bestseller = text_or_none(bestseller)
+        self.in_stock = parse_flag(in_stock)
+
+    def copy(self):
+        product = Product.__new__(Product)
+        for field in FIELDS:
+            setattr(product, field, getattr(self, field))
+        return product
+
+    def __eq__(self, other):
+        if not isinstance(other, Product):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in FIELDS)
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={getattr(self, field)!r}" for field in FIELDS
+                           if getattr(self, field) is not None)
+        return f"Product({values})"
+
+    def to_dict(self):
+        """Every field of the unified schema"""
+        return {field: getattr(self, field) for field in FIELDS}
+
+    def to_json(self):
+        """The row as main.js, journals and exports know it for this site and kind"""
+        if self.site == "amazon" and self.rank is not None:
+            row = {
+                "rank": self.rank,
+                "asin": self.product_id,
+                "title": self.title,
+                "price": self.price,
+                "link": self.link,
+                "rating": self.rating,
+                "reviews": self.reviews,
+                "bought_last_month": self.bought_last_month,
+                "type": ad_type(self.sponsored),
+            }
+        elif self.site == "amazon":
+            row = {
+                "ASIN": self.product_id,
+                "title": self.title,
+                "price": self.price,
+                "rating": self.rating,
+                "reviews": self.reviews,
+                "link": self.link,
+                "BestSeller": self.bestseller,
+                "In Stock": yes_no(self.in_stock),
+                "bought_last_month": self.bought_last_month,
+            }
+        elif self.rank is not None:
+            row = {
+                "rank": self.rank,
+                "product_id": self.product_id,
+                "title": self.title,
+                "price": self.price,
+                "link": self.link,
+                "rating": self.rating,
+                "reviews": self.reviews,
+                "sponsored": yes_no(self.sponsored),
+            }
+        else:
+            row = {
+                "link": self.link,
+                "title": self.title,
+                "price": self.price,
+                "rating": self.rating,
+                "reviews": self.reviews,
+            }
+        if self.keyword is not None:
+            row["keyword"] = self.keyword
+        return row
+
+    @classmethod
+    def from_json(cls, row):
+        """A Product from to_json() or to_dict() output, or from an older string row"""
+        if "site" in row:
+            return cls(**{field: row.get(field) for field in FIELDS})
+        asin = row.get("asin") or row.get("ASIN")
+        amazon = asin is not None or "type" in row or "amazon." in (row.get("link") or "")
+        sponsored = row.get("type") if "type" in row else row.get("sponsored")
+        return cls(
+            "amazon" if amazon else "flipkart",
+            product_id=asin if amazon else row.get("product_id"),
+            rank=row.get("rank"),
+            keyword=row.get("keyword"),
+            title=row.get("title"),
+            link=row.get("link"),
+            price=row.get("price"),
+            rating=row.get("rating"),
+            reviews=row.get("reviews"),
+            bought_last_month=row.get("bought_last_month"),
+            sponsored=sponsored,
+            bestseller=row.get("BestSeller"),
+            in_stock=row.get("In Stock"),
+        )
+
+def to_json(value):
+    """The JSON view of a Product or a list of them; anything else is returned as it is"""
+    if isinstance(value, Product):
+        return value.to_json()
+    if isinstance(value, list):
+        return [to_json(item) for item in value]
+    return value
+
+def from_json(value):
+    """A Product from a row dict (or a Product, unchanged); None stays None"""
+    if value is None or isinstance(value, Product):
+        return value
+    return Product.from_json(value)
+
+class ProductBatch:
+    """Products stored column by column, for holding many rows at once.
+
+    Numeric columns are arrays of doubles with NaN for null (exact for
+    integers below 2**53); the others are plain lists. Products come back
+    out as Product records, so callers never see the NaNs.
+    """
+
+    def __init__(self, products=()):
+        self.columns = {field: array("d") if field in FLOAT_FIELDS or field in INT_FIELDS else []
+                        for field in FIELDS}
+        self.size = 0
+        for product in products:
+            self.append(product)
+
+    def append(self, product):
+        for field in FIELDS:
+            value = getattr(product, field)
+            if field in FLOAT_FIELDS or field in INT_FIELDS:
+                value = math.nan if value is None else value
+            self.columns[field].append(value)
+        self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    def column(self, field):
+        """One field of every product, with None for nulls"""
+        values = self.columns[field]
+        if field in FLOAT_FIELDS:
+            return [None if math.isnan(value) else value for value in values]
+        if field in INT_FIELDS:
+            return [None if math.isnan(value) else int(value) for value in values]
+        return list(values)
+
+    def __getitem__(self, index):
+        product = Product.__new__(Product)
+        for field in FIELDS:
+            value = self.columns[field][index]
+            if field in FLOAT_FIELDS or field in INT_FIELDS:
+                value = None if math.isnan(value) else (int(value) if field in INT_FIELDS else value)
+            setattr(product, field, value)
+        return product
+
+    def __iter__(self):
+        for index in range(self.size):
+            yield self[index]
+
+    def to_json(self):
+        return [product.to_json() for product in self]
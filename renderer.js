@@ -32,7 +32,7 @@ async function startScraping(tabId) {
 
         // Remove previous event listeners if any exist
         window.electronAPI.onScrapingProgress((data) => {
-            status.textContent = `Scraping ${data.keyword} (${data.current}/${data.total})`;
+            status.textContent = `Scraping ${data.keyword} (${data.total != null ? `${data.current}/${data.total}` : data.current})`;
         });
 
         window.electronAPI.onScrapingResult((data) => {
@@ -87,9 +87,9 @@ function appendResultToTable(tabId, result) {
                     <td>${result.rank || ''}</td>
                     <td>${result.asin || ''}</td>
                     <td>${escapeHtml(result.title) || ''}</td>
-                    <td>${result.price || ''}</td>
-                    <td>${result.rating || ''}</td>
-                    <td>${result.reviews || ''}</td>
+                    <td>${formatNumber(result.price)}</td>
+                    <td>${result.rating ?? ''}</td>
+                    <td>${formatNumber(result.reviews)}</td>
                     <td>${result.type || ''}</td>
                 `;
                 break;
@@ -99,9 +99,9 @@ function appendResultToTable(tabId, result) {
                     <td>${result.rank || ''}</td>
                     <td>${result.product_id || ''}</td>
                     <td>${escapeHtml(result.title) || ''}</td>
-                    <td>${result.price || ''}</td>
-                    <td>${result.rating || ''}</td>
-                    <td>${result.reviews || ''}</td>
+                    <td>${formatNumber(result.price)}</td>
+                    <td>${result.rating ?? ''}</td>
+                    <td>${formatNumber(result.reviews)}</td>
                     <td>${result.sponsored || ''}</td>
                 `;
                 break;
@@ -110,12 +110,12 @@ function appendResultToTable(tabId, result) {
                 row.innerHTML = `
                     <td>${result.ASIN || ''}</td>
                     <td>${escapeHtml(result.title) || ''}</td>
-                    <td>${result.price || ''}</td>
-                    <td>${result.rating || ''}</td>
-                    <td>${result.reviews || ''}</td>
+                    <td>${formatNumber(result.price)}</td>
+                    <td>${result.rating ?? ''}</td>
+                    <td>${formatNumber(result.reviews)}</td>
                     <td>${escapeHtml(result.BestSeller) || ''}</td>
                     <td>${result.In_Stock || ''}</td>
-                    <td>${result.bought_last_month || ''}</td>
+                    <td>${formatNumber(result.bought_last_month)}</td>
                 `;
                 break;
 
@@ -123,9 +123,9 @@ function appendResultToTable(tabId, result) {
                 row.innerHTML = `
                     <td>${result.product_id || ''}</td>
                     <td>${escapeHtml(result.title) || ''}</td>
-                    <td>${result.price || ''}</td>
-                    <td>${result.rating || ''}</td>
-                    <td>${result.reviews || ''}</td>
+                    <td>${formatNumber(result.price)}</td>
+                    <td>${result.rating ?? ''}</td>
+                    <td>${formatNumber(result.reviews)}</td>
                 `;
                 break;
         }
@@ -137,6 +137,12 @@ function appendResultToTable(tabId, result) {
     }
 }
 
+// Prices and counts arrive as numbers (null when the page had none)
+function formatNumber(value) {
+    if (value === null || value === undefined) return '';
+    return typeof value === 'number' ? value.toLocaleString('en-IN') : value;
+}
+
 function escapeHtml(str) {
     if (!str) return '';
     return str
@@ -1,72 +1,677 @@
 # scraper_wrapper.py
 import argparse
-import json
+import contextvars
+import itertools
 import sys
-from amazon_scraper1 import search as amazon_search
-from flipkart_scraper import search as flipkart_search
-from product_info_fetcher1 import fetch_amazon_product_info, fetch_flipkart_product_info
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import coalesce
+import history
+import identifiers
+import inputs
+import job_queue
+import journal as job_journal
+import logs
+import metrics
+import protocol
+import rate_limiter
+import records
+
+# main.js starts a fresh interpreter for every action, so only what every
+# run needs is imported here. The scrapers (and with them requests, bs4 and
+# lxml), the HTTP cache, the parse pool and asyncio are imported when a job
+# first needs them, and a job only loads its own platform's scraper; see
+# benchmarks/bench_startup.py for the import-time budget.
+
+# Default host for each platform, used to group keywords for per-host limits
+PLATFORM_HOSTS = {
+    'amazon': 'www.amazon.in',
+    'flipkart': 'www.flipkart.com',
+}
+
+# Parser backends --parser accepts (parsers.set_backend falls back to bs4
+# when lxml is not installed)
+PARSER_BACKENDS = ['bs4', 'lxml']
+
+# Keywords run_concurrent takes from its input before earlier ones have
+# finished: enough for every free slot to find one for an idle host, while
+# a streamed input is only read this far ahead
+SCHEDULE_AHEAD = 256
 
 def print_json(data):
-    """Print data as JSON and flush stdout"""
-    print(json.dumps(data))
-    sys.stdout.flush()
+    """Write data to stdout as one frame of the configured protocol (NDJSON by default)"""
+    protocol.write(data)
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--keywords', help='Comma-separated keywords or URLs')
-    parser.add_argument('--num_products', type=int, default=30)
-    parser.add_argument('--platform', choices=['amazon', 'flipkart'])
-    parser.add_argument('--type', choices=['rank', 'product'])
-    args = parser.parse_args()
+class ResultTally:
+    """Counts a run's results as stream_keyword adds them.
+
+    The rows themselves already went out in result events, so a run keeps
+    only the count for its complete event instead of every row again. It
+    also counts the keywords a journaled run tried but did not finish.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.unfinished = 0
+        self.lock = threading.Lock()
 
+    def extend(self, results):
+        with self.lock:
+            self.count += len(results)
+
+    def check_finished(self, keyword, journal):
+        if journal is not None and not journal.is_done(keyword):
+            with self.lock:
+                self.unfinished += 1
+
+    def __len__(self):
+        return self.count
+
+def complete_event(count, cancelled=None, **refs):
+    """The last event of a job: how many results it produced, and where its output lives"""
+    event = {"type": "complete", "count": count}
+    if cancelled is not None:
+        event["cancelled"] = cancelled
+    refs = {name: ref for name, ref in refs.items() if ref is not None}
+    if refs:
+        event["refs"] = refs
+    return event
+
+def scrape_keyword(keyword, args, journal=None):
+    """Run one blocking scrape for a keyword, ASIN or product URL.
+
+    Yields results as they become available: the rank rows of each search
+    page as soon as it is parsed, or a single product info record (all
+    records.Product).
+
+    With a checkpoint journal, work it already holds is replayed from it
+    instead of fetched again: finished keywords entirely, and a search cut
+    short continues after its last journaled page. A keyword the journal
+    holds as invalid raises its ValueError again.
+    """
+    error = journal.error(keyword) if journal is not None else None
+    if error is not None:
+        raise ValueError(error)
+    if args.type == 'rank':
+        batches = []
+        start = on_page = None
+        if journal is not None:
+            replayed = journal.rows(keyword)
+            if replayed:
+                batches.append(replayed)
+            if not journal.is_done(keyword):
+                start = journal.resume_point(keyword)
+                on_page = lambda page, next_url, products: journal.page(keyword, page, next_url, products)
+        if journal is None or not journal.is_done(keyword):
+            if args.platform == 'amazon':
+                from amazon_scraper1 import search_pages
+            else:
+                from flipkart_scraper import search_pages
+            batches = itertools.chain(batches, search_pages(keyword, args.num_products, args.plan_pages,
+                                                            start=start, on_page=on_page))
+        for products in batches:
+            # Tag rank rows with their keyword so exports can group them per sheet
+            for product in products:
+                product.keyword = keyword
+            yield products
+        if journal is not None and not journal.is_done(keyword):
+            journal.finish(keyword)
+        return
+    # product info
+    if journal is not None and journal.is_done(keyword):
+        yield journal.result(keyword)
+        return
+    import product_info_fetcher1
+    # What is not a product identifier raises ValueError here, before anything is fetched
+    if args.platform == 'amazon':
+        product_info_fetcher1.amazon_url(keyword)
+        info = product_info_fetcher1.fetch_amazon_product_info(keyword)
+    else:
+        product_info_fetcher1.flipkart_url(keyword)
+        info = product_info_fetcher1.fetch_flipkart_product_info(keyword)
+    # A product that could not be fetched stays unfinished, so a resumed job retries it
+    if journal is not None and info is not None:
+        journal.finish(keyword, info)
+    yield info
+
+def stream_keyword(keyword, args, emit, all_results, cancelled=None, run_metrics=None, journal=None):
+    """Scrape a keyword, emitting a result event for every batch of rows it yields.
+
+    Stage timings and counters recorded while scraping it are emitted as a
+    metrics event for the keyword and added to run_metrics. A keyword that
+    finishes is added to the history store, unless its rows all came from
+    the journal of a run that already recorded them.
+    """
+    keyword_metrics = metrics.Metrics()
+    replayed = journal is not None and journal.is_done(keyword)
+    rows = [] if not replayed and history.get_store() is not None else None
     try:
-        keywords = args.keywords.split(',')
-        total_items = len(keywords)
-        all_results = []
+        with metrics.collect(keyword_metrics), metrics.timer("keyword"):
+            results = scrape_keyword(keyword, args, journal)
+            try:
+                for result in results:
+                    if result:
+                        batch = result if isinstance(result, list) else [result]
+                        all_results.extend(batch)
+                        if rows is not None:
+                            rows.extend(batch)
+
+                    # Print individual result
+                    emit({
+                        "type": "result",
+                        "data": records.to_json(result)
+                    })
+                    if cancelled is not None and cancelled.is_set():
+                        break
+            finally:
+                results.close()
+            if rows and (cancelled is None or not cancelled.is_set()):
+                history.record(args.platform, identifiers.canonical_keyword(keyword) if args.type == 'rank' else None,
+                               rows)
+    finally:
+        if run_metrics is not None:
+            run_metrics.merge(keyword_metrics)
+        emit(metrics_event(keyword_metrics, "keyword", keyword))
+
+def metrics_event(collected, scope, keyword=None):
+    event = {"type": "metrics", "scope": scope}
+    if keyword is not None:
+        event["keyword"] = keyword
+    event.update(collected.summary())
+    return event
 
-        for idx, keyword in enumerate(keywords, 1):
+def run_metrics_event(run_metrics, args):
+    """Summary of a whole run, also written to --metrics_file if one was given"""
+    if getattr(args, 'metrics_file', None):
+        try:
+            run_metrics.dump(args.metrics_file)
+        except OSError as e:
+            print(f"Could not write metrics to {args.metrics_file}: {e}", file=sys.stderr)
+    return metrics_event(run_metrics, "run")
+
+def keyword_host(keyword, platform):
+    """Host a keyword will be fetched from, for per-host politeness limits"""
+    if keyword.startswith('http'):
+        host = urlparse(keyword).netloc
+        if host:
+            return host
+    return PLATFORM_HOSTS[platform]
+
+def split_item(args, item):
+    """(keyword, args to scrape it with) for a keyword, or an inputs.InputItem with its own options"""
+    if not isinstance(item, inputs.InputItem):
+        return item, args
+    if not item.options:
+        return item.keyword, args
+    item_args = queue_item_args(args, item.options)
+    if item_args.platform not in PLATFORM_HOSTS or item_args.type not in ('rank', 'product'):
+        raise ValueError(f"Invalid platform or type for '{item.keyword}'")
+    return item.keyword, item_args
+
+def item_count(keywords):
+    """How many keywords a job has, or None while they are still being read from an input"""
+    return len(keywords) if isinstance(keywords, (list, tuple)) else None
+
+def keyword_error(keyword, error, emit, journal=None):
+    """Emit an error event for a keyword.
+
+    Invalid input (a ValueError, e.g. a bad ASIN or platform) fails the same
+    way every time, so the journal records the keyword as done with its
+    error: the job's journal can still be deleted, and a resumed job
+    reports the error again instead of retrying it. Anything else leaves
+    the keyword unfinished.
+    """
+    emit({
+        "type": "error",
+        "message": str(error),
+        "keyword": keyword
+    })
+    if journal is not None and isinstance(error, ValueError) and not journal.is_done(keyword):
+        journal.finish(keyword, error=str(error))
+
+def run_serial(args, keywords, emit=print_json, cancelled=None, run_metrics=None, journal=None):
+    total_items = item_count(keywords)
+    all_results = ResultTally()
+
+    for idx, item in enumerate(keywords, 1):
+        if cancelled is not None and cancelled.is_set():
+            break
+        keyword = item.keyword if isinstance(item, inputs.InputItem) else item
+        try:
+            # Print progress
+            emit({
+                "type": "progress",
+                "current": idx,
+                "total": total_items,
+                "keyword": keyword,
+                "rates": rate_limiter.snapshot()
+            })
+
+            keyword, item_args = split_item(args, item)
+
+            stream_keyword(keyword, item_args, emit, all_results, cancelled, run_metrics, journal)
+
+        except Exception as e:
+            keyword_error(keyword, e, emit, journal)
+        finally:
+            all_results.check_finished(keyword, journal)
+
+    return all_results
+
+async def run_concurrent(args, keywords, emit=print_json, cancelled=None, run_metrics=None, journal=None):
+    """Scrape keywords concurrently, at most args.per_host at a time per host.
+
+    The scrapers are blocking, so each keyword runs on a worker thread while
+    the event loop schedules them. Result events are printed from the worker
+    threads as each search page is parsed.
+
+    Keywords are taken from the input as they are scheduled, at most
+    SCHEDULE_AHEAD beyond the last one to finish, so an input read from a
+    file or stdin is never held in memory whole.
+    """
+    import asyncio
+    total_items = item_count(keywords)
+    all_results = ResultTally()
+    started = 0
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(args.concurrency)
+    host_slots = {}
+
+    async def run_one(item):
+        nonlocal started
+        try:
+            keyword, item_args = split_item(args, item)
+        except ValueError as e:
+            keyword_error(item.keyword, e, emit, journal)
+            all_results.check_finished(item.keyword, journal)
+            return
+        host = keyword_host(keyword, item_args.platform)
+        if host not in host_slots:
+            host_slots[host] = asyncio.Semaphore(args.per_host)
+
+        async with slots, host_slots[host]:
+            if cancelled is not None and cancelled.is_set():
+                return
+            started += 1
+            emit({
+                "type": "progress",
+                "current": started,
+                "total": total_items,
+                "keyword": keyword,
+                "rates": rate_limiter.snapshot()
+            })
             try:
-                # Print progress
-                print_json({
-                    "type": "progress",
-                    "current": idx,
-                    "total": total_items,
-                    "keyword": keyword
-                })
+                await loop.run_in_executor(executor, contextvars.copy_context().run, stream_keyword, keyword,
+                                           item_args, emit, all_results, cancelled, run_metrics, journal)
+            except Exception as e:
+                keyword_error(keyword, e, emit, journal)
+            finally:
+                all_results.check_finished(keyword, journal)
+
+    async def next_item(items):
+        if isinstance(keywords, (list, tuple)):
+            return next(items, None)
+        # Reading stdin can block: keep it off the event loop and the scraping threads
+        return await loop.run_in_executor(None, next, items, None)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        items = iter(keywords)
+        running = set()
+        exhausted = False
+        while running or not exhausted:
+            while not exhausted and len(running) < SCHEDULE_AHEAD:
+                item = None if cancelled is not None and cancelled.is_set() else await next_item(items)
+                if item is None:
+                    exhausted = True
+                else:
+                    running.add(asyncio.ensure_future(run_one(item)))
+            if running:
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+    return all_results
 
-                # Get results based on type and platform
-                if args.type == 'rank':
-                    if args.platform == 'amazon':
-                        result = amazon_search(keyword, args.num_products)
-                    else:
-                        result = flipkart_search(keyword, args.num_products)
-                else:  # product info
-                    if args.platform == 'amazon':
-                        result = fetch_amazon_product_info(keyword)
-                    else:
-                        result = fetch_flipkart_product_info(keyword)
-
-                if result:
-                    all_results.extend(result if isinstance(result, list) else [result])
-
-                # Print individual result
-                print_json({
+def run_job(args, keywords, emit=print_json, cancelled=None, run_metrics=None, journal=None):
+    """Scrape keywords with the options in args; returns a ResultTally of the results.
+
+    keywords is a list, or an iterable of inputs.InputItem read lazily from
+    an input file, in which case progress events have no total.
+    """
+    # Identical pages and products are fetched once per run, not once per process
+    with coalesce.scope():
+        if args.concurrency > 1:
+            import asyncio
+            return asyncio.run(run_concurrent(args, keywords, emit, cancelled, run_metrics, journal))
+        return run_serial(args, keywords, emit, cancelled, run_metrics, journal)
+
+def queue_item_args(args, options):
+    """A copy of args with a queued job's (or an input item's) options applied"""
+    item_args = argparse.Namespace(**vars(args))
+    for field, value in options.items():
+        setattr(item_args, field, value)
+    return item_args
+
+def work_queue_item(queue, keeper, item, args, emit, acked, run_metrics=None):
+    """Scrape one leased item and ack its rows, or hand it back to the queue on failure"""
+    item_id, job_id, keyword = item
+    item_args = queue_item_args(args, queue.options(job_id))
+    lost = keeper.add(item_id)
+    rows = []
+    try:
+        counts = queue.counts(job_id)
+        emit({
+            "type": "progress",
+            "current": counts["done"] + counts["failed"] + counts["leased"],
+            "total": sum(counts.values()),
+            "keyword": keyword,
+            "job_id": job_id,
+            "rates": rate_limiter.snapshot()
+        })
+        # A lost lease cancels the scrape: the item now belongs to another worker
+        stream_keyword(keyword, item_args, emit, rows, lost, run_metrics)
+        if lost.is_set():
+            return
+        if not rows:
+            # Leave it to another delivery, possibly on a worker with a different egress IP
+            raise ValueError(f"No results for '{keyword}'")
+        if queue.ack(item_id, keeper.worker_id, records.to_json(rows)):
+            acked.extend(rows)
+    except Exception as e:
+        queue.fail(item_id, keeper.worker_id, e)
+        emit({
+            "type": "error",
+            "message": str(e),
+            "keyword": keyword
+        })
+    except BaseException:
+        queue.release(item_id, keeper.worker_id)
+        raise
+    finally:
+        keeper.remove(item_id)
+
+def run_queue_worker(args, queue, emit=print_json, run_metrics=None):
+    """Work through queued items until none are pending or leased; returns a ResultTally of the rows it acked.
+
+    With args.concurrency > 1 that many items are leased and scraped at a
+    time. While other workers still hold leases this one keeps polling, so
+    it can pick up any item whose lease is lost.
+    """
+    worker_id = job_queue.new_worker_id()
+    keeper = job_queue.LeaseKeeper(queue, worker_id, args.lease_seconds)
+    acked = ResultTally()
+    idle_wait = min(5.0, args.lease_seconds / 3)
+
+    def work():
+        while True:
+            item = queue.lease(worker_id, args.lease_seconds)
+            if item is None:
+                if not queue.has_work():
+                    return
+                time.sleep(idle_wait)
+                continue
+            work_queue_item(queue, keeper, item, args, emit, acked, run_metrics)
+
+    try:
+        with coalesce.scope():
+            if args.concurrency > 1:
+                with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                    for future in [executor.submit(contextvars.copy_context().run, work)
+                                   for _ in range(args.concurrency)]:
+                        future.result()
+            else:
+                work()
+    finally:
+        keeper.stop()
+    return acked
+
+def run_coordinator(queue, job_id, emit=print_json, poll_interval=1.0):
+    """Wait for the workers to finish a queued job; returns how many rows it produced.
+
+    Each keyword's rows are emitted as a result event once a worker has
+    acked them, and keywords that ran out of attempts as error events.
+    """
+    product_info = queue.options(job_id)["type"] == 'product'
+    reported = set()
+    finished = -1
+    while True:
+        items = queue.items(job_id)
+        for keyword, state, rows, error in items:
+            if keyword in reported or state not in ('done', 'failed'):
+                continue
+            reported.add(keyword)
+            if state == 'done':
+                emit({
                     "type": "result",
-                    "data": result
+                    "data": rows[0] if product_info else rows
                 })
-
-            except Exception as e:
-                print_json({
+            else:
+                emit({
                     "type": "error",
-                    "message": str(e),
+                    "message": error,
                     "keyword": keyword
                 })
+        if len(reported) != finished:
+            finished = len(reported)
+            emit({
+                "type": "progress",
+                "current": finished,
+                "total": len(items),
+                "job_id": job_id,
+                "queue": queue.counts(job_id)
+            })
+        if finished == len(items):
+            break
+        time.sleep(poll_interval)
 
-        # Print final results
-        print_json({
-            "type": "complete",
-            "results": all_results
-        })
+    return sum(len(rows) for keyword, state, rows, error in items if state == 'done')
+
+def queue_keywords(keywords):
+    """The keywords of a job's input, for the job queue, which has options per job only"""
+    for item in keywords:
+        if isinstance(item, inputs.InputItem):
+            if item.options:
+                raise ValueError(f"Per-item options are not supported in queue mode ('{item.keyword}')")
+            item = item.keyword
+        yield item
+
+def open_queue_job(args, queue, keywords, resume=None):
+    """Queue a new job's keywords, or reattach to a queued one; returns the job id"""
+    if resume:
+        if queue.options(resume) is None:
+            raise ValueError(f"No job {resume} in queue {queue.path}")
+        return resume
+    job_id = job_journal.new_job_id()
+    queue.enqueue(job_id, queue_keywords(keywords), {field: getattr(args, field) for field in job_journal.JOB_FIELDS})
+    return job_id
+
+def open_job_journal(args, keywords, resume=None):
+    """Open the checkpoint journal for a run; returns (journal, keywords).
+
+    Resuming takes the keywords and options from the journal, so the run
+    continues exactly the job that was interrupted. A job read from
+    args.input journals the input's path and reads it again on resume
+    (from args.input if given, e.g. when it came from stdin).
+    """
+    if resume:
+        journal = job_journal.open_journal(resume, args.journal_dir, must_exist=True)
+        return journal, journal.apply(args, args.input)
+    journal = job_journal.open_journal(job_journal.new_job_id(), args.journal_dir)
+    journal.start(args, keywords, args.input)
+    return journal, keywords
+
+def close_job_journal(journal, all_results, cancelled=None):
+    """Close a run's journal, deleting it once every keyword has finished; returns it, or None if deleted"""
+    if journal is None:
+        return None
+    if all_results.unfinished == 0 and (cancelled is None or not cancelled.is_set()):
+        # Nothing is left to resume
+        journal.discard()
+        return None
+    journal.close()
+    return journal
+
+def job_refs(journal, args):
+    """Where a finished job's output can be found again, for its complete event"""
+    refs = {"metrics_file": getattr(args, 'metrics_file', None)}
+    if journal is not None:
+        refs.update(job_id=journal.job_id, journal=journal.path)
+    return refs
+
+def job_event(journal):
+    return {"type": "job", "job_id": journal.job_id, "journal": journal.path}
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keywords', help='Comma-separated keywords or URLs')
+    parser.add_argument('--input', metavar='PATH',
+                        help='File of keywords, ASINs or URLs, one per line or NDJSON with per-item options '
+                             '(see inputs.py); - for stdin')
+    parser.add_argument('--num_products', type=int, default=30)
+    parser.add_argument('--platform', choices=['amazon', 'flipkart'])
+    parser.add_argument('--type', choices=['rank', 'product'])
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Number of keywords to scrape at the same time')
+    parser.add_argument('--per_host', type=int, default=4,
+                        help='Maximum concurrent keywords against one host')
+    parser.add_argument('--plan_pages', action='store_true',
+                        help='Fetch search pages in parallel using page=N URLs')
+    parser.add_argument('--parser', choices=PARSER_BACKENDS,
+                        help='HTML parser backend (default: lxml when installed)')
+    parser.add_argument('--full_parse', action='store_true',
+                        help='Build the whole DOM of search pages instead of only result nodes')
+    parser.add_argument('--parse_workers', type=int,
+                        help='Processes to parse pages in (default 0: parse on the scraping threads)')
+    parser.add_argument('--stream_products', action='store_true',
+                        help='Stop downloading Amazon product pages once every field has arrived (needs lxml)')
+    parser.add_argument('--proxies', help='Comma-separated upstream proxy URLs to rotate through')
+    parser.add_argument('--cookie_file', help='File to persist cookies in between runs')
+    parser.add_argument('--rate', action='append', default=[], metavar='HOST=RPS',
+                        help='Starting request rate for a host, e.g. www.amazon.in=1.5 (repeatable)')
+    parser.add_argument('--cache_dir', help='Directory for the product page cache')
+    parser.add_argument('--cache_ttl', type=int, help='Seconds a cached product page stays fresh')
+    parser.add_argument('--max_age', type=int,
+                        help='Only use cached product pages younger than this many seconds (this run only)')
+    parser.add_argument('--no_cache', action='store_true', help='Always fetch product pages from the network')
+    parser.add_argument('--history_db', help='SQLite file for the rank and price history (see history.py)')
+    parser.add_argument('--no_history', action='store_true', help='Do not record this run in the history store')
+    parser.add_argument('--metrics_file',
+                        help='Write the run\'s stage timings and counters here (Prometheus text for .prom, else JSON)')
+    parser.add_argument('--resume', metavar='JOB_ID',
+                        help='Continue an interrupted job from its checkpoint journal, skipping finished work '
+                             '(with --coordinator: wait for a job already in the queue)')
+    parser.add_argument('--journal_dir',
+                        help='Directory for checkpoint journals (default ~/.cache/ecommerce-scraper/jobs)')
+    parser.add_argument('--no_journal', action='store_true',
+                        help='Do not write a checkpoint journal for this run. Runs are journaled by default; '
+                             'the journal is removed once every keyword has finished')
+    parser.add_argument('--coordinator', action='store_true',
+                        help='Put the keywords in the job queue and collect the results queue workers produce')
+    parser.add_argument('--queue_worker', action='store_true',
+                        help='Scrape keywords leased from the job queue until it is drained')
+    parser.add_argument('--queue', help='SQLite job queue file shared by the coordinator and queue workers')
+    parser.add_argument('--lease_seconds', type=float, default=job_queue.DEFAULT_LEASE_SECONDS,
+                        help='Seconds without a heartbeat before a leased keyword is redelivered')
+    parser.add_argument('--protocol', choices=protocol.FORMATS, default='ndjson',
+                        help='Framing of stdout events: NDJSON lines, or length-prefixed msgpack (needs msgpack)')
+    parser.add_argument('--worker', action='store_true',
+                        help='Serve scrape and export jobs as JSON-RPC over stdin/stdout')
+    parser.add_argument('--log_level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help=f'Level of the log lines written to stderr (default {logs.DEFAULT_LEVEL}; '
+                             'main.js shows every stderr line as an error)')
+    parser.add_argument('--log_format', choices=logs.FORMATS, help='stderr log lines as text or JSON objects')
+    parser.add_argument('--dump_dir',
+                        help='Directory for sampled, rate-limited HTML of pages and results that could not be extracted')
+    return parser
+
+def configure(args):
+    """Apply process-wide settings (parser backend, HTTP pool, cache, history) from args"""
+    for rate in args.rate:
+        host, _, value = rate.partition('=')
+        rate_limiter.configure(host, rate=float(value))
+    if args.parser or args.full_parse:
+        import parsers
+        if args.parser:
+            parsers.set_backend(args.parser)
+        if args.full_parse:
+            parsers.set_targeted(False)
+    if args.parse_workers is not None:
+        import parse_pool
+        parse_pool.configure(args.parse_workers)
+    if args.stream_products:
+        import product_info_fetcher1
+        product_info_fetcher1.set_streaming(True)
+    if args.proxies or args.cookie_file:
+        import http_session
+        proxies = args.proxies.split(',') if args.proxies else None
+        http_session.configure(proxies=proxies, cookie_file=args.cookie_file,
+                               host_overrides=http_session.env_host_overrides())
+    if args.no_cache or args.cache_dir or args.cache_ttl is not None or args.max_age is not None:
+        import http_cache
+        http_cache.configure(args.cache_dir, args.cache_ttl, max_age=args.max_age,
+                             enabled=not args.no_cache)
+    if args.no_history or args.history_db:
+        history.configure(args.history_db, enabled=not args.no_history)
+
+def stats_event():
+    import http_cache
+    import http_session
+    http_session.get_pool().save_cookies()
+    return {
+        "type": "stats",
+        "http": http_session.stats(),
+        "cache": http_cache.stats(),
+        "rates": rate_limiter.snapshot()
+    }
+
+def main():
+    args = build_parser().parse_args()
+    logs.configure(args.log_level, args.log_format, args.dump_dir)
+
+    try:
+        protocol.configure(args.protocol)
+        configure(args)
+
+        if args.worker:
+            import worker
+            worker.serve(args)
+            return
+
+        if args.input:
+            keywords = inputs.open_items(args.input)
+        else:
+            keywords = args.keywords.split(',') if args.keywords else []
+
+        if args.coordinator or args.queue_worker:
+            queue = job_queue.JobQueue(args.queue)
+            run_metrics = metrics.Metrics()
+            if args.coordinator:
+                job_id = open_queue_job(args, queue, keywords, args.resume)
+                print_json({"type": "job", "job_id": job_id, "queue": queue.path})
+                count = run_coordinator(queue, job_id)
+                complete = complete_event(count, job_id=job_id, queue=queue.path)
+            else:
+                count = len(run_queue_worker(args, queue, run_metrics=run_metrics))
+                print_json(stats_event())
+                print_json(run_metrics_event(run_metrics, args))
+                complete = complete_event(count, queue=queue.path, metrics_file=args.metrics_file)
+            queue.close()
+            print_json(complete)
+            return
+
+        journal = None
+        if args.resume or not args.no_journal:
+            journal, keywords = open_job_journal(args, keywords, args.resume)
+            print_json(job_event(journal))
+
+        run_metrics = metrics.Metrics()
+        all_results = run_job(args, keywords, run_metrics=run_metrics, journal=journal)
+        journal = close_job_journal(journal, all_results)
+
+        print_json(stats_event())
+        print_json(run_metrics_event(run_metrics, args))
+
+        print_json(complete_event(len(all_results), **job_refs(journal, args)))
 
     except Exception as e:
         print_json({
@@ -76,4 +681,4 @@ def main():
         sys.exit(1)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
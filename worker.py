@@ -0,0 +1,214 @@
+# worker.py
+"""Long-lived JSON-RPC 2.0 worker over stdin/stdout.
+
+main.js starts one `scraper_wrapper.py --worker` process and sends it one
+request per line, so modules, HTTP connection pools and caches stay warm
+between jobs. Methods:
+
+    scrape   {job_id?, keywords | input, platform, type, num_products, metrics_file?, journal?, ...}
+             {job_id?, resume: <journal job id>}
+    export   {job_id?, input | results, platform, output}
+    cancel   {job_id}
+    ping     {}
+    shutdown {}
+
+scrape and export reply straight away with {"job_id": ...}; the job then
+streams the usual progress/result/metrics/error/complete events, each tagged
+with its job_id. Rows only travel in result events: complete carries the
+row count and refs (journal, output file) but not the rows again.
+Cancelled jobs stop before their next keyword. A scrape with journal: true
+(or a resume) first emits a job event naming its checkpoint journal, which
+a later scrape can resume from. input names a file of keywords to read as
+the job goes (see inputs.py) instead of a list.
+"""
+import sys
+import json
+import argparse
+import itertools
+import threading
+import logging
+import inputs
+import metrics
+import scraper_wrapper
+from scraper_wrapper import print_json
+
+logger = logging.getLogger(__name__)
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+
+# Options a scrape request may set per job; everything else comes from the
+# worker's own command line
+JOB_OPTIONS = ['num_products', 'platform', 'type', 'concurrency', 'per_host', 'plan_pages', 'metrics_file']
+
+class Worker:
+    def __init__(self, defaults):
+        self.defaults = defaults
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.job_ids = itertools.count(1)
+        self.running = True
+
+    def reply(self, request_id, result=None, error=None):
+        message = {"jsonrpc": "2.0", "id": request_id}
+        if error is not None:
+            message["error"] = error
+        else:
+            message["result"] = result
+        print_json(message)
+
+    def handle(self, request):
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            self.reply(None, error={"code": INVALID_REQUEST, "message": "Invalid request"})
+            return
+        request_id = request.get("id")
+        params = request.get("params") or {}
+        handler = getattr(self, f"rpc_{request['method']}", None)
+        if handler is None:
+            self.reply(request_id, error={"code": METHOD_NOT_FOUND, "message": f"Unknown method {request['method']}"})
+            return
+        try:
+            result = handler(params)
+        except (KeyError, TypeError, ValueError) as e:
+            self.reply(request_id, error={"code": INVALID_PARAMS, "message": str(e)})
+            return
+        if request_id is not None:
+            self.reply(request_id, result)
+
+    def start_job(self, params, target):
+        job_id = str(params.get("job_id") or f"job-{next(self.job_ids)}")
+        cancelled = threading.Event()
+
+        def emit(event):
+            event = dict(event)
+            event["job_id"] = job_id
+            print_json(event)
+
+        def run():
+            try:
+                target(emit, cancelled)
+            except Exception as e:
+                logger.exception("Job %s failed", job_id)
+                emit({"type": "error", "message": str(e)})
+            finally:
+                with self.lock:
+                    self.jobs.pop(job_id, None)
+
+        with self.lock:
+            if job_id in self.jobs:
+                raise ValueError(f"Job {job_id} is already running")
+            thread = threading.Thread(target=run, name=job_id, daemon=True)
+            self.jobs[job_id] = (thread, cancelled)
+        thread.start()
+        return {"job_id": job_id}
+
+    def rpc_scrape(self, params):
+        resume = params.get("resume")
+        args = argparse.Namespace(**vars(self.defaults))
+        args.input = params.get("input")
+        if args.input == "-":
+            # stdin carries this worker's requests
+            raise ValueError("input must be a file")
+        if resume:
+            keywords = []
+        elif args.input:
+            keywords = inputs.open_items(args.input)
+        else:
+            keywords = params["keywords"]
+            if isinstance(keywords, str):
+                keywords = keywords.split(',')
+        for option in JOB_OPTIONS:
+            if option in params:
+                setattr(args, option, params[option])
+        journal = None
+        if resume or params.get("journal"):
+            journal, keywords = scraper_wrapper.open_job_journal(args, keywords, resume)
+        if journal is not None and journal.header.get("input") == "-" and not args.input:
+            journal.close()
+            raise ValueError("A job read from stdin needs an input file to resume")
+        if args.platform not in scraper_wrapper.PLATFORM_HOSTS or args.type not in ('rank', 'product'):
+            if journal is not None:
+                journal.close()
+            raise ValueError("platform and type are required")
+
+        def run(emit, cancelled):
+            if journal is not None:
+                emit(scraper_wrapper.job_event(journal))
+            run_metrics = metrics.Metrics()
+            try:
+                all_results = scraper_wrapper.run_job(args, keywords, emit, cancelled, run_metrics, journal)
+            except BaseException:
+                if journal is not None:
+                    journal.close()
+                raise
+            kept = scraper_wrapper.close_job_journal(journal, all_results, cancelled)
+            emit(scraper_wrapper.stats_event())
+            emit(scraper_wrapper.run_metrics_event(run_metrics, args))
+            emit(scraper_wrapper.complete_event(len(all_results), cancelled.is_set(),
+                                                **scraper_wrapper.job_refs(kept, args)))
+
+        return self.start_job(params, run)
+
+    def rpc_export(self, params):
+        input_path = params.get("input")
+        results = params.get("results")
+        output = params["output"]
+        platform = params["platform"]
+        if input_path is None and results is None:
+            raise ValueError("export needs either input (an NDJSON file) or results")
+
+        def run(emit, cancelled):
+            import export_utils
+            with metrics.collect() as collected:
+                if input_path is not None:
+                    export_utils.export_ndjson(input_path, output, platform)
+                else:
+                    export_utils.export_results(results, output, platform)
+            emit(scraper_wrapper.metrics_event(collected, "run"))
+            emit(scraper_wrapper.complete_event(collected.counters.get("rows_exported", 0), output=output))
+
+        return self.start_job(params, run)
+
+    def rpc_cancel(self, params):
+        with self.lock:
+            job = self.jobs.get(str(params["job_id"]))
+        if job is None:
+            return {"cancelled": False}
+        job[1].set()
+        return {"cancelled": True}
+
+    def rpc_ping(self, params):
+        return {"pong": True}
+
+    def rpc_shutdown(self, params):
+        self.running = False
+        with self.lock:
+            return {"stopping": len(self.jobs)}
+
+    def serve(self, stream):
+        while self.running:
+            line = stream.readline()
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                self.reply(None, error={"code": PARSE_ERROR, "message": str(e)})
+                continue
+            self.handle(request)
+
+        # stdin closed or shutdown requested: stop every job at its next
+        # checkpoint and wait for them before exiting
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for thread, cancelled in jobs:
+            cancelled.set()
+            thread.join()
+
+def serve(args, stream=None):
+    Worker(args).serve(stream or sys.stdin)